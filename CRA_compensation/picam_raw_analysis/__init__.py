@@ -19,6 +19,13 @@ table, in YAML format.  To run this, use:
 
     python -m picam_raw_analysis.lst_from_raw_white_image path/to/white/image.jpg --output lens_shading.yaml
 
+That table is an open-loop estimate.  To refine it by repeatedly capturing processed
+white images on the camera (or on a simulated camera, with ``--simulate``), use:
+
+.. code-block:: bash
+
+    python -m picam_raw_analysis.lst_closed_loop --white_image path/to/white/image.jpg --output lens_shading.yaml
+
 There is also a script to completely compensate an image, using the raw data in that image
 together with red, green, blue, and white calibration images.  This can be run with:
 
@@ -26,6 +33,13 @@ together with red, green, blue, and white calibration images.  This can be run w
 
     python -m picam_raw_analysis.unmix_image path/to/calibration/folder image.jpg
 
+To check how well a calibration corrects the calibration images themselves (residual
+colour error, flatness and matrix condition numbers), run:
+
+.. code-block:: bash
+
+    python -m picam_raw_analysis.calibration_report path/to/calibration/folder
+
 Most of the functionality lives in submodules, but ``load_raw_image`` and ``extract_file``
 are available at the top level as well as in the ``extract_raw_image`` submodule.
 
@@ -0,0 +1,211 @@
+"""
+Check the quality of a colour calibration, by applying it to the calibration images.
+
+After ``unmixing_matrix`` has calculated a calibration, this script applies it to the
+red, green, blue and white calibration images (and any ``additional_image_*.jpg`` files in
+the same folder), working at the binned resolution of the calibration so it only takes a
+few seconds.  It reports:
+
+    Residual colour error:
+        The distance between each corrected calibration image and the colour it should
+        have been corrected to, for each cell of the calibration grid.  This is zero by
+        construction for R, G and B unless smoothing is used; for the white image it
+        measures how far the R, G and B responses are from adding up to white.
+
+    White flatness:
+        How far the brightness of the corrected white image deviates from its mean.
+
+    Condition number:
+        The condition number of the unmixing matrix in each cell.  Large values mean
+        noise in the image will be strongly amplified.
+
+    Additional images:
+        The mean corrected colour, and the RMS spatial variation of each channel.
+
+A summary table is printed (and saved as ``calibration_report.txt``) and the spatial
+distribution of each metric is saved as a heatmap, ``calibration_report.png``.  It can
+be run from the command line:
+
+.. code-block:: bash
+
+    python -m picam_raw_analysis.calibration_report path/to/calibration/folder
+
+If ``--max_residual`` is given, the script exits with a non-zero status when the 95th
+percentile colour error of any calibration image exceeds it, so it can be used to check
+a calibration automatically before an experiment.
+
+Use the ``--help`` flag to obtain a usage message.
+
+Released under GNU GPL v3
+
+"""
+from __future__ import print_function, division
+
+import numpy as np
+import argparse
+import os
+import sys
+import cv2
+from . import unmixing_matrix
+from .capture_manifest import load_manifest, select
+
+def apply_calibration(image, unmixing_matrices, white_image):
+    """Correct a binned image for vignetting and colour crosstalk.
+
+    Returns the corrected image, normalised so that the white image would
+    become 1.0 in each channel (rather than 1023 as in ``unmix_image``).
+    """
+    normalised = image / white_image
+    return np.matmul(unmixing_matrices, normalised[:, :, :, np.newaxis])[:, :, :, 0]
+
+def colour_targets(cal, colour_target="centre", target_response=None):
+    """The colour each of the R, G, B and W images should be corrected to.
+
+    These match the normalisation used by ``colour_unmixing_matrices``.  If the
+    calibration stored its ``target_response``, that is used directly.
+    """
+    if target_response is None:
+        central_response = unmixing_matrix.central_colour(unmixing_matrix.crosstalk_matrices(cal)).T
+        target_response = unmixing_matrix.target_response_matrix(colour_target, central_response)
+    targets = {k: target_response[i] for i, k in enumerate(['R', 'G', 'B'])}
+    targets['W'] = targets['R'] + targets['G'] + targets['B']
+    return targets
+
+def relative_deviation(image):
+    """Deviation of each pixel's brightness from the mean, as a fraction of the mean"""
+    brightness = np.mean(image, axis=2)
+    return brightness / np.mean(brightness) - 1
+
+def percentiles(values):
+    """Mean, 95th percentile and maximum of an array, ignoring NaNs"""
+    values = np.asarray(values).ravel()
+    return np.nanmean(values), np.nanpercentile(values, 95), np.nanmax(values)
+
+def calibration_metrics(cal, calibration, colour_target="centre", additional_images=None):
+    """Calculate the quality metrics for a calibration.
+
+    cal: dict
+        The binned R, G, B and W calibration images, as returned by
+        ``unmixing_matrix.load_run``.
+    calibration: dict
+        The calibration, as returned by ``unmixing_matrix.calculate_calibration``.
+    colour_target: string
+        The colour target used to calculate the calibration.
+    additional_images: dict
+        Any other binned images to correct, keyed by name.
+
+    Returns two dictionaries.  The first contains a table of summary statistics,
+    the second the spatial distribution of each metric, both keyed by name.
+    """
+    unmixing_matrices = calibration['unmixing_matrices']
+    white_image = calibration['white_image']
+    if unmixing_matrices.shape[:2] != cal['W'].shape[:2]:
+        raise ValueError("The calibration has shape {}, but the binned images have shape {}".format(
+            unmixing_matrices.shape[:2], cal['W'].shape[:2]))
+    if additional_images is None:
+        additional_images = {}
+    targets = colour_targets(cal, colour_target, calibration.get('target_response'))
+    summary = {}
+    maps = {}
+    for k in ['R', 'G', 'B', 'W']:
+        corrected = apply_calibration(cal[k], unmixing_matrices, white_image)
+        error = np.sqrt(np.sum((corrected - targets[k][np.newaxis, np.newaxis, :])**2, axis=2))
+        summary["colour error " + k] = percentiles(error)
+        maps["colour error " + k] = error
+        if k == 'W':
+            flatness = np.abs(relative_deviation(corrected))
+            summary["white flatness"] = percentiles(flatness)
+            maps["white flatness"] = flatness
+    condition = np.linalg.cond(unmixing_matrices)
+    summary["condition number"] = percentiles(condition)
+    maps["condition number"] = condition
+    for name, image in sorted(additional_images.items()):
+        corrected = apply_calibration(image, unmixing_matrices, white_image)
+        mean_colour = np.mean(corrected, axis=(0, 1))
+        variation = np.std(corrected, axis=(0, 1)) / np.abs(mean_colour)
+        summary["colour of " + name] = tuple(mean_colour)
+        summary["variation of " + name] = tuple(variation)
+    return summary, maps
+
+def format_summary(summary):
+    """Format the summary statistics as a compact table"""
+    row = "{:<32}" + "{:>10.4f}" * 3
+    additional = sorted(n for n in summary if n.startswith(("colour of", "variation of")))
+    lines = ["{:<32}{:>10}{:>10}{:>10}".format("", "mean", "95%", "max")]
+    lines += [row.format(name, *summary[name]) for name in sorted(set(summary) - set(additional))]
+    if additional:
+        lines.append("{:<32}{:>10}{:>10}{:>10}".format("", "R", "G", "B"))
+        lines += [row.format(name, *summary[name]) for name in additional]
+    return "\n".join(lines)
+
+def save_heatmaps(maps, filename, columns=3):
+    """Save the spatial distribution of each metric as a grid of false-colour images.
+
+    Each map is scaled from zero to its own maximum, which is printed underneath.
+    """
+    names = sorted(maps.keys())
+    h, w = maps[names[0]].shape
+    label_height = 16
+    rows = int(np.ceil(len(names) / columns))
+    canvas = np.full((rows * (h + label_height), columns * w, 3), 255, dtype=np.uint8)
+    for i, name in enumerate(names):
+        values = np.nan_to_num(maps[name])
+        scale = np.max(values) if np.max(values) > 0 else 1
+        panel = cv2.applyColorMap((values / scale * 255).astype(np.uint8), cv2.COLORMAP_VIRIDIS)
+        y, x = (i // columns) * (h + label_height), (i % columns) * w
+        canvas[y:y + h, x:x + w, :] = panel
+        cv2.putText(canvas, "{} (max {:.3g})".format(name, scale), (x + 2, y + h + label_height - 4),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.35, (0, 0, 0), 1)
+    cv2.imwrite(filename, canvas)
+
+def main():
+    """Report on the quality of a colour calibration"""
+    parser = argparse.ArgumentParser(description="Apply a colour calibration to the calibration "
+                                     "images, and report how well it corrects them.")
+    unmixing_matrix.add_unmixing_args(parser)
+    parser.add_argument("--image_folder", help="Folder containing the calibration images.  This "
+                        "defaults to the calibration folder, and must be given if the "
+                        "calibration is a YAML file.")
+    parser.add_argument("--output", help="Filename (without extension) for the summary table "
+                        "and heatmap.  Defaults to calibration_report in the image folder.")
+    parser.add_argument("--max_residual", type=float, help="Exit with an error if the 95th "
+                        "percentile colour error of any calibration image exceeds this.")
+    args = parser.parse_args()
+
+    folder = args.image_folder
+    if folder is None:
+        if args.calibration.endswith(".yaml"):
+            parser.error("--image_folder is required if the calibration is a YAML file")
+        folder = args.calibration
+    output = args.output or os.path.join(folder, "calibration_report")
+
+    cal = unmixing_matrix.load_run(folder, unmixing_matrix.ILLUMINATIONS)
+    manifest = os.path.join(folder, "manifest.jsonl")
+    if os.path.exists(manifest):
+        additional_images = {r["name"]: unmixing_matrix.load_raw_image_and_bin(r["path"])
+                             for r in select(load_manifest(manifest), kind="additional")}
+    else: # Older data sets have no manifest
+        additional_images = {f[len("additional_image_"):-len(".jpg")]:
+                                 unmixing_matrix.load_raw_image_and_bin(os.path.join(folder, f))
+                             for f in os.listdir(folder)
+                             if f.startswith("additional_image_") and f.endswith(".jpg")}
+    calibration = unmixing_matrix.calculate_calibration(args)
+
+    summary, maps = calibration_metrics(cal, calibration, calibration.get("colour_target", "centre"),
+                                        additional_images)
+    table = format_summary(summary)
+    print(table)
+    with open(output + ".txt", "w") as outfile:
+        outfile.write(table + "\n")
+    save_heatmaps(maps, output + ".png")
+    print("Saved report to {}.txt and {}.png".format(output, output))
+
+    if args.max_residual is not None:
+        worst = max(summary["colour error " + k][1] for k in ['R', 'G', 'B', 'W'])
+        if worst > args.max_residual:
+            print("Calibration failed: 95th percentile colour error {:.4f} exceeds {}".format(
+                worst, args.max_residual))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
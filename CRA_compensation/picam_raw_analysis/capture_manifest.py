@@ -0,0 +1,72 @@
+"""
+Read the capture manifest written by ``image_acquisition/measure_colour_response.py``.
+
+The manifest (``manifest.jsonl``) is a JSON Lines file with one record per
+capture, appended as each image is taken.  Each record has the image's
+``path`` (relative to the manifest), its ``size``, its ``kind`` (e.g.
+"calibration", "additional" or "timed"), the ``wall_time`` it was taken and,
+for timed captures, its ``index``, ``nominal_time`` and ``actual_time``, as well
+as the ``camera`` settings and ``led`` colour.
+
+Records can be selected by ranges of any numeric field, e.g. to process only
+the images from the first ten minutes:
+
+.. code-block:: python
+
+    records = load_manifest("data/manifest.jsonl")
+    paths = image_paths(select(records, kind="timed", actual_time=(0, 600)))
+
+Older data sets have a ``file_names.txt`` instead, which :func:`load_manifest`
+can also read (though it only contains the paths).
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+
+import json
+import os
+
+def load_manifest(filename):
+    """Load the records from a manifest, with paths made relative to the working directory.
+
+    A truncated last line (e.g. if acquisition was interrupted) is ignored.
+    ``file_names.txt`` files are converted to records with just a path.
+    """
+    folder = os.path.dirname(filename)
+    records = []
+    with open(filename, "r") as infile:
+        lines = [line.strip() for line in infile if line.strip()]
+    for i, line in enumerate(lines):
+        if not filename.endswith(".jsonl"):
+            records.append({"path": line})
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            if i == len(lines) - 1:
+                print("Ignoring an incomplete last record in {}".format(filename))
+            else:
+                raise
+    for record in records:
+        record["path"] = os.path.join(folder, record["path"])
+    return records
+
+def select(records, **criteria):
+    """Select the records that match all of the criteria.
+
+    Each keyword is a field of the records.  A ``(minimum, maximum)`` tuple
+    selects values in that range (inclusive; either may be ``None``), and any
+    other value must match exactly.  Records without the field are excluded.
+    """
+    def matches(record, key, criterion):
+        if key not in record:
+            return False
+        if isinstance(criterion, tuple):
+            low, high = criterion
+            return (low is None or record[key] >= low) and (high is None or record[key] <= high)
+        return record[key] == criterion
+    return [r for r in records if all(matches(r, k, c) for k, c in criteria.items())]
+
+def image_paths(records):
+    """The paths of the images in a list of records"""
+    return [r["path"] for r in records]
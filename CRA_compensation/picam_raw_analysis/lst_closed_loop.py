@@ -0,0 +1,337 @@
+"""
+Iteratively refine a lens shading table by measuring processed white images.
+
+``lst_from_raw_white_image`` makes a single, open-loop estimate of the lens
+shading table from the raw data.  The camera's image pipeline does not always
+do exactly what we expect with that table, so this module closes the loop:
+the table is uploaded, a processed (i.e. shading-corrected) white image is
+captured, the residual non-uniformity is measured on a grid matching the lens
+shading table, and the gains are updated.  This repeats until the processed
+image is flat, which normally takes a handful of captures.
+
+Camera access goes through a small interface, :class:`WhiteImageCamera`.
+:class:`PiCameraWhiteImage` wraps a real ``picamera.PiCamera`` (which is only
+imported when it's used), and :class:`SimulatedWhiteImageCamera` is a software
+stand-in that applies a synthetic vignette and the lens shading gains, so the
+loop can be developed and benchmarked without a Raspberry Pi.
+
+It can be run from the command line:
+
+.. code-block:: bash
+
+    python -m picam_raw_analysis.lst_closed_loop --output lens_shading.yaml
+
+or, with no camera attached:
+
+.. code-block:: bash
+
+    python -m picam_raw_analysis.lst_closed_loop --simulate
+
+Use the ``--help`` flag to obtain a usage message.
+
+Released under GNU GPL v3
+
+"""
+from __future__ import print_function, division
+
+import numpy as np
+import time
+import os
+import argparse
+import yaml
+
+# Lens shading tables (as generated by lst_from_channels for the v2 module)
+# have four channels, in the order R, Gr, Gb, B.  This maps each of them onto
+# the corresponding colour channel of a processed RGB image.
+LST_CHANNEL_COLOURS = (0, 1, 1, 2)
+UNITY_GAIN = 32 # The lens shading table uses 32 to mean a gain of 1
+MAX_GAIN = 255
+
+def lst_shape_for_resolution(resolution):
+    """The shape of the lens shading table for a (width, height) resolution.
+
+    There is one point per 64x64 block of pixels, rounded **up**.
+    """
+    width, height = resolution
+    return (4, height // 64 + 1, width // 64 + 1)
+
+def _cell_starts(n_pixels, sensor_size, n_cells):
+    """Index of the first image pixel that falls in each 64-pixel sensor block"""
+    sensor_position = (np.arange(n_pixels) + 0.5) * sensor_size / n_pixels
+    cell = (sensor_position // 64).astype(int)
+    return np.clip(np.searchsorted(cell, np.arange(n_cells)), 0, n_pixels - 1)
+
+def mean_in_lst_cells(image, table_shape, full_resolution):
+    """Average a processed image over the blocks of a lens shading table.
+
+    image: numpy.ndarray
+        An NxMx3 image, which may be downsampled (e.g. captured with ``resize``)
+        but must cover the whole sensor.
+    table_shape: tuple
+        The shape of the lens shading table, (4, rows, columns).
+    full_resolution: tuple
+        The (width, height) of the sensor, used to work out which pixels of
+        the (possibly downsampled) image belong to each 64x64 block.
+
+    Returns an array of shape (rows, columns, 3).  Blocks that contain no
+    pixels (if the image is very small) take the value of the nearest pixel.
+    """
+    image = np.asarray(image, dtype=float)
+    rows, cols = table_shape[1:]
+    width, height = full_resolution
+    row_starts = _cell_starts(image.shape[0], height, rows)
+    col_starts = _cell_starts(image.shape[1], width, cols)
+    row_counts = np.diff(np.append(row_starts, image.shape[0]))
+    col_counts = np.diff(np.append(col_starts, image.shape[1]))
+    sums = np.add.reduceat(np.add.reduceat(image, row_starts, axis=0), col_starts, axis=1)
+    counts = np.maximum(row_counts, 1)[:, np.newaxis] * np.maximum(col_counts, 1)[np.newaxis, :]
+    return sums / counts[:, :, np.newaxis]
+
+def flatness(cell_means):
+    """Measure how far each colour channel of a gridded white image is from flat.
+
+    Returns a dictionary with the RMS and peak-to-peak deviation from the mean,
+    as a fraction of the mean, for each colour channel.
+    """
+    relative = cell_means / np.mean(cell_means, axis=(0, 1))[np.newaxis, np.newaxis, :]
+    return {"rms": np.sqrt(np.mean((relative - 1)**2, axis=(0, 1))),
+            "peak_to_peak": np.max(relative, axis=(0, 1)) - np.min(relative, axis=(0, 1))}
+
+def gains_to_table(gains):
+    """Convert floating-point gains (1.0 is unity) to a uint8 lens shading table"""
+    table = np.round(gains * UNITY_GAIN)
+    table = np.clip(table, UNITY_GAIN, MAX_GAIN)
+    return np.ascontiguousarray(table.astype(np.uint8))
+
+def update_gains(gains, cell_means, gamma=2.2, step=1.0):
+    """Update lens shading gains to flatten a processed white image.
+
+    gains: numpy.ndarray
+        The current gains, shape (4, rows, columns), where 1.0 is unity.
+    cell_means: numpy.ndarray
+        The processed white image, averaged over each lens shading block, as
+        returned by :func:`mean_in_lst_cells`.
+    gamma: float
+        Processed images are gamma-encoded, so a brightness ratio of ``r`` in
+        the processed image corresponds to ``r**gamma`` in the raw data.
+    step: float
+        Relaxation factor - 1.0 applies the full correction each iteration,
+        smaller values converge more slowly but are more robust to noise.
+
+    The updated gains are normalised so the smallest gain in each channel is
+    unity, as in ``lst_from_channels``.
+    """
+    colours = cell_means[:, :, LST_CHANNEL_COLOURS].transpose(2, 0, 1)
+    targets = np.mean(colours, axis=(1, 2))[:, np.newaxis, np.newaxis]
+    correction = (targets / np.maximum(colours, 1e-6))**(gamma * step)
+    new_gains = gains * correction
+    new_gains /= np.min(new_gains, axis=(1, 2))[:, np.newaxis, np.newaxis]
+    return np.minimum(new_gains, MAX_GAIN / UNITY_GAIN)
+
+def refine_lens_shading_table(camera, initial_table=None, max_iterations=8,
+                              tolerance=0.01, gamma=2.2, step=1.0):
+    """Iteratively adjust a lens shading table until processed white images are flat.
+
+    camera: WhiteImageCamera
+        The camera to calibrate (real or simulated).
+    initial_table: numpy.ndarray or None
+        A starting lens shading table, e.g. from ``lst_from_channels``.  If
+        this is None, we start from a flat (unity gain) table.
+    max_iterations: int
+        The maximum number of captures to make (at least 1).
+    tolerance: float
+        Stop when the RMS deviation from flat (as a fraction of the mean) is
+        below this in every colour channel.
+    gamma, step:
+        Passed to :func:`update_gains`.
+
+    Returns the final lens shading table and a list of dictionaries, one per
+    capture, recording how flat the image was and how long it took.
+    """
+    if max_iterations < 1:
+        raise ValueError("At least one iteration is needed to measure the lens shading")
+    shape = camera.lens_shading_table_shape()
+    if initial_table is None:
+        gains = np.ones(shape)
+    else:
+        if initial_table.shape != shape:
+            raise ValueError("The initial lens shading table should have shape {}".format(shape))
+        gains = initial_table.astype(float) / UNITY_GAIN
+    history = []
+    best = None
+    for i in range(max_iterations):
+        start = time.time()
+        table = gains_to_table(gains)
+        camera.set_lens_shading_table(table)
+        cell_means = mean_in_lst_cells(camera.capture_white_image(), shape, camera.full_resolution)
+        residual = flatness(cell_means)
+        history.append({"iteration": i,
+                        "rms": residual["rms"],
+                        "peak_to_peak": residual["peak_to_peak"],
+                        "time": time.time() - start})
+        print("Iteration {}: RMS deviation from flat {} (took {:.2f}s)".format(
+            i, np.array2string(residual["rms"], precision=4), history[-1]["time"]))
+        if best is None or np.max(residual["rms"]) < best[0]:
+            best = (np.max(residual["rms"]), table)
+        if np.max(residual["rms"]) < tolerance:
+            break
+        if len(history) > 1 and np.max(residual["rms"]) > 0.9 * np.max(history[-2]["rms"]):
+            print("Flatness is no longer improving, stopping.")
+            break
+        gains = update_gains(gains, cell_means, gamma=gamma, step=step)
+    return best[1], history
+
+
+class WhiteImageCamera(object):
+    """The interface used by :func:`refine_lens_shading_table` to talk to a camera.
+
+    Subclasses should override the methods below, and set ``full_resolution``
+    to the (width, height) of the sensor.
+    """
+    full_resolution = (3280, 2464)
+
+    def lens_shading_table_shape(self):
+        """The shape of the lens shading table this camera expects"""
+        return lst_shape_for_resolution(self.full_resolution)
+
+    def set_lens_shading_table(self, table):
+        """Upload a lens shading table to the camera"""
+        raise NotImplementedError
+
+    def capture_white_image(self):
+        """Capture a processed image of a uniform white field, as an NxMx3 array"""
+        raise NotImplementedError
+
+
+class PiCameraWhiteImage(WhiteImageCamera):
+    """Refine lens shading using a real ``picamera.PiCamera``.
+
+    The camera should be illuminated uniformly, with exposure settings that
+    don't saturate.  Processed images are captured from the video port at
+    ``resize`` to keep each iteration fast.
+    """
+    def __init__(self, camera, resize=(656, 496), settle_time=1.0):
+        self.camera = camera
+        self.resize = resize
+        self.settle_time = settle_time
+        self.full_resolution = tuple(camera.MAX_RESOLUTION)
+
+    def lens_shading_table_shape(self):
+        return self.camera._lens_shading_table_shape()
+
+    def set_lens_shading_table(self, table):
+        self.camera.lens_shading_table = table
+        time.sleep(self.settle_time)
+
+    def capture_white_image(self):
+        from picamera.array import PiRGBArray
+        with PiRGBArray(self.camera, size=self.resize) as output:
+            self.camera.capture(output, format='rgb', resize=self.resize, use_video_port=True)
+            return output.array
+
+
+class SimulatedWhiteImageCamera(WhiteImageCamera):
+    """A software stand-in for a camera looking at a uniform white field.
+
+    The "raw" image has a radial vignette, which is different in each colour
+    channel.  The lens shading gains are interpolated bilinearly between the
+    centres of the 64x64 blocks, applied, and then the image is clipped,
+    gamma-encoded and scaled to 0-255 like a processed image from the camera.
+
+    vignetting: tuple
+        The fractional drop in brightness at the corners, for R, G and B.
+    exposure: float
+        Brightness at the centre of the image with unity gain, as a fraction of
+        full scale.
+    noise: float
+        Standard deviation of Gaussian noise added to the processed image.
+    capture_time: float
+        Time (in seconds) to wait in each capture, to mimic a real camera.
+    """
+    def __init__(self, full_resolution=(3280, 2464), output_size=(328, 246),
+                 vignetting=(0.55, 0.45, 0.6), exposure=0.4, gamma=2.2,
+                 noise=0.5, capture_time=0.0, seed=None):
+        self.full_resolution = tuple(full_resolution)
+        self.output_size = tuple(output_size)
+        self.exposure = exposure
+        self.gamma = gamma
+        self.noise = noise
+        self.capture_time = capture_time
+        self._random = np.random.RandomState(seed)
+        width, height = self.full_resolution
+        out_w, out_h = self.output_size
+        self._y = (np.arange(out_h) + 0.5) * height / out_h # sensor coordinates
+        self._x = (np.arange(out_w) + 0.5) * width / out_w # of each output pixel
+        r2 = (((self._y[:, np.newaxis] - height / 2) / (height / 2))**2
+              + ((self._x[np.newaxis, :] - width / 2) / (width / 2))**2) / 2
+        self.vignette = 1 - r2[:, :, np.newaxis] * np.array(vignetting)[np.newaxis, np.newaxis, :]
+        self.set_lens_shading_table(np.full(self.lens_shading_table_shape(), UNITY_GAIN, dtype=np.uint8))
+
+    def _interpolated_gains(self):
+        """Bilinearly interpolate the lens shading gains onto the output pixels"""
+        gains = self.lens_shading_table.astype(float) / UNITY_GAIN
+        for axis, coords in ((1, self._y), (2, self._x)):
+            position = np.clip((coords - 32) / 64, 0, gains.shape[axis] - 1)
+            i = np.minimum(position.astype(int), gains.shape[axis] - 2)
+            f = position - i
+            shape = [1, 1, 1]
+            shape[axis] = -1
+            gains = (np.take(gains, i, axis=axis) * (1 - f).reshape(shape)
+                     + np.take(gains, i + 1, axis=axis) * f.reshape(shape))
+        # The two green channels average together in the processed image
+        return np.stack([gains[0], (gains[1] + gains[2]) / 2, gains[3]], axis=2)
+
+    def set_lens_shading_table(self, table):
+        self.lens_shading_table = table
+        self._gains = self._interpolated_gains()
+
+    def capture_white_image(self):
+        time.sleep(self.capture_time)
+        linear = np.clip(self.exposure * self.vignette * self._gains, 0, 1)
+        image = 255 * linear**(1 / self.gamma)
+        if self.noise > 0:
+            image += self._random.normal(scale=self.noise, size=image.shape)
+        return np.clip(image, 0, 255)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refine a lens shading table in a closed loop, using processed white images")
+    parser.add_argument("--white_image", default=None, help="A raw white image used to make the initial estimate of the lens shading table (default is to start from a flat table).")
+    parser.add_argument("--output", default="microscope_settings_with_lst.yaml", help="Output filename for microscope settings file to save the lens shading table into.  Will be overwritten if it exists.")
+    parser.add_argument("--settings_file", default=None, help="Optionally supply a settings file into which the lens shading table will be inserted.  Other settings are not changed.")
+    parser.add_argument("--max_iterations", type=int, default=8, help="Maximum number of images to capture.")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Stop when the RMS deviation from flat is below this fraction.")
+    parser.add_argument("--simulate", action="store_true", help="Use a simulated camera rather than a Raspberry Pi camera.")
+    args = parser.parse_args()
+
+    if args.settings_file is not None:
+        with open(args.settings_file, "r") as infile:
+            camera_settings = yaml.load(infile, Loader=yaml.UnsafeLoader)
+    else:
+        camera_settings = {}
+
+    initial_table = None
+    if args.white_image is not None:
+        from .extract_raw_image import load_raw_image
+        from .lst_from_raw_white_image import channels_from_bayer_array, lst_from_channels
+        assert os.path.isfile(args.white_image)
+        channels = channels_from_bayer_array(load_raw_image(args.white_image).array)
+        initial_table = lst_from_channels(channels)
+
+    start = time.time()
+    if args.simulate:
+        lens_shading_table, history = refine_lens_shading_table(
+            SimulatedWhiteImageCamera(seed=0), initial_table,
+            max_iterations=args.max_iterations, tolerance=args.tolerance)
+    else:
+        from picamera import PiCamera
+        with PiCamera(lens_shading_table=initial_table) as camera:
+            time.sleep(2) # let the auto-exposure settle
+            lens_shading_table, history = refine_lens_shading_table(
+                PiCameraWhiteImage(camera), initial_table,
+                max_iterations=args.max_iterations, tolerance=args.tolerance)
+    print("Made {} captures in {:.1f}s".format(len(history), time.time() - start))
+
+    camera_settings['lens_shading_table'] = lens_shading_table
+    with open(args.output, "w") as outfile:
+        yaml.dump(camera_settings, outfile)
@@ -11,6 +11,11 @@ It can be run from the command line:
 
     python -m picam_raw_analysis.lst_from_raw_white_image path/to/white/image.jpg --output lens_shading.yaml
 
+The white image must be taken at full resolution.  With ``--all_sensor_modes``, a table is
+generated for every sensor mode (cropping and binning the white image to match the mode),
+and they are saved as a dictionary keyed by sensor mode.  This can be passed directly to
+``PiCamera(lens_shading_table=...)``, which picks the right table for its sensor mode.
+
 Use the ``--help`` flag to obtain a usage message.
 
 Copyright 2019 Richard Bowman, released under GNU GPL v3
@@ -35,6 +40,47 @@ def channels_from_bayer_array(bayer_array):
 
     return channels
 
+# For each sensor mode of the v2 camera module: the output resolution, the
+# binning factor, and the (x, y) offset of the region read out from the full
+# sensor.  This matches PiCamera.SENSOR_MODES['IMX219'], with mode 0
+# (automatic) treated as full resolution.
+SENSOR_MODES = {
+    0: ((3280, 2464), 1, (0, 0)),
+    1: ((1920, 1080), 1, (680, 692)),
+    2: ((3280, 2464), 1, (0, 0)),
+    3: ((3280, 2464), 1, (0, 0)),
+    4: ((1640, 1232), 2, (0, 0)),
+    5: ((1640, 922), 2, (0, 310)),
+    6: ((1280, 720), 2, (360, 512)),
+    7: ((640, 480), 2, (1000, 752)),
+}
+
+def channels_for_sensor_mode(channels, sensor_mode):
+    """Crop and bin full-resolution Bayer channels to match a sensor mode.
+
+    channels should be the 4 channels from a full-resolution white image, as
+    returned by channels_from_bayer_array.  The result has the shape of the
+    channels we would get from a white image taken in ``sensor_mode``.
+    """
+    (width, height), binning, (x, y) = SENSOR_MODES[sensor_mode]
+    # Each channel is half the size of the image, because of the Bayer pattern
+    cropped = channels[:, y//2:y//2 + height*binning//2, x//2:x//2 + width*binning//2]
+    if cropped.shape[1:] != (height*binning//2, width*binning//2):
+        raise ValueError("Sensor mode {} needs a full-resolution white image".format(sensor_mode))
+    if binning == 1:
+        return cropped
+    return cropped.reshape((4, height//2, binning, width//2, binning)).mean(axis=4).mean(axis=2)
+
+def lsts_for_sensor_modes(channels, sensor_modes=None):
+    """Generate a lens shading table for each sensor mode from one white image.
+
+    Returns a dictionary of lens shading tables, keyed by sensor mode.
+    """
+    if sensor_modes is None:
+        sensor_modes = sorted(SENSOR_MODES.keys())
+    return {mode: lst_from_channels(channels_for_sensor_mode(channels, mode))
+            for mode in sensor_modes}
+
 def lst_from_channels(channels):
     """Given the 4 Bayer colour channels from a white image, generate a LST."""
     full_resolution = np.array(channels.shape[1:]) * 2 # channels have been binned
@@ -42,7 +88,7 @@ def lst_from_channels(channels):
     lst_resolution = [(r // 64) + 1 for r in full_resolution]
     # NB the size of the LST is 1/64th of the image, but rounded UP.
     print("Generating a lens shading table at {}x{}".format(*lst_resolution))
-    lens_shading = np.zeros([channels.shape[0]] + lst_resolution, dtype=np.float)
+    lens_shading = np.zeros([channels.shape[0]] + lst_resolution, dtype=float)
     for i in range(lens_shading.shape[0]):
         image_channel = channels[i, :, :]
         iw, ih = image_channel.shape
@@ -92,6 +138,7 @@ if __name__ == "__main__":
     parser.add_argument("white_image")
     parser.add_argument("--output", default="microscope_settings_with_lst.yaml", help="Output filename for microscope settings file to save the lens shading table into.  Will be overwritten if it exists.")
     parser.add_argument("--settings_file", default=None, help="Optionally supply a settings file into which the lens shading table will be inserted.  Other settings are not changed.")
+    parser.add_argument("--all_sensor_modes", action="store_true", help="Save a dictionary of lens shading tables, one for each sensor mode, rather than a single full-resolution table.")
     args = parser.parse_args()
 
     if args.settings_file is not None:
@@ -112,7 +159,10 @@ if __name__ == "__main__":
     # demosaicing has been done, so 2/3 of the values are zero (3/4 for R and B
     # channels, 1/2 for green because there's twize as many green pixels).
     channels = channels_from_bayer_array(raw_image) 
-    lens_shading_table = lst_from_channels(channels)
+    if args.all_sensor_modes:
+        lens_shading_table = lsts_for_sensor_modes(channels)
+    else:
+        lens_shading_table = lst_from_channels(channels)
     
     camera_settings['lens_shading_table'] = lens_shading_table
     with open(args.output, "w") as outfile:
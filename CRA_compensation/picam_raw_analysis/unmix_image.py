@@ -21,6 +21,7 @@ import scipy.interpolate
 import scipy.ndimage
 from . import unmixing_matrix
 from .extract_raw_image import load_raw_image
+from .capture_manifest import load_manifest, select, image_paths
 import argparse
 import cv2
 import os.path
@@ -54,11 +55,18 @@ import os.path
         
 #     ))
 
-def upsample_1d(arr, axis=0, zoom=16):
-    """Upsample one dimension of an array"""
+def upsample_1d(arr, axis=0, zoom=16, size=None):
+    """Upsample one dimension of an array
+
+    ``zoom`` need not be an integer.  By default the output is ``zoom`` times
+    bigger than the input; if ``size`` is specified the output has that many
+    elements, extrapolating at the edges if needed.
+    """
+    if size is None:
+        size = int(round(arr.shape[axis] * zoom))
     x = np.arange(arr.shape[axis])
     f = scipy.interpolate.interp1d(x, arr, axis=axis, kind="linear", fill_value="extrapolate")
-    new_x = np.arange(0, arr.shape[axis], 1/zoom) - (zoom - 1)/(zoom*2. )
+    new_x = (np.arange(size) + 0.5)/zoom - 0.5 # centre of each output pixel, in input pixels
     return f(new_x)
 
 
@@ -72,6 +80,43 @@ def upsample_xy(arr, zoom=16):
     return upsample_1d(upsample_1d(arr, axis=0, zoom=zoom), axis=1, zoom=zoom)
 
 
+def calibration_for_shape(pyramid, shape):
+    """Pick the level of a calibration pyramid best suited to an image, and resample it.
+
+    pyramid: list
+        Levels of the calibration, from finest to coarsest, as returned by
+        ``unmixing_matrix.calibration_pyramid``.
+    shape: tuple
+        The shape of the image to be corrected.  It may be any resolution (e.g.
+        from a binned sensor mode, ``PiFastBayerArray`` or a resized capture) as
+        long as it covers the whole sensor.
+
+    We use the finest level that is no finer than the image, so the calibration
+    is only ever interpolated up to the size of the image (never to full
+    resolution unless the image is full resolution).  If that level already
+    matches the image, it is returned with no interpolation.
+
+    Returns the unmixing matrices and white image, with the same height and
+    width as the image.
+    """
+    full_shape = np.array(pyramid[0]["unmixing_matrices"].shape[:2]) * pyramid[0]["downsampling"]
+    scale = full_shape / np.array(shape[:2]) # full-resolution pixels per image pixel
+    if abs(scale[0] - scale[1]) > 0.02 * scale[0]:
+        raise ValueError("An image of shape {} doesn't have the same aspect ratio as the "
+                         "calibration (which covers {}).".format(shape[:2], tuple(full_shape)))
+    zooms = [level["downsampling"] / scale for level in pyramid] # image pixels per element
+    candidates = [i for i, z in enumerate(zooms) if np.all(z > 0.98)] # allow for dropped edge pixels
+    i = min(candidates) if candidates else len(pyramid) - 1
+    level, zoom = pyramid[i], zooms[i]
+    if level["unmixing_matrices"].shape[:2] == tuple(shape[:2]):
+        return level["unmixing_matrices"], level["white_image"]
+    print("Using calibration binned to {0}x{0} pixels, zoomed by {1}".format(level["downsampling"], zoom))
+    def resample(arr):
+        return upsample_1d(upsample_1d(arr, axis=0, zoom=zoom[0], size=shape[0]),
+                           axis=1, zoom=zoom[1], size=shape[1])
+    return resample(level["unmixing_matrices"]), resample(level["white_image"])
+
+
 def correct_image(image, unmixing_matrix=None, norm_to_white=None):
     """Process an image to remove vignetting and saturation loss.
 
@@ -89,6 +134,24 @@ def correct_image(image, unmixing_matrix=None, norm_to_white=None):
         #check this function for possible r-g swap?
         return np.sum(unmixing_matrix * image[:,:,np.newaxis,:] * norm_to_white[:,:,np.newaxis,:], axis=-1)
 
+def images_from_manifest(filename, kind="timed", index_range=None, time_range=None):
+    """The paths of the images in a capture manifest that should be processed.
+
+    Only images of the given ``kind`` are included (so calibration and
+    additional images are skipped by default); use "all" to include every
+    image.  ``file_names.txt`` manifests don't record the kind, so all of their
+    images are included.  ``index_range`` and ``time_range`` are inclusive
+    ``(minimum, maximum)`` ranges of the capture index and actual time.
+    """
+    criteria = {}
+    if kind != "all" and filename.endswith(".jsonl"):
+        criteria["kind"] = kind
+    if index_range is not None:
+        criteria["index"] = tuple(index_range)
+    if time_range is not None:
+        criteria["actual_time"] = tuple(time_range)
+    return image_paths(select(load_manifest(filename), **criteria))
+
 def main():
     """Process images from the command line"""
     parser = argparse.ArgumentParser(description="Post-process Raspberry Pi camera module v2 images to remove vignetting and colour crosstalk.")
@@ -101,77 +164,51 @@ def main():
     parser.add_argument("--disable_vignetting", action="store_true", help="Disable the vignetting correction (probably a bad idea)")
     parser.add_argument("--sixteen_bit", action="store_true", help="Save the output image as a 16-bit TIFF (default is 8-bit)")
     parser.add_argument("--smooth_image", type=float, default=0, help="Smooth the images before processing (width of Gaussian in pixels, default is 0, no smoothing)")
-    parser.add_argument("image", nargs="+", help="Filenames of images to process, or a file called 'file_names.txt' with all image names listed line by line.")
+    parser.add_argument("--binning", type=int, default=1, help="Bin the images by this factor before processing, to produce smaller output images more quickly (default is 1, no binning)")
+    parser.add_argument("--kind", default="timed", help="With a manifest, only process images of this kind, e.g. 'calibration' or 'additional' (default is 'timed'; use 'all' to process every image).")
+    parser.add_argument("--index_range", nargs=2, type=int, help="With a manifest, only process timed images with indices in this range (inclusive).")
+    parser.add_argument("--time_range", nargs=2, type=float, help="With a manifest, only process timed images taken in this range of times (in seconds from the start of the series).")
+    parser.add_argument("image", nargs="+", help="Filenames of images to process, or a capture manifest ('manifest.jsonl', or an older 'file_names.txt') listing them.")
     args = parser.parse_args()
 
-    imageNames = [] #file names of images
-    if args.image[0] == "file_names.txt":  #if a batch file name file was provided, load in the individual names 
-        #read in file_names.txt and add each name to this list!
-        f = open(args.calibration + "file_names.txt", 'r') 
-        print('Images that will be processed:')
-        for line in f:
-            print(line.rstrip('\n'))
-            imageNames.append(line.rstrip('\n'))
-        f.close()
-
+    if args.image[0].endswith(".jsonl") or os.path.basename(args.image[0]) == "file_names.txt":
+        # Load the images from a manifest, relative to the manifest's folder
+        imageNames = images_from_manifest(args.image[0], args.kind, args.index_range, args.time_range)
+        print('{} images will be processed'.format(len(imageNames)))
     else:       #if individual image file name(s() were provided on the command line, store the provided names
         imageNames = args.image
 
-    image = load_raw_image(imageNames[0]).demosaic()
-    print("First image has shape {}".format(image.shape))
-
     # Load the calibration (this will be either from a YAML file, or calculated from images)
     cal = unmixing_matrix.calculate_calibration(args)
-    unmixing_matrices = cal['unmixing_matrices']
-    white_image = cal['white_image']
-    assert white_image.shape == unmixing_matrices.shape[:3], "White image and unmixing matrices have different sizes!"
-    assert unmixing_matrices.shape[2:4] == (3, 3), "Unmixing matrix must be NxMx3x3!"
-
-    # Check the sizes are compatible, and upsample the matrix if needed
-    ds = unmixing_matrix.DOWNSAMPLING
-    crop = (slice(None),) * 3
-    if unmixing_matrices.shape[:3] == image.shape:
-        pass # Everything's the right shape - do nothing
-    elif unmixing_matrices.shape[0] == image.shape[0]//ds:
-        assert unmixing_matrices.shape[1] == image.shape[1]//ds, "Downsampling looks different in X and Y!"
-        # Crop the image if it's slightly too big (probably a downsampling artefact)
-        if unmixing_matrices.shape[0]*ds < image.shape[0] or unmixing_matrices.shape[1]*ds < image.shape[1]:
-            print("Warning: some pixels were trimmed from the calibration; output images will be smaller than input.")
-            crop = (slice(0, unmixing_matrices.shape[0]*ds),
-                    slice(0, unmixing_matrices.shape[1]*ds),
-                    3, )
-        unmixing_matrices = upsample_xy(unmixing_matrices, ds)
-    else:
-        raise ValueError("The unmixing matrices were neither the right size, nor correctly downsampled.")
-    
+    pyramid = cal['pyramid']
+    assert cal['white_image'].shape == cal['unmixing_matrices'].shape[:3], "White image and unmixing matrices have different sizes!"
+    assert cal['unmixing_matrices'].shape[2:4] == (3, 3), "Unmixing matrix must be NxMx3x3!"
 
     # Override the normalisation image if specified
     if args.white_image is not None:
         white_image = unmixing_matrix.load_raw_image_and_bin(args.white_image)
-
-    # Make sure the white image matches the size of the unmixing matrices
-    if white_image.shape[0]//ds == unmixing_matrices.shape[0]//ds:
-        assert white_image.shape[1]//ds == unmixing_matrices.shape[1]//ds, "Downsampling of white image looks different in X and Y!"
-        white_image = white_image[crop] # Everything's the right shape (to within 16 pixels)
-    elif white_image.shape[0] == unmixing_matrices.shape[0]//ds:
-        assert white_image.shape[1] == unmixing_matrices.shape[1]//ds, "Downsampling of white image looks different in X and Y!"
-        white_image = upsample_xy(white_image, ds)
-    print("White image min: {} max: {}".format(white_image.min(), white_image.max()))
-    norm_to_white = 1023. / white_image # Do the normalisation for 10-bit data
-
-    # Disable normalisation or unmixing if required
-    if args.disable_unmixing: 
-        unmixing_matrices = None
-    if args.disable_vignetting:
-        norm_to_white = None
+        assert white_image.shape == cal['white_image'].shape, "The white image doesn't match the calibration!"
+        pyramid = unmixing_matrix.calibration_pyramid(cal['unmixing_matrices'], white_image, cal['downsampling'])
 
     ### Correction happens here! ###
+    corrections = {} # Calibrations resampled to each image size we've seen
     for fname in imageNames:
         print("Converting: {}".format(fname))
-        if fname == imageNames[0]:
-            pass
-        else:
-            image = load_raw_image(fname).demosaic()
+        image = load_raw_image(fname).demosaic()
+        if args.binning > 1:
+            image = unmixing_matrix.bin(image, args.binning)
+        if image.shape not in corrections:
+            print("Image has shape {}".format(image.shape))
+            unmixing_matrices, white_image = calibration_for_shape(pyramid, image.shape)
+            print("White image min: {} max: {}".format(white_image.min(), white_image.max()))
+            norm_to_white = 1023. / white_image # Do the normalisation for 10-bit data
+            # Disable normalisation or unmixing if required
+            if args.disable_unmixing: 
+                unmixing_matrices = None
+            if args.disable_vignetting:
+                norm_to_white = None
+            corrections[image.shape] = (unmixing_matrices, norm_to_white)
+        unmixing_matrices, norm_to_white = corrections[image.shape]
         if args.smooth_image > 0:
             image = scipy.ndimage.gaussian_filter(image, (args.smooth_image, args.smooth_image,0), order=0)
         corrected = correct_image(image.astype(float), unmixing_matrix=unmixing_matrices, norm_to_white=norm_to_white)
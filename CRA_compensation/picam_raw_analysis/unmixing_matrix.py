@@ -15,6 +15,11 @@ import yaml
 import argparse
 
 DOWNSAMPLING = 16
+# The calibration is also stored block-averaged by these factors, so that
+# small images can be corrected without upsampling the full-resolution grid
+PYRAMID_LEVELS = (1, 2, 4, 8)
+# The LED colours used for each of the calibration images
+ILLUMINATIONS = {"W":(255,255,255), "R":(255,0,0), "G":(0,255,0), "B":(0,0,255), } #"K":(0,0,0)} #K is currently unused
 
 def bin(image, b=2):
     """Bin bxb squares of an image together"""
@@ -63,6 +68,67 @@ def central_colour(image):
     w,h = image.shape[:2]
     return np.mean(np.mean(image[w*4//9:w//2+w*5//9, h*4//9:h*5//9, ...], axis=0), axis=0)
 
+def normalise_colour_target(colour_target):
+    """Accept either spelling of "centre" """
+    return "centre" if colour_target == "center" else colour_target
+
+def target_response_matrix(colour_target, central_response):
+    """The colour each of the R, G, and B images should be unmixed to, as the rows of a matrix"""
+    if normalise_colour_target(colour_target) == "centre":
+        return central_response
+    return np.identity(3)
+
+def compose_unmixing_matrices(inverse_crosstalk, target_response, smoothing=None):
+    """Combine the inverse crosstalk matrices with a colour target.
+
+    inverse_crosstalk: numpy.ndarray
+        NxMx3x3 array of inverted crosstalk matrices
+    target_response: numpy.ndarray
+        3x3 matrix, where each row is the colour we want the R, G, or B image
+        to be unmixed to.
+    smoothing: None or float
+        Width of a Gaussian blur to apply to the result, as for
+        colour_unmixing_matrices.
+
+    This is cheap, so changing the colour target only needs the (cached)
+    inverse crosstalk matrices, not the calibration images.
+    """
+    compensation_matrices = np.matmul(target_response.T, inverse_crosstalk)
+    if smoothing is not None:
+        compensation_matrices = ndimage.gaussian_filter(compensation_matrices, (smoothing,smoothing,0,0), order=0)
+    return compensation_matrices
+
+def unmixing_calibration(cal, colour_target="rgb", smoothing=None):
+    """Calculate the unmixing matrices, along with the intermediate results needed to recompose them.
+
+    Arguments are as for colour_unmixing_matrices.  Returns a dictionary with:
+
+    unmixing_matrices:
+        the NxMx3x3 unmixing matrices
+    inverse_crosstalk:
+        the NxMx3x3 inverted crosstalk matrices, before applying the colour target
+    central_response:
+        3x3 matrix with the colour of the centre of the R, G, and B images (relative
+        to the white image) as its rows
+    target_response:
+        the 3x3 matrix used as the colour target
+    colour_target, smoothing:
+        the arguments used to compose the unmixing matrices
+    """
+    crosstalk = crosstalk_matrices(cal)
+    inverse_crosstalk = np.linalg.inv(crosstalk) # inverts each 3x3 matrix in one go
+    central_response = central_colour(crosstalk).T
+    colour_target = normalise_colour_target(colour_target)
+    if colour_target == "centre":
+        print("Adding up the R/G/B images, we get:", np.sum(central_response, axis=0))
+    target_response = target_response_matrix(colour_target, central_response)
+    return {"unmixing_matrices": compose_unmixing_matrices(inverse_crosstalk, target_response, smoothing),
+            "inverse_crosstalk": inverse_crosstalk,
+            "central_response": central_response,
+            "target_response": target_response,
+            "colour_target": colour_target,
+            "smoothing": smoothing}
+
 def colour_unmixing_matrices(cal, colour_target="rgb", smoothing=None):
     """Return a matrix that turns the camera's recorded colour back into "perfect" colour
     
@@ -80,21 +146,7 @@ def colour_unmixing_matrices(cal, colour_target="rgb", smoothing=None):
     returns:
         an NxMx3x3 unmixing matrix
     """
-    crosstalk = crosstalk_matrices(cal)
-    compensation_matrices = np.empty_like(crosstalk)
-    # Doing this with a massive for loop is inefficient, but easy to read!
-    for i in range(crosstalk.shape[0]):
-        for j in range(crosstalk.shape[1]):
-            compensation_matrices[i,j,:,:] = np.linalg.inv(crosstalk[i,j,:,:])
-    if colour_target == "centre" or colour_target == "center":
-        central_response = np.array([central_colour(cal[k]/cal['W']) for k in ['R', 'G', 'B']])
-        print("Adding up the R/G/B images, we get:", np.sum(central_response, axis=0))
-        compensation_matrices = np.sum(compensation_matrices[:,:,:,np.newaxis,:]
-                              *central_response[np.newaxis,np.newaxis,:,:,np.newaxis], 
-                              axis=-3)
-    if smoothing is not None:
-        compensation_matrices = ndimage.gaussian_filter(compensation_matrices, (smoothing,smoothing,0,0), order=0)
-    return compensation_matrices
+    return unmixing_calibration(cal, colour_target, smoothing)["unmixing_matrices"]
 
 def colour_unmix_image(image, calibration, **kwargs):
     """Take a test image, and a set of W/R/G/B calibration images, and unmix the test image.
@@ -113,6 +165,35 @@ def colour_unmix_image(image, calibration, **kwargs):
     # about how matrix indices and array indices may or may not be the same way round!
     return np.sum(compensation * image[:,:,np.newaxis,:], axis=-1)
 
+def calibration_pyramid(unmixing_matrices, white_image, downsampling=DOWNSAMPLING, levels=PYRAMID_LEVELS):
+    """Block-average a calibration to make progressively coarser versions of it.
+
+    unmixing_matrices: numpy.ndarray
+        The NxMx3x3 unmixing matrices.
+    white_image: numpy.ndarray
+        The NxMx3 white image.
+    downsampling: int
+        The size (in full-resolution pixels) of each element of the calibration.
+    levels: tuple of int
+        The binning factor of each level of the pyramid (1 is the calibration
+        as supplied).
+
+    Returns a list of dictionaries, from finest to coarsest, each containing
+    ``downsampling`` (the size of each element in full-resolution pixels),
+    ``unmixing_matrices`` and ``white_image``.  Elements that don't fit into a
+    whole block are dropped from the coarser levels.
+    """
+    pyramid = []
+    for level in levels:
+        h, w = unmixing_matrices.shape[:2]
+        crop = (slice(0, h - h % level), slice(0, w - w % level))
+        pyramid.append({
+            "downsampling": downsampling * level,
+            "unmixing_matrices": bin(unmixing_matrices[crop], level) if level > 1 else unmixing_matrices,
+            "white_image": bin(white_image[crop], level) if level > 1 else white_image,
+        })
+    return pyramid
+
 def add_unmixing_args(parser):
     """Add the arguments for colour unmixing to an argparse.ArgumentParser"""
     parser.add_argument("calibration", help="Path to a folder containing"
@@ -120,12 +201,15 @@ def add_unmixing_args(parser):
                         "containing a previously-calculated unmixing matrix.  If a "
                         "folder is specified, files should be named capture_r%d"
                         "_g%d_b%d.jpg, where each %d is either 0 or 255.")
-    parser.add_argument("--colour_target", default="centre", choices=["center", "centre", "rgb"],
+    parser.add_argument("--colour_target", choices=["center", "centre", "rgb"],
                         help="Whether to normalise colour response relative to the centre"
-                        "of the sensor (default), or unmix to fully-saturated colours.")
+                        "of the sensor (the default for a folder of images), or unmix to "
+                        "fully-saturated colours.  For a YAML file, the default is the "
+                        "colour target it was saved with.")
     parser.add_argument("--smoothing", type=float, help="Smoothing to apply to the "
                         "unmixing matrices, in units of 16-pixel blocks.  The default "
-                        "is not to apply any smoothing.")
+                        "for a folder of images is not to apply any smoothing, and for "
+                        "a YAML file is the smoothing it was saved with (use 0 to remove it).")
     return parser
 
 def calculate_calibration(args):
@@ -133,14 +217,46 @@ def calculate_calibration(args):
     # If we supplied a pre-calculated yaml file, just use that!
     if args.calibration.endswith(".yaml"):
         with open(args.calibration, "r") as infile:
-            return yaml.unsafe_load(infile) # NB this is not robust to malicious YAML!
+            calibration = yaml.unsafe_load(infile) # NB this is not robust to malicious YAML!
+        calibration["downsampling"] = calibration.get("downsampling", DOWNSAMPLING)
+        # Only recompose the matrices if we were asked for a different colour target or
+        # smoothing; otherwise the saved matrices are used exactly as they are
+        saved = (calibration.get("colour_target", "centre"), calibration.get("smoothing"))
+        colour_target, smoothing = saved
+        if args.colour_target is not None:
+            colour_target = normalise_colour_target(args.colour_target)
+        if args.smoothing is not None:
+            smoothing = args.smoothing
+        if (colour_target, smoothing) != saved:
+            if "inverse_crosstalk" not in calibration:
+                print("Warning: this calibration file can't be changed to a different colour target or "
+                      "smoothing; using the unmixing matrices as saved.")
+            else:
+                # Recompose the matrices from the cached inverse crosstalk (no need for the images)
+                target_response = target_response_matrix(colour_target, calibration["central_response"])
+                calibration.update({
+                    "unmixing_matrices": compose_unmixing_matrices(calibration["inverse_crosstalk"],
+                                                                   target_response, smoothing),
+                    "target_response": target_response,
+                    "colour_target": colour_target,
+                    "smoothing": smoothing,
+                })
+                calibration.pop("pyramid", None)
+        if "pyramid" not in calibration: # Older files only have the full-resolution grid
+            calibration["pyramid"] = calibration_pyramid(calibration["unmixing_matrices"],
+                                                         calibration["white_image"],
+                                                         calibration["downsampling"])
+        return calibration
     
     # Otherwise, load a folder of images.
-    illuminations = {"W":(255,255,255), "R":(255,0,0), "G":(0,255,0), "B":(0,0,255), } #"K":(0,0,0)} #K is currently unused
-    cal = load_run(args.calibration, illuminations)
+    cal = load_run(args.calibration, ILLUMINATIONS)
     
-    compensation_matrices = colour_unmixing_matrices(cal, colour_target=args.colour_target, smoothing=args.smoothing)
-    return {"unmixing_matrices": compensation_matrices, "white_image": cal['W']}
+    calibration = unmixing_calibration(cal, colour_target=args.colour_target or "centre",
+                                       smoothing=args.smoothing)
+    calibration.update({"white_image": cal['W'],
+                        "downsampling": DOWNSAMPLING,
+                        "pyramid": calibration_pyramid(calibration["unmixing_matrices"], cal['W'])})
+    return calibration
 
 
     
@@ -0,0 +1,56 @@
+"""
+Tests for closed-loop lens shading refinement, using the simulated camera.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import numpy as np
+import pytest
+from picam_raw_analysis import lst_closed_loop as lcl
+
+def max_rms(record):
+    return np.max(record["rms"])
+
+def measure(table, **kwargs):
+    """The flatness of a noiseless simulated white image with a lens shading table"""
+    camera = lcl.SimulatedWhiteImageCamera(noise=0, **kwargs)
+    camera.set_lens_shading_table(table)
+    cell_means = lcl.mean_in_lst_cells(camera.capture_white_image(),
+                                       camera.lens_shading_table_shape(), camera.full_resolution)
+    return np.max(lcl.flatness(cell_means)["rms"])
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_converges(seed):
+    camera = lcl.SimulatedWhiteImageCamera(seed=seed)
+    table, history = lcl.refine_lens_shading_table(camera, max_iterations=8, tolerance=0.01)
+    assert table.shape == camera.lens_shading_table_shape()
+    assert table.dtype == np.uint8
+    rms = [max_rms(h) for h in history]
+    assert rms[0] > 0.05 # the vignette is clearly visible with a flat table
+    assert all(b < a for a, b in zip(rms, rms[1:]))
+    assert rms[-1] < 0.01
+    assert len(history) < 8
+    assert measure(table) < 0.01
+
+def test_stops_when_no_longer_improving():
+    # The table is quantised, so this tolerance can't be reached
+    camera = lcl.SimulatedWhiteImageCamera(noise=0)
+    table, history = lcl.refine_lens_shading_table(camera, max_iterations=8, tolerance=0.0001)
+    assert 2 < len(history) < 8
+    rms = [max_rms(h) for h in history]
+    assert rms[-1] > 0.9 * rms[-2]
+    # The best table is returned, not the last one
+    assert measure(table) == pytest.approx(min(rms))
+
+def test_starting_table():
+    camera = lcl.SimulatedWhiteImageCamera(noise=0)
+    initial, history = lcl.refine_lens_shading_table(camera, max_iterations=3, tolerance=0.01)
+    table, history = lcl.refine_lens_shading_table(camera, initial, max_iterations=1)
+    assert len(history) == 1
+    np.testing.assert_array_equal(table, initial)
+    with pytest.raises(ValueError):
+        lcl.refine_lens_shading_table(camera, initial[:, 1:, :])
+
+def test_needs_an_iteration():
+    with pytest.raises(ValueError):
+        lcl.refine_lens_shading_table(lcl.SimulatedWhiteImageCamera(), max_iterations=0)
@@ -0,0 +1,51 @@
+"""
+Tests for generating lens shading tables for each sensor mode.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import numpy as np
+import pytest
+from picam_raw_analysis import lst_from_raw_white_image as lst
+
+FULL_RESOLUTION = (3280, 2464)
+
+def lens_shading_table_shape(sensor_mode):
+    """The shape PiCamera._lens_shading_table_shape expects for a mode"""
+    resolution = lst.SENSOR_MODES[sensor_mode][0]
+    return (4,) + tuple([(r // 64) + 1 for r in resolution[::-1]])
+
+def white_channels():
+    """The 4 Bayer channels of a vignetted full-resolution white image"""
+    width, height = FULL_RESOLUTION
+    y, x = np.mgrid[:height//2, :width//2]
+    r2 = ((x - width/4)/(width/4))**2 + ((y - height/4)/(height/4))**2
+    channel = 64 + 800*(1 - 0.3*r2)
+    return np.stack([channel]*4)
+
+@pytest.mark.parametrize("sensor_mode", sorted(lst.SENSOR_MODES.keys()))
+def test_channels_for_sensor_mode(sensor_mode):
+    (width, height), binning, offset = lst.SENSOR_MODES[sensor_mode]
+    channels = np.ones((4, FULL_RESOLUTION[1]//2, FULL_RESOLUTION[0]//2))
+    cropped = lst.channels_for_sensor_mode(channels, sensor_mode)
+    assert cropped.shape == (4, height//2, width//2)
+    np.testing.assert_allclose(cropped, 1)
+
+def test_channels_for_sensor_mode_needs_full_resolution():
+    with pytest.raises(ValueError):
+        lst.channels_for_sensor_mode(np.ones((4, 540, 960)), 1)
+
+def test_lsts_for_sensor_modes():
+    tables = lst.lsts_for_sensor_modes(white_channels())
+    assert sorted(tables.keys()) == sorted(lst.SENSOR_MODES.keys())
+    for mode, table in tables.items():
+        assert table.shape == lens_shading_table_shape(mode)
+        assert table.dtype == np.uint8
+        assert table.flags["C_CONTIGUOUS"]
+        # Unity gain (32) near the centre, more gain towards the edges
+        assert table.min() >= 32
+        assert table[:, 0, 0].min() > table[:, table.shape[1]//2, table.shape[2]//2].max()
+
+def test_lsts_for_some_sensor_modes():
+    tables = lst.lsts_for_sensor_modes(white_channels(), [4, 7])
+    assert sorted(tables.keys()) == [4, 7]
@@ -0,0 +1,48 @@
+"""
+Tests for choosing which images in a capture manifest to unmix.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import json
+import os
+from picam_raw_analysis.unmix_image import images_from_manifest
+
+def write_manifest(folder):
+    """A manifest like measure_colour_response writes, with every kind of capture"""
+    records = [{"path": "calibration_" + c + ".jpeg", "kind": "calibration", "wall_time": 0}
+               for c in "RGBW"]
+    records += [{"path": "timed_{}.jpeg".format(i), "kind": "timed", "index": i,
+                 "nominal_time": 10 * i, "actual_time": 10 * i + 0.1, "wall_time": 100 + 10 * i}
+                for i in range(5)]
+    records.append({"path": "additional_image_1.jpeg", "kind": "additional", "wall_time": 200})
+    filename = os.path.join(str(folder), "manifest.jsonl")
+    with open(filename, "w") as outfile:
+        for record in records:
+            outfile.write(json.dumps(record) + "\n")
+    return filename
+
+def names(paths):
+    return [os.path.basename(p) for p in paths]
+
+def test_only_timed_images_by_default(tmpdir):
+    filename = write_manifest(tmpdir)
+    assert names(images_from_manifest(filename)) == ["timed_{}.jpeg".format(i) for i in range(5)]
+
+def test_ranges(tmpdir):
+    filename = write_manifest(tmpdir)
+    assert names(images_from_manifest(filename, index_range=(1, 2))) == ["timed_1.jpeg", "timed_2.jpeg"]
+    assert names(images_from_manifest(filename, time_range=(20, None))) == ["timed_2.jpeg", "timed_3.jpeg",
+                                                                            "timed_4.jpeg"]
+
+def test_other_kinds(tmpdir):
+    filename = write_manifest(tmpdir)
+    assert names(images_from_manifest(filename, "additional")) == ["additional_image_1.jpeg"]
+    assert len(images_from_manifest(filename, "calibration")) == 4
+    assert len(images_from_manifest(filename, "all")) == 10
+
+def test_file_names_txt(tmpdir):
+    filename = os.path.join(str(tmpdir), "file_names.txt")
+    with open(filename, "w") as outfile:
+        outfile.write("a.jpeg\nb.jpeg\n")
+    assert images_from_manifest(filename) == [os.path.join(str(tmpdir), n) for n in ("a.jpeg", "b.jpeg")]
@@ -0,0 +1,66 @@
+"""
+Tests for loading and recomposing saved colour calibrations.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import argparse
+import numpy as np
+import yaml
+import pytest
+from picam_raw_analysis import unmixing_matrix
+
+def synthetic_run(shape=(12, 16), seed=0):
+    """Random R, G, B and W calibration images, with some crosstalk between channels"""
+    rng = np.random.RandomState(seed)
+    run = {}
+    for k, channel in zip("RGB", range(3)):
+        image = rng.uniform(20, 60, size=shape + (3,))
+        image[:, :, channel] += 500
+        run[k] = image
+    run["W"] = run["R"] + run["G"] + run["B"]
+    return run
+
+def save_calibration(path, colour_target, smoothing):
+    """Save a calibration as unmixing_matrix.main would"""
+    run = synthetic_run()
+    calibration = unmixing_matrix.unmixing_calibration(run, colour_target, smoothing)
+    calibration["white_image"] = run["W"]
+    calibration["downsampling"] = unmixing_matrix.DOWNSAMPLING
+    with open(str(path), "w") as outfile:
+        yaml.dump(calibration, outfile)
+    return calibration
+
+def load(path, *args):
+    parser = unmixing_matrix.add_unmixing_args(argparse.ArgumentParser())
+    return unmixing_matrix.calculate_calibration(parser.parse_args([str(path)] + list(args)))
+
+@pytest.mark.parametrize("colour_target, smoothing", [("rgb", None), ("rgb", 1.5), ("centre", 1.5)])
+def test_saved_calibration_is_used_unchanged(tmpdir, colour_target, smoothing):
+    path = tmpdir.join("calibration.yaml")
+    saved = save_calibration(path, colour_target, smoothing)
+    loaded = load(path)
+    np.testing.assert_array_equal(loaded["unmixing_matrices"], saved["unmixing_matrices"])
+    assert loaded["colour_target"] == colour_target
+    assert loaded["smoothing"] == smoothing
+
+def test_explicit_arguments_recompose_the_calibration(tmpdir):
+    path = tmpdir.join("calibration.yaml")
+    save_calibration(path, "rgb", 1.5)
+    expected = unmixing_matrix.unmixing_calibration(synthetic_run(), "centre", 1.5)
+    loaded = load(path, "--colour_target", "center")
+    np.testing.assert_allclose(loaded["unmixing_matrices"], expected["unmixing_matrices"])
+    assert (loaded["colour_target"], loaded["smoothing"]) == ("centre", 1.5)
+
+    expected = unmixing_matrix.unmixing_calibration(synthetic_run(), "rgb", None)
+    loaded = load(path, "--smoothing", "0")
+    np.testing.assert_allclose(loaded["unmixing_matrices"], expected["unmixing_matrices"])
+    assert (loaded["colour_target"], loaded["smoothing"]) == ("rgb", 0)
+
+def test_folder_defaults(tmpdir, monkeypatch):
+    run = synthetic_run()
+    monkeypatch.setattr(unmixing_matrix, "load_run", lambda folder, illuminations: run)
+    loaded = load(tmpdir)
+    expected = unmixing_matrix.unmixing_calibration(run, "centre", None)
+    np.testing.assert_allclose(loaded["unmixing_matrices"], expected["unmixing_matrices"])
+    assert (loaded["colour_target"], loaded["smoothing"]) == ("centre", None)
@@ -0,0 +1,137 @@
+"""
+Compare the speed of picamera's ring buffer streams.
+
+This writes a simulated H.264 recording (buffers of random size, averaging
+``bitrate / framerate``) into each of ``picamera.streams.CircularIO`` and
+``PreallocatedCircularIO``, sized to hold ``--seconds`` of video, and reports
+how fast each stream accepts writes once it is full, how much memory is
+allocated while doing so, and how long it takes to copy the whole buffer out
+again (as ``copy_to`` does when an event is saved).
+
+It imports the ``picamera`` package from this repository (not an installed
+copy), so changes to ``picamera/streams.py`` are benchmarked alongside them.
+Run it on the Pi itself, while nothing else is using the CPU, e.g.
+    python benchmarks/benchmark_circular_io.py --seconds 30 --bitrate 17000000
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import argparse
+import gc
+import io
+import os
+import sys
+import time
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from picamera.streams import CircularIO, PreallocatedCircularIO
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None # Python 2 can't measure allocations
+
+monotonic = getattr(time, "monotonic", time.time) # Python 2 has no monotonic clock
+
+class NullOutput(io.RawIOBase):
+    """Count the bytes written to it, and throw them away"""
+    def __init__(self):
+        self.count = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.count += len(b)
+        return len(b)
+
+def make_buffers(n, mean_size, buffer_type="bytes", seed=0):
+    """A list of ``n`` random-sized buffers, like those from the H.264 encoder.
+
+    With ``buffer_type="bytes"`` each buffer is a separate ``bytes`` object,
+    as from ``MMALBuffer.data``; with ``"memoryview"`` they are views of one
+    ``bytearray``, like a view of the encoder's own memory.
+    """
+    rng = np.random.RandomState(seed)
+    sizes = np.maximum(rng.exponential(mean_size, size=n).astype(int), 16)
+    data = bytearray(rng.randint(0, 256, size=int(np.max(sizes)), dtype=np.uint8).tobytes())
+    if buffer_type == "memoryview":
+        return [memoryview(data)[:s] for s in sizes]
+    return [bytes(data[:s]) for s in sizes]
+
+def benchmark_writes(stream, buffers):
+    """Write each buffer to the stream, returning (seconds, bytes allocated, GC collections)"""
+    gc.collect()
+    collections = sum(s["collections"] for s in gc.get_stats()) if hasattr(gc, "get_stats") else 0
+    if tracemalloc:
+        tracemalloc.start()
+    start = monotonic()
+    for b in buffers:
+        stream.write(b)
+    duration = monotonic() - start
+    allocated = None
+    if tracemalloc:
+        allocated = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    if hasattr(gc, "get_stats"):
+        collections = sum(s["collections"] for s in gc.get_stats()) - collections
+    return duration, allocated, collections
+
+def benchmark_copy(stream, use_readinto=False, chunk_size=1024*1024):
+    """Copy the stream's contents to a NullOutput, returning the time it took"""
+    output = NullOutput()
+    start = monotonic()
+    with stream.lock:
+        stream.seek(0)
+        if use_readinto:
+            chunk = bytearray(chunk_size)
+            while True:
+                n = stream.readinto(chunk)
+                if not n:
+                    break
+                output.write(memoryview(chunk)[:n])
+        else:
+            while True:
+                buf = stream.read1()
+                if not buf:
+                    break
+                output.write(buf)
+    assert output.count == stream.tell()
+    return monotonic() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the speed of CircularIO and PreallocatedCircularIO.")
+    parser.add_argument("--seconds", type=float, default=30, help="Length of the ring buffer, in seconds of video")
+    parser.add_argument("--bitrate", type=int, default=17000000, help="Bitrate of the simulated video, in bits per second")
+    parser.add_argument("--framerate", type=float, default=30, help="Frames (i.e. encoder buffers) per second")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of times to run each benchmark (the best is reported)")
+    parser.add_argument("--buffer_type", choices=["bytes", "memoryview"], default="memoryview",
+                        help="Write each buffer as a new bytes object, or as a view of the encoder's memory")
+    args = parser.parse_args()
+
+    size = int(args.bitrate * args.seconds // 8)
+    mean_buffer = args.bitrate / 8 / args.framerate
+    # Fill the ring twice over, so most writes happen once it's full
+    buffers = make_buffers(int(2 * args.seconds * args.framerate), mean_buffer, args.buffer_type)
+    total = sum(len(b) for b in buffers)
+    print("Ring buffer of {:.1f}MB; writing {} buffers as {} ({:.1f}MB, averaging {:.0f} bytes)".format(
+            size / 1e6, len(buffers), args.buffer_type, total / 1e6, mean_buffer))
+
+    for cls, use_readinto in [(CircularIO, False), (PreallocatedCircularIO, False), (PreallocatedCircularIO, True)]:
+        write_times, copy_times = [], []
+        for i in range(args.repeats):
+            stream = cls(size)
+            duration, allocated, collections = benchmark_writes(stream, buffers)
+            write_times.append(duration)
+            copy_times.append(benchmark_copy(stream, use_readinto))
+            stream.close()
+        write_time = min(write_times)
+        print("{}{}:".format(cls.__name__, " (readinto)" if use_readinto else ""))
+        print("    writes: {:.1f} us per buffer, {:.0f}MB/s".format(
+                write_time / len(buffers) * 1e6, total / write_time / 1e6))
+        if allocated is not None:
+            print("    peak memory allocated while writing: {:.1f}MB".format(allocated / 1e6))
+        print("    garbage collections while writing: {}".format(collections))
+        print("    copying out the full buffer: {:.3f}s".format(min(copy_times)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Capture fast bursts of frames into a preallocated ring of buffers.
+
+``camera.capture`` reconfigures the still port for every image, which is far
+too slow to follow events that happen within a second.  :func:`burst_capture`
+instead uses ``camera.capture_sequence``, either from the video port (giving
+unencoded YUV or RGB frames at the camera's framerate) or from the still port
+in burst mode (giving JPEG+RAW frames, more slowly).  Camera settings should be
+frozen beforehand, so every frame in the burst is comparable.
+
+Frames go into a :class:`FrameRing`, a fixed set of preallocated buffers that
+are reused in turn, so nothing is allocated or written to disk while frames are
+arriving.  If the burst is longer than the ring, the oldest frames are
+overwritten.  The ring records when each frame arrived, so the achieved frame
+rate and any dropped frames can be reported with :meth:`FrameRing.stats`, and
+the frames can be saved afterwards with :meth:`FrameRing.save`.
+"""
+from __future__ import print_function, division
+import os
+import time
+from capture_writer import CaptureBuffer
+
+monotonic = getattr(time, "monotonic", time.time) # Python 2 has no monotonic clock
+
+# Big enough for a full-resolution JPEG+RAW capture from the v2 camera module
+BAYER_FRAME_SIZE = 16 * 1024 * 1024
+
+FILE_EXTENSIONS = {'yuv': '.yuv', 'rgb': '.rgb', 'bgr': '.bgr', 'jpeg': '.jpg'}
+
+def frame_size(resolution, format):
+    """The number of bytes in one frame of the given (width, height) and format.
+
+    Unencoded frames are padded to a multiple of 32 pixels wide and 16 pixels
+    high, as the camera does.  JPEG frames (which include the raw data) are
+    given enough room for a full-resolution capture.
+    """
+    if format == 'jpeg':
+        return BAYER_FRAME_SIZE
+    width, height = resolution
+    width = (width + 31) // 32 * 32
+    height = (height + 15) // 16 * 16
+    bytes_per_pixel = {'yuv': 1.5, 'rgb': 3, 'bgr': 3, 'rgba': 4, 'bgra': 4}[format]
+    return int(width * height * bytes_per_pixel)
+
+
+class FrameRing(object):
+    """A fixed ring of preallocated frame buffers, filled in turn by a capture sequence.
+
+    n_buffers: int
+        The number of frames that can be held.
+    buffer_size: int
+        The size of each buffer in bytes (see :func:`frame_size`).
+    clock: function
+        Used to timestamp frames; defaults to :func:`time.monotonic`.
+    """
+    def __init__(self, n_buffers, buffer_size, clock=monotonic):
+        self.buffers = [CaptureBuffer(buffer_size) for i in range(n_buffers)]
+        self.clock = clock
+        self.start_time = None
+        self.times = []
+
+    def outputs(self, n_frames):
+        """Yield a buffer for each of ``n_frames`` frames, for ``capture_sequence``
+
+        The camera asks for the next output as soon as each frame has been
+        written, so we note the time each frame finished when resuming.
+        """
+        self.start_time = self.clock()
+        self.times = []
+        for i in range(n_frames):
+            buf = self.buffers[i % len(self.buffers)]
+            buf.reset()
+            yield buf
+            self.times.append(self.clock() - self.start_time)
+
+    def frames(self):
+        """The frames still held in the ring, as (index, time, buffer), oldest first"""
+        n = len(self.times)
+        first = max(0, n - len(self.buffers))
+        return [(i, self.times[i], self.buffers[i % len(self.buffers)]) for i in range(first, n)]
+
+    def stats(self, framerate=None):
+        """Work out how quickly frames arrived.
+
+        If the nominal ``framerate`` is given, gaps between frames longer than
+        1.5 frame periods are counted as dropped frames.  Returns a dictionary.
+        """
+        stats = {"frames": len(self.times),
+                 "overwritten": max(0, len(self.times) - len(self.buffers))}
+        if len(self.times) > 1:
+            duration = self.times[-1] - self.times[0]
+            stats["duration"] = duration
+            stats["achieved_framerate"] = (len(self.times) - 1) / duration if duration > 0 else float("inf")
+            if framerate:
+                period = 1.0 / float(framerate)
+                gaps = [b - a for a, b in zip(self.times[:-1], self.times[1:])]
+                stats["dropped"] = sum(int(round(g / period)) - 1 for g in gaps if g > 1.5 * period)
+        return stats
+
+    def save(self, output_prefix, format):
+        """Write the frames in the ring to disk, with a list of their arrival times.
+
+        See :func:`save_frames`.  Returns the list of filenames.
+        """
+        return save_frames(self.frames(), output_prefix, format)
+
+
+def save_frames(frames, output_prefix, format):
+    """Write frames to disk, with a list of their arrival times.
+
+    ``frames`` is a list of (index, time, buffer) tuples.  Frames are saved as
+    ``<output_prefix><index>`` with an extension suitable for the format, and
+    their times (in seconds) are listed in ``<output_prefix>times.txt``.
+    Returns the list of filenames.
+    """
+    extension = FILE_EXTENSIONS.get(format, '.' + format)
+    filenames = []
+    with open(output_prefix + "times.txt", "w") as times_file:
+        for i, t, buf in frames:
+            filename = "{}{:05d}{}".format(output_prefix, i, extension)
+            with open(filename, "wb") as f:
+                f.write(buf.getbuffer())
+            times_file.write("{}\t{}\t{:.6f}\n".format(os.path.basename(filename), i, t))
+            filenames.append(filename)
+    return filenames
+
+
+def burst_capture(camera, n_frames, format='yuv', use_video_port=True, resize=None, ring_size=None):
+    """Capture a burst of frames as fast as the camera can deliver them.
+
+    camera: picamera.PiCamera
+        The camera, with settings already frozen.
+    n_frames: int
+        How many frames to capture.
+    format: string
+        'yuv', 'rgb' or 'bgr' for unencoded frames from the video port, or
+        'jpeg' for JPEG+RAW frames from the still port in burst mode.
+    use_video_port: bool
+        Must be False for 'jpeg', as raw data is only available from the still
+        port.
+    resize: tuple
+        Optionally, a (width, height) to resize unencoded frames to.
+    ring_size: int
+        The number of frames to keep (defaults to ``n_frames``).  If it is
+        smaller than ``n_frames``, only the last ``ring_size`` frames are kept.
+
+    Returns the :class:`FrameRing` holding the frames.
+    """
+    bayer = format == 'jpeg'
+    if bayer and use_video_port:
+        raise ValueError("Raw (Bayer) frames can only be captured from the still port")
+    resolution = resize or camera.resolution
+    ring = FrameRing(ring_size or n_frames, frame_size(resolution, format))
+    if use_video_port:
+        camera.capture_sequence(ring.outputs(n_frames), format=format, use_video_port=True, resize=resize)
+    else:
+        camera.capture_sequence(ring.outputs(n_frames), format=format, burst=True, bayer=bayer, resize=resize)
+    return ring
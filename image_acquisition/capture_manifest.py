@@ -0,0 +1,110 @@
+"""
+Record every capture in an append-only manifest, as it happens.
+
+The manifest is a JSON Lines file: one JSON object per line, one line per
+capture, written and flushed straight after each capture so a crash loses at
+most the capture in progress.  Each record holds:
+
+    ``path``, ``size``:
+        The image file (relative to the manifest) and its size in bytes.
+    ``kind``:
+        What the capture was for, e.g. "calibration", "additional" or "timed".
+    ``index``, ``nominal_time``, ``actual_time``, ``wall_time``:
+        Where the capture sits on the time grid, for timed captures (see
+        ``capture_scheduler.CaptureSlot``).  ``wall_time`` is always present.
+    ``camera``:
+        The exposure settings at the time of capture.
+    ``led``:
+        The colour of the illumination, if it's known.
+
+Any other keyword arguments to :meth:`CaptureManifest.record` are stored too.
+The analysis tools (``picam_raw_analysis.capture_manifest``) read this file
+instead of listing folders.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import json
+import os
+import threading
+import time
+
+CAMERA_SETTINGS = ['shutter_speed', 'exposure_speed', 'analog_gain', 'digital_gain',
+                   'iso', 'exposure_mode', 'awb_mode', 'awb_gains']
+
+def camera_settings(camera):
+    """The camera's exposure settings, as a dictionary that can be saved as JSON"""
+    settings = {}
+    for k in CAMERA_SETTINGS:
+        v = getattr(camera, k)
+        if isinstance(v, tuple):
+            v = [float(x) for x in v]
+        elif not isinstance(v, (str, int)):
+            v = float(v) # gains are Fractions
+        settings[k] = v
+    return settings
+
+
+class CaptureManifest(object):
+    """An append-only JSON Lines record of captures.
+
+    filename: string
+        The manifest file.  If it exists, new records are added to the end.
+    fsync: bool
+        If True, force each record onto the disk (not just out of Python's
+        buffers) before returning.  This is slower, but survives power cuts.
+    """
+    def __init__(self, filename, fsync=False):
+        self.filename = filename
+        self.folder = os.path.dirname(os.path.abspath(filename))
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = open(filename, "a")
+
+    def record(self, path, size=None, kind=None, camera=None, led=None, slot=None, **extra):
+        """Add a capture to the manifest, and flush it to disk.
+
+        path: string
+            The image file.  It's stored relative to the manifest.
+        size: int
+            The size of the image in bytes.  If it's not given, the file's size
+            is used (so pass it if the file is still being written).
+        camera: picamera.PiCamera
+            If given, the camera's exposure settings are recorded.
+        led:
+            If given, the illumination's current ``rgb`` value is recorded.
+        slot: capture_scheduler.CaptureSlot
+            If given, the capture's position on the time grid is recorded.
+
+        Returns the record as a dictionary.
+        """
+        if size is None:
+            size = os.path.getsize(path)
+        record = {"path": os.path.relpath(os.path.abspath(path), self.folder),
+                  "size": size,
+                  "wall_time": time.time()}
+        if kind is not None:
+            record["kind"] = kind
+        if slot is not None:
+            record.update(slot._asdict())
+        if camera is not None:
+            record["camera"] = camera_settings(camera)
+        if led is not None and getattr(led, "rgb", None) is not None:
+            record["led"] = list(led.rgb)
+        record.update(extra)
+        line = json.dumps(record, sort_keys=True) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        return record
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
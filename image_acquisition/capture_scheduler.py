@@ -0,0 +1,124 @@
+"""
+Schedule captures on a fixed time grid, without busy-waiting.
+
+:class:`CaptureScheduler` yields one slot per capture.  Between slots it sleeps
+until the next deadline on a monotonic clock, so it uses no CPU while waiting
+and the deadlines never drift, even if one capture takes longer than usual.
+Deadlines are always ``start + n * interval``; if a capture overruns so badly
+that the next deadline has already passed, the slot is "missed", and what
+happens next depends on the policy:
+
+    ``skip`` (default):
+        Drop the missed slots and carry on at the next deadline that's still in
+        the future.  Every capture stays on the original grid.
+
+    ``catch_up``:
+        Capture the missed slots immediately, one after another, until we are
+        back on schedule.  No captures are lost, but they may be bunched up.
+
+    ``shift``:
+        Capture immediately, and move the rest of the grid later so that the
+        interval between captures is preserved.
+
+The clock, sleep function and wall clock can be replaced, so the timing can be
+tested with a fake clock and no camera attached.
+"""
+from __future__ import print_function, division
+import time
+from collections import namedtuple
+
+monotonic = getattr(time, "monotonic", time.time) # Python 2 has no monotonic clock
+
+class CaptureSlot(namedtuple('CaptureSlot', ('index', 'nominal_time', 'actual_time', 'wall_time'))):
+    """
+    One scheduled capture.
+
+    .. attribute:: index
+
+        The position of this slot on the time grid, starting at 0.
+
+    .. attribute:: nominal_time
+
+        When the capture should have happened, in seconds since the start.
+        With the "shift" policy, this includes any shifts so far, including
+        the shift caused by this slot being late.
+
+    .. attribute:: actual_time
+
+        When the slot was actually released, in seconds since the start.
+
+    .. attribute:: wall_time
+
+        The wall-clock time (as returned by :func:`time.time`) at which the
+        slot was released, e.g. for timestamping files.
+    """
+    __slots__ = ()
+
+
+class CaptureScheduler(object):
+    """Release capture slots at regular intervals, sleeping between them.
+
+    interval: float
+        Time between captures, in seconds.
+    count: int
+        The number of slots on the grid.
+    policy: string
+        What to do when a slot is missed: "skip", "catch_up" or "shift" (see
+        the module documentation).
+    late_tolerance: float
+        How late (in seconds) a slot may be released before it counts as
+        missed.  Defaults to 10% of the interval.
+    clock, sleep, wall_clock:
+        Functions used to measure time, to wait, and to timestamp slots.  These
+        default to :func:`time.monotonic`, :func:`time.sleep` and
+        :func:`time.time`.
+
+    Iterating over the scheduler yields a :class:`CaptureSlot` at each
+    deadline.  Slots that were skipped or released late are recorded in
+    :attr:`missed` as ``(index, seconds_late)`` tuples.
+    """
+    POLICIES = ("skip", "catch_up", "shift")
+
+    def __init__(self, interval, count, policy="skip", late_tolerance=None,
+                 clock=monotonic, sleep=time.sleep, wall_clock=time.time):
+        if policy not in self.POLICIES:
+            raise ValueError("policy must be one of {}".format(", ".join(self.POLICIES)))
+        if interval <= 0:
+            raise ValueError("The interval between captures must be positive")
+        self.interval = interval
+        self.count = count
+        self.policy = policy
+        self.late_tolerance = interval * 0.1 if late_tolerance is None else late_tolerance
+        self.clock = clock
+        self.sleep = sleep
+        self.wall_clock = wall_clock
+        self.missed = []
+
+    def __iter__(self):
+        start = self.clock()
+        offset = 0.0 # only changed by the "shift" policy
+        n = 0
+        while n < self.count:
+            deadline = start + offset + n * self.interval
+            now = self.clock()
+            while now < deadline:
+                self.sleep(deadline - now)
+                now = self.clock()
+            lateness = now - deadline
+            if lateness > self.late_tolerance:
+                if self.policy == "skip":
+                    # Jump forward to the first slot that isn't already late
+                    n_next = n + int((lateness - self.late_tolerance) // self.interval) + 1
+                    skipped = list(range(n, min(n_next, self.count)))
+                    self.missed += [(i, lateness - (i - n) * self.interval) for i in skipped]
+                    print("Missed capture slot(s) {} by {:.3f}s, skipping".format(skipped, lateness))
+                    n = n_next
+                    continue
+                self.missed.append((n, lateness))
+                if self.policy == "shift":
+                    offset += lateness
+                    print("Missed capture slot {} by {:.3f}s, shifting later slots".format(n, lateness))
+                else:
+                    print("Missed capture slot {} by {:.3f}s, catching up".format(n, lateness))
+            yield CaptureSlot(n, offset + n * self.interval, now - start, self.wall_clock())
+            n += 1
@@ -0,0 +1,239 @@
+"""
+Write captured images to disk in the background.
+
+Saving a JPEG+RAW capture (around 12MB) straight to an SD card can take longer
+than the capture itself, which limits how quickly a timed series can run.
+:class:`WriteBehindQueue` keeps a fixed pool of preallocated in-memory buffers:
+each capture is written into a free buffer, and the buffer is handed to one or
+more background writer threads through a bounded queue.  Once the file is on
+disk, the buffer goes back into the pool.  Short bursts are then limited only
+by the camera; storage speed only matters when the average capture rate is
+higher than the disk can keep up with.
+
+When every buffer is waiting to be written, the ``back_pressure`` policy
+decides what happens to the next capture:
+
+    ``block`` (default):
+        Wait for a buffer to be written and freed.
+
+    ``drop``:
+        Don't capture; the capture is counted in the ``dropped`` statistic.
+
+    ``write_through``:
+        Capture straight to disk on the calling thread, as if there were no
+        queue.
+
+If a capture can't be written (e.g. the disk is full), the error is re-raised
+by the next call to :meth:`WriteBehindQueue.capture` or
+:meth:`WriteBehindQueue.close`, so it doesn't go unnoticed.  Statistics (queue
+depth and write latency) are available from :meth:`WriteBehindQueue.stats`.
+"""
+from __future__ import print_function, division
+import os
+import threading
+import time
+try:
+    import queue
+except ImportError: # Python 2
+    import Queue as queue
+
+monotonic = getattr(time, "monotonic", time.time) # Python 2 has no monotonic clock
+
+class CaptureBuffer(object):
+    """A minimal file-like object that stores what's written in a preallocated bytearray.
+
+    It can be passed to ``camera.capture`` in place of a filename (remember to
+    specify the ``format``, as it can't be guessed from a file extension).  If a
+    capture is bigger than the buffer, the buffer is enlarged, so choose
+    ``size`` to fit a whole capture to avoid allocating memory while capturing.
+    """
+    def __init__(self, size):
+        self._data = bytearray(size)
+        self._view = memoryview(self._data)
+        self.length = 0
+        self.filename = None
+
+    def write(self, b):
+        """Copy ``b`` into the buffer, after anything already written"""
+        n = len(b)
+        end = self.length + n
+        if end > len(self._data):
+            # The view must be released before the bytearray can be resized
+            self._view.release()
+            self._data.extend(bytearray(end - len(self._data)))
+            self._view = memoryview(self._data)
+        self._view[self.length:end] = b
+        self.length = end
+        return n
+
+    def flush(self):
+        pass
+
+    def getbuffer(self):
+        """A memoryview of the data written so far (no copy is made)"""
+        return self._view[:self.length]
+
+    def reset(self):
+        """Empty the buffer, ready for reuse"""
+        self.length = 0
+        self.filename = None
+
+
+class WriteBehindQueue(object):
+    """Capture into a pool of buffers, and write them to disk in the background.
+
+    n_buffers: int
+        How many captures can be held in memory, waiting to be written.
+    buffer_size: int
+        Size of each buffer in bytes.  The default fits a JPEG+RAW capture
+        from the v2 camera module at full resolution.
+    back_pressure: string
+        What to do if no buffer is free: "block", "drop" or "write_through"
+        (see the module documentation).
+    n_writers: int
+        Number of background threads writing to disk.
+
+    Use it as a context manager, or call :meth:`close` to wait for all the
+    queued captures to be written.
+    """
+    POLICIES = ("block", "drop", "write_through")
+
+    def __init__(self, n_buffers=4, buffer_size=16 * 1024 * 1024,
+                 back_pressure="block", n_writers=1):
+        if back_pressure not in self.POLICIES:
+            raise ValueError("back_pressure must be one of {}".format(", ".join(self.POLICIES)))
+        self.back_pressure = back_pressure
+        self._free = queue.Queue()
+        for i in range(n_buffers):
+            self._free.put(CaptureBuffer(buffer_size))
+        self._pending = queue.Queue(maxsize=n_buffers)
+        self._stats_lock = threading.Lock()
+        self._latencies = []
+        self._max_depth = 0
+        self._dropped = 0
+        self._written_through = 0
+        self._errors = []
+        self._unreported_error = None
+        self._writers = [threading.Thread(target=self._write_loop) for i in range(n_writers)]
+        for writer in self._writers:
+            writer.daemon = True
+            writer.start()
+
+    def _write_loop(self):
+        """Write buffers from the queue to disk until we get ``None``"""
+        while True:
+            item = self._pending.get()
+            if item is None:
+                self._pending.task_done()
+                return
+            buf, queued_time = item
+            try:
+                with open(buf.filename, "wb") as f:
+                    f.write(buf.getbuffer())
+            except Exception as e:
+                print("Error writing {}: {}".format(buf.filename, e))
+                with self._stats_lock:
+                    self._errors.append((buf.filename, e))
+                    if self._unreported_error is None:
+                        self._unreported_error = e
+            with self._stats_lock:
+                self._latencies.append(monotonic() - queued_time)
+            buf.reset()
+            self._free.put(buf)
+            self._pending.task_done()
+
+    def _raise_error(self):
+        """Re-raise the first error from the writers that hasn't been raised yet"""
+        with self._stats_lock:
+            error, self._unreported_error = self._unreported_error, None
+        if error is not None:
+            raise error
+
+    def _get_buffer(self):
+        """Get a free buffer, or None if the back-pressure policy says not to wait"""
+        try:
+            return self._free.get(block=False)
+        except queue.Empty:
+            if self.back_pressure == "block":
+                return self._free.get()
+            return None
+
+    def capture(self, camera, filename, format='jpeg', **kwargs):
+        """Capture an image into a buffer, and queue it to be written to ``filename``
+
+        Keyword arguments are passed to ``camera.capture``.  Returns the size
+        of the capture in bytes, or 0 if it was dropped.  If an earlier capture
+        couldn't be written, its error is raised instead.
+        """
+        self._raise_error()
+        buf = self._get_buffer()
+        if buf is None:
+            if self.back_pressure == "drop":
+                with self._stats_lock:
+                    self._dropped += 1
+                print("No free capture buffers, dropping {}".format(filename))
+                return 0
+            with self._stats_lock:
+                self._written_through += 1
+            camera.capture(filename, format=format, **kwargs)
+            return os.path.getsize(filename)
+        try:
+            camera.capture(buf, format=format, **kwargs)
+        except:
+            buf.reset()
+            self._free.put(buf)
+            raise
+        buf.filename = filename
+        size = buf.length
+        self._pending.put((buf, monotonic()))
+        with self._stats_lock:
+            self._max_depth = max(self._max_depth, self._pending.qsize())
+        return size
+
+    @property
+    def queue_depth(self):
+        """The number of captures waiting to be written"""
+        return self._pending.qsize()
+
+    def stats(self):
+        """Return a dictionary of statistics about the queue.
+
+        ``write_latency`` values are the time (in seconds) from a capture
+        being queued to it being on disk.
+        """
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "queue_depth": self._pending.qsize(),
+                "max_queue_depth": self._max_depth,
+                "written": len(latencies),
+                "dropped": self._dropped,
+                "written_through": self._written_through,
+                "errors": len(self._errors),
+            }
+        if latencies:
+            stats["mean_write_latency"] = sum(latencies) / len(latencies)
+            stats["max_write_latency"] = latencies[-1]
+        return stats
+
+    def close(self, raise_errors=True):
+        """Wait for every queued capture to be written, then stop the writers
+
+        If a capture couldn't be written, and the error hasn't already been
+        raised by :meth:`capture`, it's raised here (unless ``raise_errors``
+        is False).
+        """
+        for writer in self._writers:
+            self._pending.put(None)
+        for writer in self._writers:
+            writer.join()
+        self._writers = []
+        if raise_errors:
+            self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        # Don't hide an exception that's already on its way out
+        self.close(raise_errors=type is None)
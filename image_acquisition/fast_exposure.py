@@ -0,0 +1,162 @@
+"""
+Set the exposure quickly, from small frames on the video port.
+
+Capturing a full still image for every exposure adjustment takes about a
+second, because the camera has to switch to the still port.  Here, small
+(``resize``) RGB frames are recorded from the video port into
+:class:`FrameStatistics`, which keeps a few numbers about each frame.  This
+lets us wait for the camera's automatic exposure to settle, and then adjust the
+shutter speed in a closed loop, in a handful of frames.
+
+Exposure is set from a high percentile of the brightest channel rather than
+its maximum, so a few hot pixels or specular reflections don't pull the
+exposure down.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import threading
+import time
+import numpy as np
+try:
+    from picamera.array import PiRGBAnalysis
+except (ImportError, OSError): # Not on a Raspberry Pi: use the copy in picam_raw_analysis
+    from picam_raw_analysis.picamera_array import PiRGBAnalysis
+
+monotonic = getattr(time, "monotonic", time.time) # Python 2 has no monotonic clock
+
+class FrameStatistics(PiRGBAnalysis):
+    """Keep a robust brightness measurement of each frame, and let us wait for new frames.
+
+    ``percentile`` is the percentile of each channel that is used as its
+    brightness; the brightest channel is recorded in :attr:`brightness`.
+    """
+    def __init__(self, camera, size=None, percentile=99.5):
+        super(FrameStatistics, self).__init__(camera, size=size)
+        self.percentile = percentile
+        self.frame_count = 0
+        self.brightness = None
+        self._condition = threading.Condition()
+
+    def analyze(self, array):
+        brightness = np.max(np.percentile(array.reshape(-1, 3), self.percentile, axis=0))
+        with self._condition:
+            self.brightness = brightness
+            self.frame_count += 1
+            self._condition.notify_all()
+
+    def wait_for_frames(self, n=1, timeout=2.0):
+        """Wait until ``n`` more frames have arrived, and return the latest brightness"""
+        with self._condition:
+            target = self.frame_count + n
+            deadline = monotonic() + timeout
+            while self.frame_count < target:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    raise IOError("Timed out waiting for frames from the camera")
+                self._condition.wait(remaining)
+            return self.brightness
+
+
+def wait_until_settled(camera, statistics, tolerance=0.02, stable_frames=3, timeout=3.0):
+    """Wait for the automatic exposure and white balance to stop changing.
+
+    Returns as soon as ``exposure_speed``, ``analog_gain``, ``digital_gain``
+    and ``awb_gains`` have each changed by less than ``tolerance`` (as a
+    fraction) for ``stable_frames`` frames in a row, or after ``timeout``
+    seconds.  Returns the number of frames we waited.
+    """
+    def settings():
+        return np.array([float(camera.exposure_speed), float(camera.analog_gain),
+                         float(camera.digital_gain)] + [float(g) for g in camera.awb_gains])
+    start = monotonic()
+    previous = settings()
+    stable = 0
+    frames = 0
+    while stable < stable_frames and monotonic() - start < timeout:
+        statistics.wait_for_frames(1)
+        frames += 1
+        current = settings()
+        change = np.max(np.abs(current - previous) / np.maximum(np.abs(previous), 1e-6))
+        stable = stable + 1 if change < tolerance else 0
+        previous = current
+    return frames
+
+def set_shutter_speed(camera, statistics, shutter_speed, max_frames=10):
+    """Change the shutter speed, and return the brightness of the first frame taken with it.
+
+    Changes take a few frames to reach the sensor, so we wait until the
+    camera's ``exposure_speed`` matches (to within 5%), then for one more
+    frame, so the brightness we return was measured with the new setting.
+    """
+    camera.shutter_speed = shutter_speed
+    for i in range(max_frames):
+        statistics.wait_for_frames(1)
+        if abs(camera.exposure_speed - shutter_speed) <= 0.05 * shutter_speed:
+            break
+    return statistics.wait_for_frames(1)
+
+def converge_exposure(camera, statistics, target=230, tolerance=0.03, max_iterations=10,
+                      saturation=250, gamma=2.2):
+    """Adjust the shutter speed until the brightness is within ``tolerance`` of ``target``.
+
+    The camera's exposure mode should already be "off".  Each iteration scales
+    the shutter speed by ``(target / brightness)**gamma``, as the processed
+    image is gamma-encoded (with a gamma of 1 this is the old linear
+    correction used by ``auto_expose_to_white``); if the image is saturated,
+    we can't tell by how much, so the shutter speed is halved instead.  The
+    loop stops early once the brightness is close enough, or if the shutter
+    speed stops changing (e.g. because it has hit a limit).
+
+    Returns a list of (shutter_speed, brightness) for each iteration.
+    """
+    history = []
+    brightness = statistics.wait_for_frames(1)
+    shutter_speed = camera.shutter_speed or camera.exposure_speed
+    for i in range(max_iterations):
+        if abs(brightness - target) <= tolerance * target:
+            break
+        ratio = 0.5 if brightness >= saturation else (target / max(brightness, 1.0))**gamma
+        new_shutter_speed = int(shutter_speed * np.clip(ratio, 0.25, 4.0))
+        if new_shutter_speed == shutter_speed:
+            break
+        shutter_speed = new_shutter_speed
+        brightness = set_shutter_speed(camera, statistics, shutter_speed)
+        history.append((camera.exposure_speed, brightness))
+    return history
+
+def fast_auto_expose(camera, target=230, percentile=99.5, tolerance=0.03, max_iterations=10,
+                     resize=(160, 128), splitter_port=2, gamma=2.2):
+    """Let the camera auto-expose, freeze its settings, then fine-tune the shutter speed.
+
+    Statistics come from ``resize``-d RGB frames recorded from the video port
+    on ``splitter_port``, and ``gamma`` is passed on to ``converge_exposure``.
+    Returns a dictionary describing how long each stage took and how many
+    iterations it needed.
+    """
+    start = monotonic()
+    statistics = FrameStatistics(camera, size=resize, percentile=percentile)
+    camera.start_recording(statistics, format='rgb', resize=resize, splitter_port=splitter_port)
+    try:
+        settle_frames = wait_until_settled(camera, statistics)
+        settle_time = monotonic() - start
+
+        camera.shutter_speed = camera.exposure_speed
+        camera.exposure_mode = "off"
+        g = camera.awb_gains
+        camera.awb_mode = "off"
+        camera.awb_gains = g
+
+        history = converge_exposure(camera, statistics, target, tolerance, max_iterations,
+                                    gamma=gamma)
+        brightness = statistics.wait_for_frames(1)
+    finally:
+        camera.stop_recording(splitter_port=splitter_port)
+        statistics.close()
+    return {"settle_frames": settle_frames,
+            "settle_time": settle_time,
+            "iterations": len(history),
+            "history": history,
+            "brightness": brightness,
+            "shutter_speed": camera.shutter_speed,
+            "total_time": monotonic() - start}
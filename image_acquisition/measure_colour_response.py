@@ -14,14 +14,26 @@ that works reliably with processed images.
 
 """
 import numpy as np
-from picamera import PiCamera
-import neopixel
-from picamera.array import PiRGBArray
+try:
+    from picamera import PiCamera
+    from picamera.array import PiRGBArray
+except (ImportError, OSError): # Not on a Raspberry Pi: only --simulate will work
+    PiCamera = None
+    from picam_raw_analysis.picamera_array import PiRGBArray
 import matplotlib
 matplotlib.use('Agg') # Don't use X in case we're running headless
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.colors import LinearSegmentedColormap
 from set_colour import SingleNeoPixel, ManualIllumination
+from simulated_hardware import SimulatedCamera, SimulatedLED
+from capture_scheduler import CaptureScheduler
+from capture_writer import WriteBehindQueue
+from capture_manifest import CaptureManifest
+from burst_capture import burst_capture, frame_size
+from pretrigger_ring import PreTriggerRing
+from fast_exposure import fast_auto_expose
+from roi_analysis import load_rois, ROIStatisticsRGBAnalysis, ROIStatisticsYUVAnalysis
 from contextlib import closing
 import os.path 
 import time
@@ -43,7 +55,7 @@ def flat_lens_shading_table(camera):
     library (with lens shading table support) it will raise an error.
     """
     print("Checking for lens shading support...", end="")
-    if not hasattr(PiCamera, "lens_shading_table"):
+    if not hasattr(type(camera), "lens_shading_table"):
         print("not present.")
         raise ImportError("This program requires the forked picamera library with lens shading support")
     else:
@@ -55,33 +67,26 @@ def flat_lens_shading_table(camera):
     return lens_shading_table
 
 def auto_expose_to_white(camera, led):
-    """Freeze the settings after auto-exposing to white illumination"""
-    print("Turning on the LED and letting the camera auto-expose", end="")
+    """Freeze the settings after auto-exposing to white illumination
+
+    Exposure is measured on small video-port frames (see fast_exposure), so
+    this returns as soon as the camera has settled and the shutter speed has
+    converged, rather than after a fixed delay.
+    """
+    print("Turning on the LED and letting the camera auto-expose...")
     led.set_rgb(255,255,255)
     camera.start_preview()
-    for i in range(6):
-        print(".", end="")
-        time.sleep(0.5)
-    print("done")
-
-    print("Freezing the camera settings...")
-    camera.shutter_speed = camera.exposure_speed
-    print("Shutter speed = {}".format(camera.shutter_speed))
-    camera.exposure_mode = "off"
-    print("Exposure Mode 'off'")
-    g = camera.awb_gains
-    camera.awb_mode = "off"
-    camera.awb_gains = g
-    print("Auto white balance 'off', AWB gains are {}".format(g))
+    report = fast_auto_expose(camera, target=230)
+    print("Auto-exposure settled after {settle_frames} frames ({settle_time:.2f}s)".format(**report))
+
+    print("Froze the camera settings, with exposure mode 'off'")
+    print("Auto white balance 'off', AWB gains are {}".format(camera.awb_gains))
     print("Analogue gain: {}, Digital gain: {}".format(camera.analog_gain, camera.digital_gain))
     print("Camera iso value: {}".format(camera.iso))
 
-    print("Adjusting shutter speed to avoid saturation", end="")
-    for i in range(3):
-        print(".", end="")
-        camera.shutter_speed = int(camera.shutter_speed * 230.0 / np.max(rgb_image(camera)))
-        time.sleep(1)
-    print("done")
+    print("Adjusted shutter speed to avoid saturation in {iterations} iterations: "
+          "shutter speed = {shutter_speed}, brightness = {brightness:.1f}".format(**report))
+    print("Auto-exposure took {:.2f}s in total".format(report["total_time"]))
 
 def save_settings(camera, output="output/camera_settings.yaml"):
     """Save the camera settings to a YAML file"""
@@ -90,49 +95,94 @@ def save_settings(camera, output="output/camera_settings.yaml"):
     with open(output, "w") as outfile:
         yaml.dump(camera_settings, outfile)
 
+# Settings are applied in this order, as later ones depend on earlier ones: ISO
+# sets the gains, and the gains are frozen when the exposure mode is turned off
+SETTINGS_ORDER = ['awb_mode', 'awb_gains', 'iso', 'analog_gain', 'digital_gain', 'shutter_speed', 'exposure_mode']
+
+def wait_for_camera(camera, timeout=5.0, poll_interval=0.05):
+    """Wait until the camera is delivering frames, i.e. it reports a non-zero exposure and gain"""
+    start = time.time()
+    while time.time() - start < timeout:
+        if camera.exposure_speed > 0 and camera.analog_gain > 0:
+            return time.time() - start
+        time.sleep(poll_interval)
+    print("Warning: the camera hasn't started after {}s".format(timeout))
+    return time.time() - start
+
+def wait_for_settings(camera, settings, tolerance=0.05, stable_polls=3, settle_time=1.0, timeout=5.0, poll_interval=0.05):
+    """Poll the gains and exposure until they match the settings, or stop changing.
+
+    ``analog_gain``, ``digital_gain`` and ``exposure_speed`` (which should
+    match ``shutter_speed``) are compared with the requested values, to within
+    ``tolerance`` as a fraction.  Values that can't reach the requested value
+    (e.g. if the sensor can't provide that gain) count as settled once they
+    have stayed the same for ``stable_polls`` polls in a row.  The camera takes
+    a few frames to start applying new settings, so values only count as
+    stable once they have changed at least once, or after ``settle_time``
+    seconds.  Returns the time taken, in seconds.
+    """
+    targets = [(name, settings.get(name)) for name in ['analog_gain', 'digital_gain']]
+    targets.append(('exposure_speed', settings.get('shutter_speed') or None))
+    start = time.time()
+    initial = previous = None
+    changed = False
+    stable = 0
+    while time.time() - start < timeout:
+        current = [float(getattr(camera, name)) for name, _ in targets]
+        matched = all(v is None or abs(c - float(v)) <= tolerance * float(v)
+                      for c, (_, v) in zip(current, targets))
+        if matched:
+            return time.time() - start
+        if initial is None:
+            initial = current
+        changed = changed or current != initial
+        if changed or time.time() - start >= settle_time:
+            stable = stable + 1 if current == previous else 0
+        if stable >= stable_polls:
+            print("Camera settings stopped changing before reaching the requested values")
+            return time.time() - start
+        previous = current
+        time.sleep(poll_interval)
+    print("Warning: camera settings hadn't settled after {}s".format(timeout))
+    return time.time() - start
+
 def restore_settings(camera, filename, ignore=[]):
-    """Load camera settings from a YAML file"""
-    print("Turning on camera", end="")
+    """Load camera settings from a YAML file
+
+    Settings are applied in SETTINGS_ORDER, and we return as soon as the
+    camera reports that its gains and exposure have settled.
+    """
+    print("Turning on camera...", end="")
     camera.start_preview()
-    for i in range(6):
-        print(".", end="")
-        time.sleep(0.5)
-    print("done")
+    print("started in {:.2f}s".format(wait_for_camera(camera)))
     print("Loading settings from file")
 
     with open(filename, "r") as infile:
         settings = yaml.load(infile, Loader=yaml.UnsafeLoader)
-        for k, v in settings.items():
-            print(k)
-            print(v)
-            if k not in ignore:
-                setattr(camera, k, v)      
-    for i in range(6):
-        print(".", end="")
-        time.sleep(0.5)
-    print("done")
-    print("Shutter speed = {}".format(camera.shutter_speed))
+    ordered = sorted(settings.keys(), key=lambda k: SETTINGS_ORDER.index(k) if k in SETTINGS_ORDER else -1)
+    for k in ordered:
+        print("{}: {}".format(k, settings[k]))
+        if k not in ignore:
+            setattr(camera, k, settings[k])
+    print("Settings settled in {:.2f}s".format(wait_for_settings(camera, {k: v for k, v in settings.items() if k not in ignore})))
+    print("Shutter speed = {} (exposure speed {})".format(camera.shutter_speed, camera.exposure_speed))
     print("Exposure Mode: {}".format(camera.exposure_mode))
-    g = camera.awb_gains
     print("AWB Mode: {}".format(camera.awb_mode))
-    camera.awb_gains = g
-    print("AWB gains: {}".format(g))
+    print("AWB gains: {}".format(camera.awb_gains))
     print("Analogue gain: {}, Digital gain: {}".format(camera.analog_gain, camera.digital_gain))
     print("Camera iso value: {}".format(camera.iso))
-    print("after iso, Analog gain: {}, Digital gain: {}".format(camera.analog_gain, camera.digital_gain))
 
-def measure_response(camera, led, output_prefix, 
-                     rgb_values=[(255,255,255), (255,0,0), (0,255,0), (0,0,255), (0,0,0)]):
-    """Measure the camera's response to different illuminations"""
-    fig, ax = plt.subplots(4, len(rgb_values), figsize=(8,4))
-    for i, rgb in enumerate(rgb_values):
-        print("Setting illumination to {}".format(rgb))
-        led.set_rgb(*rgb)
-        time.sleep(1)
-        print("Capturing raw image")
-        camera.capture(output_prefix + "_r{}_g{}_b{}.jpg".format(*rgb), bayer=True)
-        rgb = rgb_image(camera)
-        channels = ["red", "green", "blue"]
+def render_preview(previews, rgb_values, filename):
+    """Plot each channel of the preview images in a grid, and save it to a file.
+
+    This uses matplotlib's object-oriented interface and the Agg canvas
+    directly (not pyplot), so it can safely run on a background thread.
+    """
+    fig = Figure(figsize=(8,4))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots(4, len(rgb_values), squeeze=False)
+    channels = ["red", "green", "blue"]
+    for i, rgb in enumerate(previews):
         for j, channel in enumerate(channels):
             cm = LinearSegmentedColormap(channel+"map",
                     {c: [(0,0,0),(1,1,1)] if c==channel 
@@ -140,43 +190,86 @@ def measure_response(camera, led, output_prefix,
                         for c in channels})
             ax[j,i].imshow(rgb[:,:,j], vmin=0, vmax=255, cmap=cm)
         ax[3,i].imshow(rgb[:,:,:], vmin=0, vmax=255)
+    fig.savefig(filename)
+    return fig
+
+def measure_response(camera, led, output_prefix, 
+                     rgb_values=[(255,255,255), (255,0,0), (0,255,0), (0,0,255), (0,0,0)],
+                     manifest=None, preview_filename=None, preview_size=(160,128)):
+    """Measure the camera's response to different illuminations
+
+    If a CaptureManifest is given, each image is recorded in it.  If a
+    ``preview_filename`` is given, a small frame is grabbed from the video port
+    alongside each raw image, and once they are all captured a preview is
+    plotted and saved on a background thread.  The thread is returned (or
+    None), so it can be joined before exiting.
+    """
+    previews = []
+    for rgb in rgb_values:
+        print("Setting illumination to {}".format(rgb))
+        led.set_rgb(*rgb)
+        time.sleep(1)
+        print("Capturing raw image")
+        fileName = output_prefix + "_r{}_g{}_b{}.jpg".format(*rgb)
+        camera.capture(fileName, bayer=True)
+        if manifest is not None:
+            manifest.record(fileName, kind="calibration", camera=camera, led=led)
+        if preview_filename is not None:
+            previews.append(rgb_image(camera, resize=preview_size, use_video_port=True))
     led.set_rgb(255,255,255)
-    return fig, ax
-
-def timed_image_capture(camera, output, tDelta, tTotal, imCount):
-    """Captures a series of images at regular interval"""
-    # tDelta is the interval of image capture#
-    # tTotal is the time period over which images are captured
-    nextPictureTime = time.time()
-    fileNames = []
-    
-    lastPictureTime = float(time.time())
-    currPictureTime = float(time.time())
-    collectData = True
+    if preview_filename is None:
+        return None
+    preview_thread = threading.Thread(target=render_preview, args=(previews, rgb_values, preview_filename))
+    preview_thread.start()
+    return preview_thread
+
+def timed_image_capture(camera, output, tDelta, tTotal, imCount, policy="skip", scheduler=None, writer=None,
+                        manifest=None, led=None):
+    """Captures a series of images at regular interval
+
+    tDelta is the interval between captures and tTotal the time period over
+    which images are captured (both in seconds).  Captures are scheduled on a
+    fixed grid by a CaptureScheduler, which sleeps between captures; ``policy``
+    sets what happens if a capture overruns the next slot.  A scheduler may be
+    passed in instead, e.g. to use a fake clock.  If a WriteBehindQueue is
+    given as ``writer``, images are captured into memory and saved to disk in
+    the background, so the interval isn't limited by the speed of the disk.
+
+    Each image is recorded in ``manifest`` (a CaptureManifest) as soon as it
+    has been captured, along with its slot, the camera settings and the
+    colour of ``led``.  If no manifest is given, one is opened in ``output``.
+
+    Returns the list of CaptureSlots that were captured.
+    """
     numPictures = int(np.ceil(tTotal/tDelta))
-    while collectData:
-        if imCount <= numPictures:
-            if time.time() >= nextPictureTime:
-                nextPictureTime += tDelta
-                imCount+=1
-                ct = time.ctime()
-                lastPictureTime = currPictureTime
-                currPictureTime = float(time.time())
-                print ("Image captured at : %s" % ct)
-                timeStr = str(time.time())
-                print( currPictureTime-lastPictureTime )
-                timeStr_connected = timeStr.replace(".", "_")
-                fileName = str(imCount) + "_" + timeStr_connected + ".jpg"
-                fileNames.append(fileName)
-                camera.capture(output + str(imCount)+"_"+ timeStr_connected + ".jpg", bayer=True)
+    if scheduler is None:
+        scheduler = CaptureScheduler(tDelta, numPictures + 1, policy=policy)
+    if manifest is None:
+        with CaptureManifest(output + "manifest.jsonl") as manifest:
+            return timed_image_capture(camera, output, tDelta, tTotal, imCount, policy, scheduler,
+                                       writer, manifest, led)
+    slots = []
+    lastPictureTime = None
+    for slot in scheduler:
+        imCount += 1
+        print("Image captured at : %s" % time.ctime(slot.wall_time))
+        if lastPictureTime is not None:
+            print(slot.actual_time - lastPictureTime)
+        lastPictureTime = slot.actual_time
+        timeStr_connected = str(slot.wall_time).replace(".", "_")
+        fileName = str(imCount) + "_" + timeStr_connected + ".jpg"
+        if writer is not None:
+            size = writer.capture(camera, output + fileName, bayer=True)
+            if not size:
+                continue # the image was dropped because the disk couldn't keep up
         else:
-            collectData = False
-    
-    filepath = os.path.join(output, 'file_names.txt')
-    f = open(filepath, "a")
-    for name in fileNames:
-        f.writelines(name + "\n")
-    f.close()
+            camera.capture(output + fileName, bayer=True)
+            size = None
+        manifest.record(output + fileName, size=size, kind="timed", camera=camera, led=led, slot=slot)
+        slots.append(slot)
+    if len(scheduler.missed) > 0:
+        print("{} capture slots were missed: {}".format(len(scheduler.missed), scheduler.missed))
+    return slots
 
 def main():
     parser = argparse.ArgumentParser(description="Measure the response of the Raspberry Pi camera to different illuminations")
@@ -187,17 +280,42 @@ def main():
     parser.add_argument("--settings_file", help="Load settings from a file", default=None)
     parser.add_argument("--skip_calibration", action="store_true", help="Skips the WRGB calibration sequence and auto_expose. Use this after a calibration run in conjunction with saved settings.")
     parser.add_argument("--timed_data", nargs="*", type=float, help="Requires two arguments 'x y'. Takes an image with static camera settings every 'x' seconds for 'y' seconds and saves raw data.", default = [])
+    parser.add_argument("--write_buffers", type=int, default=4, help="Number of images from a timed capture that may be held in memory while they are written to disk in the background.  Set to 0 to write each image to disk before taking the next.")
+    parser.add_argument("--back_pressure", choices=WriteBehindQueue.POLICIES, default="block", help="What to do in a timed capture if all the write buffers are full: 'block' until one is written, 'drop' the image, or 'write_through' directly to disk.")
+    parser.add_argument("--burst", type=int, default=0, help="Capture a burst of this many frames as fast as possible, with frozen settings, e.g. to follow fast diffusion events.")
+    parser.add_argument("--burst_format", choices=["yuv", "rgb", "jpeg"], default="yuv", help="Format for --burst: unencoded 'yuv' or 'rgb' frames from the video port (fastest), or 'jpeg' frames including raw data from the still port.")
+    parser.add_argument("--burst_resize", nargs=2, type=int, default=None, help="Resize unencoded --burst frames to this width and height.")
+    parser.add_argument("--pretrigger", nargs=2, type=int, default=None, help="Requires two arguments 'before after'. Record unencoded frames continuously (using --burst_format and --burst_resize), and each time you press enter, save the 'before' frames preceding it and the 'after' frames following it.")
+    parser.add_argument("--roi_stats", help="A YAML file of regions of interest.  Record unencoded frames (using --burst_format and --burst_resize) for --roi_duration seconds, saving only the colour-corrected mean of each region in each frame.")
+    parser.add_argument("--roi_calibration", help="The unmixing matrices (a YAML file from picam_raw_analysis.unmixing_matrix) used to correct --roi_stats.")
+    parser.add_argument("--roi_duration", type=float, default=60, help="How long to record --roi_stats for, in seconds.")
+    parser.add_argument("--roi_save_every", type=int, default=0, help="Also save every Nth full frame while recording --roi_stats (default 0, none).")
+    parser.add_argument("--simulate", action="store_true", help="Use a simulated camera and LED, so the whole acquisition can run without a Raspberry Pi (e.g. to test it, or to measure its timing).")
+    parser.add_argument("--simulated_capture_time", type=float, default=0.5, help="How long (in seconds) each still capture takes with --simulate.")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for the noise in --simulate images, for reproducible runs.")
+    parser.add_argument("--missed_slot_policy", choices=CaptureScheduler.POLICIES, default="skip", help="What to do in a timed capture if an image takes longer than the interval: 'skip' the missed slots, 'catch_up' by capturing them immediately, or 'shift' the remaining captures later.")
     args = parser.parse_args()
 
+    if args.simulate:
+        simulated_led = SimulatedLED()
+        def open_camera(**kwargs):
+            return SimulatedCamera(simulated_led, capture_time=args.simulated_capture_time, seed=args.seed, **kwargs)
+        open_led = lambda: simulated_led
+    else:
+        if PiCamera is None:
+            parser.error("The picamera library isn't available; use --simulate to run without a Raspberry Pi")
+        open_camera = PiCamera
+        open_led = ManualIllumination if args.manual_illumination else SingleNeoPixel
+
     # First turn off lens shading correction
-    with PiCamera() as cam:
+    with open_camera() as cam:
         flat_lens_shading = flat_lens_shading_table(cam)
     # Loading this lens shading table requires restarting the camera
-    with PiCamera(lens_shading_table=flat_lens_shading, resolution=(640,480)) as camera, \
-         (ManualIllumination() if args.manual_illumination else SingleNeoPixel()) as led:
+    with open_camera(lens_shading_table=flat_lens_shading, resolution=(640,480)) as camera, \
+         open_led() as led, \
+         CaptureManifest(args.output + "manifest.jsonl") as manifest:
         # Load settings from a file
         if args.settings_file is not None:
-            time.sleep(1)
             restore_settings(camera, args.settings_file)
             
 
@@ -209,16 +327,19 @@ def main():
         save_settings(camera, args.output + "camera_settings.yaml")
         
         # Acquire images under red, green, and blue illumination
+        preview_thread = None
         if not args.skip_calibration:
             print("Taking measurement")
-            fig, ax = measure_response(camera, led, args.output + "capture")
-            plt.savefig(args.output + "preview.pdf")
+            preview_thread = measure_response(camera, led, args.output + "capture", manifest=manifest,
+                                              preview_filename=args.output + "preview.pdf")
 
         if len(args.additional_images) > 0:
             print("Taking additional images")
             for name in args.additional_images:
                 input("Please set up for image '{}' and press enter.".format(name))
-                camera.capture(args.output + "additional_image_" + name + ".jpg", bayer=True)
+                fileName = args.output + "additional_image_" + name + ".jpg"
+                camera.capture(fileName, bayer=True)
+                manifest.record(fileName, kind="additional", camera=camera, name=name)
                 
         
         if len(args.timed_data)==2:
@@ -227,12 +348,69 @@ def main():
             input("Preparing to take images every '{}' seconds for '{}' seconds. Press enter to begin".format(tDelta,tTotal) )
             print ("Data collection begun at : %s" % time.ctime())
             
-            timed_image_capture(camera, args.output, tDelta, tTotal,0)
+            if args.write_buffers > 0:
+                with WriteBehindQueue(args.write_buffers, back_pressure=args.back_pressure) as writer:
+                    timed_image_capture(camera, args.output, tDelta, tTotal, 0,
+                                        policy=args.missed_slot_policy, writer=writer,
+                                        manifest=manifest, led=led)
+                    print("Waiting for {} images to be written to disk".format(writer.queue_depth))
+                print("Write queue statistics: {}".format(writer.stats()))
+            else:
+                timed_image_capture(camera, args.output, tDelta, tTotal, 0, policy=args.missed_slot_policy,
+                                    manifest=manifest, led=led)
                
             
             print ("Data collection completed at : %s" % time.ctime())
 
-            
+        if args.burst > 0:
+            input("Preparing to capture a burst of {} '{}' frames. Press enter to begin".format(args.burst, args.burst_format))
+            use_video_port = args.burst_format != "jpeg"
+            ring = burst_capture(camera, args.burst, format=args.burst_format,
+                                 use_video_port=use_video_port, resize=args.burst_resize)
+            stats = ring.stats(camera.framerate if use_video_port else None)
+            print("Captured {frames} frames at {achieved_framerate:.1f} frames per second".format(**stats))
+            if "dropped" in stats:
+                print("{} frames were dropped (nominal framerate {})".format(stats["dropped"], camera.framerate))
+            ring.save(args.output + "burst_", args.burst_format)
+
+        if args.pretrigger is not None:
+            if args.burst_format == "jpeg":
+                parser.error("--pretrigger needs an unencoded --burst_format, as it records from the video port")
+            before, after = args.pretrigger
+            resolution = args.burst_resize or camera.resolution
+            # One more buffer than the window, for the frame arriving as it's saved
+            ring = PreTriggerRing(camera, before + after + 1, frame_size(resolution, args.burst_format))
+            camera.start_recording(ring, format=args.burst_format, resize=args.burst_resize)
+            try:
+                event = 0
+                while input("Recording: press enter to save an event, or type 'q' and enter to stop. ") != "q":
+                    filenames = ring.dump(args.output + "event{}_".format(event), args.burst_format,
+                                          before=before, after=after, timeout=10)
+                    print("Saved {} frames around event {}".format(len(filenames), event))
+                    event += 1
+            finally:
+                camera.stop_recording()
+            print("Pre-trigger ring statistics: {}".format(ring.stats()))
+
+        if args.roi_stats is not None:
+            if args.burst_format == "jpeg" or args.roi_calibration is None:
+                parser.error("--roi_stats needs --roi_calibration, and an unencoded --burst_format")
+            with open(args.roi_calibration, "r") as infile:
+                calibration = yaml.load(infile, Loader=yaml.UnsafeLoader)
+            analysis_class = ROIStatisticsYUVAnalysis if args.burst_format == "yuv" else ROIStatisticsRGBAnalysis
+            input("Preparing to record ROI statistics for '{}' seconds. Press enter to begin".format(args.roi_duration))
+            with analysis_class(camera, calibration, load_rois(args.roi_stats), args.output + "roi_stats.tsv",
+                                size=args.burst_resize, save_every=args.roi_save_every) as analysis:
+                camera.start_recording(analysis, format=args.burst_format, resize=args.burst_resize)
+                try:
+                    camera.wait_recording(args.roi_duration)
+                finally:
+                    camera.stop_recording()
+            print("Recorded statistics from {} frames".format(analysis.frame_count))
+
+        if preview_thread is not None:
+            preview_thread.join() # Make sure the preview has been saved before we exit
+
 
 if __name__ == "__main__":
     main()
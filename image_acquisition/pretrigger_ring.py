@@ -0,0 +1,156 @@
+"""
+Keep the last few seconds of unencoded frames, and save a window around an event.
+
+Dye often enters a pore before we notice, so by the time a capture is started
+the interesting part is over.  :class:`PreTriggerRing` is an output for
+``camera.start_recording`` (with an unencoded format such as 'yuv' or 'rgb')
+that keeps the most recent frames in a fixed ring of preallocated buffers, much
+as ``picamera.PiCameraCircularIO`` does for H.264 video.  Nothing is allocated
+per frame, so it can run for hours.  When something happens, :meth:`dump` saves
+the frames from just before the trigger, waits for the frames just after it,
+and writes only that window to disk:
+
+.. code-block:: python
+
+    ring = PreTriggerRing(camera, 101, frame_size(camera.resolution, 'yuv'))
+    camera.start_recording(ring, format='yuv')
+    ...
+    ring.dump("output/event_", 'yuv', before=50, after=50)
+
+The video port can't provide Bayer data, so frames are the camera's processed
+YUV or RGB output; freeze the camera settings (and use a flat lens shading
+table) first if the frames are to be used quantitatively.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import threading
+import time
+from capture_writer import CaptureBuffer
+from burst_capture import save_frames
+
+monotonic = getattr(time, "monotonic", time.time) # Python 2 has no monotonic clock
+
+class PreTriggerRing(object):
+    """A file-like output that keeps the most recent frames of a recording.
+
+    camera: picamera.PiCamera
+        The camera that will record to the ring.  This is used to find out
+        where each frame ends, as in ``picamera.PiCameraCircularIO``.
+    n_buffers: int
+        The number of frames to keep.  This must be more than ``before +
+        after`` in :meth:`dump`, as one buffer is needed for the frame which
+        is arriving as the window is saved.
+    buffer_size: int
+        The size of each frame in bytes (see ``burst_capture.frame_size``).
+    splitter_port: int
+        The splitter port passed to ``camera.start_recording``.
+    clock: function
+        Used to timestamp frames; defaults to :func:`time.monotonic`.
+    """
+    def __init__(self, camera, n_buffers, buffer_size, splitter_port=1, clock=monotonic):
+        self.camera = camera
+        self.splitter_port = splitter_port
+        self.clock = clock
+        self.buffers = [CaptureBuffer(buffer_size) for i in range(n_buffers)]
+        self._times = [None] * n_buffers
+        self._condition = threading.Condition()
+        self.start_time = clock()
+        self.frame_count = 0 # the number of complete frames written so far
+        self.discarded = 0 # frames that arrived while a window was being saved
+        self._in_frame = False
+        self._paused = False
+        self._discarding = False
+
+    def _frame_complete(self):
+        return self.camera._encoders[self.splitter_port].frame.complete
+
+    def write(self, b):
+        """Copy part of a frame into the ring, moving on when the frame is complete"""
+        complete = self._frame_complete()
+        with self._condition:
+            if self._discarding:
+                if complete:
+                    self.discarded += 1
+                    # If dump() has finished, start again with the next frame
+                    self._discarding = self._paused
+                return len(b)
+            slot = self.frame_count % len(self.buffers)
+            if not self._in_frame:
+                self.buffers[slot].reset()
+                self._in_frame = True
+            self.buffers[slot].write(b)
+            if complete:
+                self._times[slot] = self.clock() - self.start_time
+                self.frame_count += 1
+                self._in_frame = False
+                self._condition.notify_all()
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def frames(self, first=None, last=None):
+        """Frames held in the ring, as (index, time, buffer) tuples, oldest first.
+
+        ``first`` and ``last`` optionally limit the range of frame indices
+        (``last`` is exclusive), and are clipped to the frames that are held.
+        """
+        with self._condition:
+            n = len(self.buffers)
+            first = max(0, self.frame_count - n, first or 0)
+            last = self.frame_count if last is None else min(last, self.frame_count)
+            return [(i, self._times[i % n], self.buffers[i % n]) for i in range(first, last)]
+
+    def dump(self, output_prefix, format, before, after=0, timeout=None):
+        """Save the frames around a trigger, which happens when this is called.
+
+        output_prefix: string
+            Frames are saved as ``<output_prefix><index>`` with a list of their
+            times, as in ``burst_capture.save_frames``.
+        format: string
+            The format passed to ``camera.start_recording``.
+        before: int
+            The number of frames from before the trigger to save.
+        after: int
+            The number of frames to wait for and save after the trigger.
+        timeout: float
+            The longest time to wait for the frames after the trigger; if it
+            runs out, only the frames received so far are saved.
+
+        While the window is written to disk, new frames are not stored (they
+        are counted in :attr:`discarded`) so the window can't be overwritten.
+        Returns the list of filenames.
+        """
+        # A frame may already be arriving (into the slot after the window)
+        # when the ring is paused, so it mustn't share a slot with the window
+        if before + after >= len(self.buffers):
+            raise ValueError("The ring holds {} frames, so can save at most {} around the trigger, "
+                             "not {} before and {} after".format(
+                                 len(self.buffers), len(self.buffers) - 1, before, after))
+        with self._condition:
+            trigger = self.frame_count
+            deadline = None if timeout is None else monotonic() + timeout
+            while self.frame_count < trigger + after:
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    print("Timed out waiting for frames after the trigger: got {} of {}".format(
+                        self.frame_count - trigger, after))
+                    break
+                self._condition.wait(remaining)
+            self._paused = True
+            self._discarding = True
+            self._in_frame = False
+            window = self.frames(trigger - before, trigger + after)
+        try:
+            return save_frames(window, output_prefix, format)
+        finally:
+            with self._condition:
+                self._paused = False
+
+    def stats(self):
+        """Return a dictionary of statistics about the frames received"""
+        with self._condition:
+            return {"frames": self.frame_count,
+                    "held": min(self.frame_count, len(self.buffers)),
+                    "discarded": self.discarded}
@@ -0,0 +1,171 @@
+"""
+Colour-corrected statistics of a few regions of interest, measured live.
+
+Often we only need the mean colour and intensity in a few pores over time, so
+saving every full-resolution raw image and processing it later is mostly
+wasted effort.  The analysis outputs here are used with
+``camera.start_recording`` (format 'rgb' or 'yuv'): for each frame they pick
+out the pixels in each region of interest (ROI), correct just those pixels for
+vignetting and colour crosstalk using a calibration from
+``picam_raw_analysis.unmixing_matrix``, and append one line per ROI to a small
+tab-separated time series.  Full frames are saved only every ``save_every``
+frames, so a run produces kilobytes rather than gigabytes, and the latest
+results are available while it is still running (in ``latest``).
+
+The calibration is measured from raw images, while these frames have been
+processed by the camera, so freeze the camera settings and use a flat lens
+shading table (as ``measure_colour_response`` does) to keep the processing as
+close to linear as possible.  The white image is only used for its relative
+shape (vignetting), and corrected values are scaled so that a white pixel at
+the brightest point of the white image is about 1.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import os
+import time
+import numpy as np
+import yaml
+try:
+    from picamera.array import PiRGBAnalysis, PiYUVAnalysis
+except (ImportError, OSError): # Not on a Raspberry Pi: use the copy in picam_raw_analysis
+    from picam_raw_analysis.picamera_array import PiRGBAnalysis, PiYUVAnalysis
+
+monotonic = getattr(time, "monotonic", time.time) # Python 2 has no monotonic clock
+
+# YUV to RGB conversion (ITU-R BT.601), as used by picamera.array.PiYUVArray
+YUV_OFFSET = np.array([16, 128, 128], dtype=np.float32)
+YUV_TO_RGB = np.array([[1.164,  0.000,  1.596],
+                       [1.164, -0.392, -0.813],
+                       [1.164,  2.017,  0.000]], dtype=np.float32)
+
+def load_rois(filename):
+    """Load regions of interest from a YAML file.
+
+    Each entry maps a name either to a rectangle ``[x, y, width, height]`` in
+    frame pixels, or to the filename of a boolean mask saved with ``np.save``
+    (relative to the YAML file).
+    """
+    with open(filename, "r") as infile:
+        rois = yaml.safe_load(infile)
+    folder = os.path.dirname(filename)
+    return {name: np.load(os.path.join(folder, roi)) if isinstance(roi, str) else tuple(roi)
+            for name, roi in rois.items()}
+
+def roi_mask(roi, shape):
+    """Convert a rectangle ``(x, y, width, height)`` or a mask to a boolean mask of the given shape"""
+    if isinstance(roi, tuple):
+        x, y, w, h = roi
+        mask = np.zeros(shape[:2], dtype=bool)
+        mask[y:y + h, x:x + w] = True
+        return mask
+    mask = np.asarray(roi, dtype=bool)
+    if mask.shape != tuple(shape[:2]):
+        raise ValueError("A mask of shape {} doesn't match frames of shape {}".format(mask.shape, shape[:2]))
+    return mask
+
+def interpolate_grid(grid, ys, xs, shape):
+    """Bilinearly interpolate a calibration grid at the given pixel coordinates.
+
+    The grid is assumed to cover the whole frame, of the given (height, width),
+    with its elements centred on blocks of pixels as in ``unmix_image``.
+    """
+    gy = np.clip((ys + 0.5) * grid.shape[0] / shape[0] - 0.5, 0, grid.shape[0] - 1)
+    gx = np.clip((xs + 0.5) * grid.shape[1] / shape[1] - 0.5, 0, grid.shape[1] - 1)
+    y0 = np.minimum(gy.astype(int), grid.shape[0] - 2)
+    x0 = np.minimum(gx.astype(int), grid.shape[1] - 2)
+    fy = (gy - y0).reshape((-1,) + (1,) * (grid.ndim - 2))
+    fx = (gx - x0).reshape((-1,) + (1,) * (grid.ndim - 2))
+    return ((1 - fy) * (1 - fx) * grid[y0, x0] + (1 - fy) * fx * grid[y0, x0 + 1] +
+            fy * (1 - fx) * grid[y0 + 1, x0] + fy * fx * grid[y0 + 1, x0 + 1])
+
+
+class ROIStatisticsMixin(object):
+    """Correct the pixels in each ROI, and record their statistics.
+
+    camera: picamera.PiCamera
+        The camera that is recording.
+    calibration: dict
+        A calibration with ``unmixing_matrices`` and ``white_image``, e.g. as
+        loaded from the YAML file saved by ``picam_raw_analysis.unmixing_matrix``.
+    rois: dict
+        Regions of interest, keyed by name (see :func:`load_rois`).
+    output: string
+        The filename of the time series.  It is appended to (with a header
+        only if it's new), and flushed after every frame.
+    size: tuple
+        The (width, height) frames are resized to, if not the camera's resolution.
+    save_every: int
+        If given, every ``save_every``-th frame is saved in full (as a numpy
+        array) alongside the time series.  Zero saves no frames.
+    """
+    def __init__(self, camera, calibration, rois, output, size=None, save_every=0, clock=monotonic):
+        super(ROIStatisticsMixin, self).__init__(camera, size=size)
+        self.calibration = calibration
+        self.rois = rois
+        self.output = output
+        self.save_every = save_every
+        self.clock = clock
+        self.frame_count = 0
+        self.latest = {}
+        self._roi_pixels = None
+        self._start_time = clock()
+        self._outfile = open(output, "a")
+        if self._outfile.tell() == 0:
+            self._outfile.write("# frame\ttime\troi\tpixels\tR\tG\tB\tintensity\tintensity_std\n")
+
+    def _prepare(self, shape):
+        """Work out the pixels and corrections for each ROI, for frames of this shape"""
+        unmixing_matrices = np.asarray(self.calibration["unmixing_matrices"], dtype=np.float32)
+        white_image = np.asarray(self.calibration["white_image"], dtype=np.float32)
+        white_image = white_image / np.max(white_image)
+        self._roi_pixels = {}
+        for name, roi in self.rois.items():
+            ys, xs = np.nonzero(roi_mask(roi, shape))
+            self._roi_pixels[name] = (
+                (ys, xs),
+                interpolate_grid(unmixing_matrices, ys, xs, shape) / 255,
+                1 / interpolate_grid(white_image, ys, xs, shape),
+            )
+
+    def to_rgb(self, pixels):
+        """Convert an Nx3 array of pixels from the output format to RGB"""
+        return pixels
+
+    def analyze(self, array):
+        if self._roi_pixels is None:
+            self._prepare(array.shape)
+        t = self.clock() - self._start_time
+        for name, (indices, unmixing_matrices, norm_to_white) in sorted(self._roi_pixels.items()):
+            pixels = self.to_rgb(array[indices].astype(np.float32)) * norm_to_white
+            corrected = np.einsum('nij,nj->ni', unmixing_matrices, pixels)
+            colour = np.mean(corrected, axis=0)
+            intensity = np.mean(corrected, axis=1)
+            self.latest[name] = (t, colour, np.mean(intensity))
+            self._outfile.write("{}\t{:.6f}\t{}\t{}\t{:.5f}\t{:.5f}\t{:.5f}\t{:.5f}\t{:.5f}\n".format(
+                self.frame_count, t, name, len(indices[0]), colour[0], colour[1], colour[2],
+                np.mean(intensity), np.std(intensity)))
+        # Make the results available as they're recorded, and safe if we crash
+        self._outfile.flush()
+        if self.save_every and self.frame_count % self.save_every == 0:
+            np.save("{}_frame{:06d}.npy".format(os.path.splitext(self.output)[0], self.frame_count), array)
+        self.frame_count += 1
+
+    def close(self):
+        if not self._outfile.closed:
+            self._outfile.close()
+        super(ROIStatisticsMixin, self).close()
+
+
+class ROIStatisticsRGBAnalysis(ROIStatisticsMixin, PiRGBAnalysis):
+    """Record ROI statistics from frames recorded with ``format='rgb'``"""
+
+
+class ROIStatisticsYUVAnalysis(ROIStatisticsMixin, PiYUVAnalysis):
+    """Record ROI statistics from frames recorded with ``format='yuv'``
+
+    Only the pixels in the ROIs are converted to RGB, so this is usually faster
+    than recording RGB frames.
+    """
+    def to_rgb(self, pixels):
+        return np.clip((pixels - YUV_OFFSET).dot(YUV_TO_RGB.T), 0, 255)
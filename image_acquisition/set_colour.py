@@ -1,16 +1,22 @@
 import time
 from basic_serial_instrument import BasicSerialInstrument
 from argparse import ArgumentParser
-import board
-import neopixel
+try:
+    import board
+    import neopixel
+except (ImportError, NotImplementedError): # Not on a Raspberry Pi; use simulated_hardware.SimulatedLED
+    board = neopixel = None
 
 
 
 class SingleNeoPixel(BasicSerialInstrument):
-    pixel_pin = board.D10
+    pixel_pin = board.D10 if board is not None else None
     num_pixels = 1
-    ORDER = neopixel.GRB
+    ORDER = neopixel.GRB if neopixel is not None else None
+    rgb = None # The last colour we set
     def __init__(self, *args, **kwargs):
+        if neopixel is None:
+            raise ImportError("The NeoPixel needs the board and neopixel modules, which only work on a Raspberry Pi")
         BasicSerialInstrument.__init__(self, *args, **kwargs)
         self.pixels =  neopixel.NeoPixel(
             self.pixel_pin, self.num_pixels, auto_write = False, pixel_order=self.ORDER, brightness=1)
@@ -21,11 +27,15 @@ class SingleNeoPixel(BasicSerialInstrument):
         """
         self.pixels[0] = (r,g,b)
         self.pixels.show()
+        self.rgb = (r,g,b)
         #self.query("set_rgb {} {} {}\n".format(r,g,b))
 
 class ManualIllumination():
+    rgb = None # The last colour we asked for
+
     def set_rgb(self, r, g, b):
         input("Please set the illumination to {} {} {} and press enter".format(r,g,b))
+        self.rgb = (r,g,b)
         
     def __enter__(self):
         """When we use this in a with statement, it should be opened already"""
@@ -0,0 +1,484 @@
+"""
+Simulated camera and LED, so the acquisition scripts can run without a Raspberry Pi.
+
+:class:`SimulatedCamera` implements the parts of the ``PiCamera`` interface that
+these scripts use: still captures (JPEG, with raw Bayer data appended in the
+same format as the real camera if ``bayer=True``, or unencoded RGB/YUV), video
+port captures and sequences, unencoded recordings to file-like or analysis
+outputs, the exposure, gain and white balance settings, and the lens shading
+table.  :class:`SimulatedLED` stands in for the NeoPixel, and the camera looks
+at whatever colour it is set to.
+
+The image model is simple but has the features that matter for calibration:
+
+    * the sensor's four Bayer channels respond to the LED's red, green and blue
+      through a ``crosstalk`` matrix,
+    * each channel has its own radial ``vignetting``,
+    * the raw signal scales with exposure time and analogue gain, on top of a
+      black level of 64, with shot and read noise, clipped to 10 bits,
+    * processed images apply white balance, lens shading gains and gamma.
+
+Still captures take ``capture_time`` seconds, and video port frames arrive at
+the ``framerate``, so timing and throughput can be measured reproducibly on any
+computer that can simulate the images faster than that.  Use ``seed`` to make
+the noise reproducible too.  Raw files can be read by
+``picam_raw_analysis.extract_raw_image.load_raw_image``, so the analysis
+scripts can be run on simulated data.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import ctypes as ct
+import io
+import threading
+import time
+from collections import namedtuple
+from fractions import Fraction
+import numpy as np
+
+FULL_RESOLUTION = (3280, 2464)
+BLACK_LEVEL = 64
+WHITE_LEVEL = 1023
+# The raw data is the last RAW_PAYLOAD_SIZE bytes of a JPEG+RAW capture, with a
+# header RAW_HEADER_OFFSET bytes in, and pixels starting at RAW_DATA_OFFSET
+RAW_PAYLOAD_SIZE = 10270208
+RAW_HEADER_OFFSET = 176
+RAW_DATA_OFFSET = 32768
+RAW_PADDING_DOWN = 16 # extra rows of raw data, which make it fill the payload
+# Positions of the R, G, G, B pixels in each 2x2 block (Bayer order 0)
+BAYER_OFFSETS = ((0, 0), (1, 0), (0, 1), (1, 1))
+# Response of the R, Gr, Gb and B channels to the LED's red, green and blue
+DEFAULT_CROSSTALK = ((1.0, 0.15, 0.05),
+                     (0.2, 1.0, 0.25),
+                     (0.2, 1.0, 0.25),
+                     (0.05, 0.2, 0.9))
+UNITY_GAIN = 32 # lens shading table value for a gain of 1
+
+class BroadcomRawHeader(ct.Structure):
+    """The header of the raw data, as read by ``picamera.array.PiBayerArray``"""
+    _fields_ = [
+        ('name',          ct.c_char * 32),
+        ('width',         ct.c_uint16),
+        ('height',        ct.c_uint16),
+        ('padding_right', ct.c_uint16),
+        ('padding_down',  ct.c_uint16),
+        ('dummy',         ct.c_uint32 * 6),
+        ('transform',     ct.c_uint16),
+        ('format',        ct.c_uint16),
+        ('bayer_order',   ct.c_uint8),
+        ('bayer_format',  ct.c_uint8),
+        ]
+
+SimulatedFrame = namedtuple('SimulatedFrame', ('index', 'timestamp', 'complete'))
+
+class SimulatedEncoder(object):
+    """Holds the metadata of the latest frame, like a ``PiVideoEncoder``"""
+    def __init__(self):
+        self.frame = SimulatedFrame(-1, None, True)
+
+
+def pad_resolution(resolution):
+    """Round (width, height) up to a multiple of 32x16, as for unencoded output"""
+    width, height = resolution
+    return (width + 31) // 32 * 32, (height + 15) // 16 * 16
+
+def pack_raw_10bit(raw, padding_down=RAW_PADDING_DOWN):
+    """Pack a 2D array of 10-bit values into the camera's raw format.
+
+    Each group of 4 pixels is stored as 5 bytes: the high 8 bits of each, then
+    a byte containing the low 2 bits of all four.  Rows are padded to a
+    multiple of 32 bytes, and ``padding_down`` rows are added at the bottom
+    (before rounding up to a multiple of 16), as the camera does.
+    """
+    height, width = raw.shape
+    raw = raw.astype(np.uint16)
+    packed_width = width * 5 // 4
+    padded_width = (packed_width + 31) // 32 * 32
+    packed = np.zeros(((height + padding_down + 15) // 16 * 16, padded_width), dtype=np.uint8)
+    for byte in range(4):
+        packed[:height, byte:packed_width:5] = raw[:, byte::4] >> 2
+    packed[:height, 4:packed_width:5] = ((raw[:, 0::4] & 3) << 6 | (raw[:, 1::4] & 3) << 4 |
+                                         (raw[:, 2::4] & 3) << 2 | (raw[:, 3::4] & 3))
+    return packed
+
+def raw_payload(raw):
+    """The raw data appended to a JPEG, in the format of the v2 camera module"""
+    height, width = raw.shape
+    header = BroadcomRawHeader()
+    header.name = b'imx219'
+    header.width = width
+    header.height = height
+    header.padding_down = RAW_PADDING_DOWN
+    header.bayer_order = 0
+    payload = bytearray(RAW_PAYLOAD_SIZE)
+    payload[:4] = b'BRCM'
+    payload[RAW_HEADER_OFFSET:RAW_HEADER_OFFSET + ct.sizeof(header)] = bytearray(header)
+    data = pack_raw_10bit(raw).tobytes()
+    payload[RAW_DATA_OFFSET:RAW_DATA_OFFSET + len(data)] = data
+    return bytes(payload)
+
+def encode_jpeg(rgb):
+    """Encode an RGB image as a JPEG, using PIL or OpenCV if either is available.
+
+    If neither is, we return an empty JPEG (start and end markers only), which
+    is enough for anything that only reads the raw data.
+    """
+    try:
+        import PIL.Image
+        output = io.BytesIO()
+        PIL.Image.fromarray(rgb).save(output, format='jpeg')
+        return output.getvalue()
+    except ImportError:
+        pass
+    try:
+        import cv2
+        return cv2.imencode('.jpg', rgb[:, :, ::-1])[1].tobytes()
+    except ImportError:
+        return b'\xff\xd8\xff\xd9'
+
+def rgb_to_yuv420(rgb):
+    """Convert a padded RGB image to planar YUV 4:2:0 bytes (ITU-R BT.601)"""
+    rgb = rgb.astype(np.float32)
+    y = 16 + 0.257 * rgb[..., 0] + 0.504 * rgb[..., 1] + 0.098 * rgb[..., 2]
+    u = 128 - 0.148 * rgb[..., 0] - 0.291 * rgb[..., 1] + 0.439 * rgb[..., 2]
+    v = 128 + 0.439 * rgb[..., 0] - 0.368 * rgb[..., 1] - 0.071 * rgb[..., 2]
+    def quarter(plane):
+        return (plane[0::2, 0::2] + plane[0::2, 1::2] + plane[1::2, 0::2] + plane[1::2, 1::2]) / 4
+    planes = [y, quarter(u), quarter(v)]
+    return b''.join(np.clip(np.round(p), 0, 255).astype(np.uint8).tobytes() for p in planes)
+
+
+class SimulatedLED(object):
+    """A stand-in for ``set_colour.SingleNeoPixel``.
+
+    settle_time: float
+        Time (in seconds) that ``set_rgb`` takes, to mimic the real hardware.
+    """
+    def __init__(self, settle_time=0.0):
+        self.settle_time = settle_time
+        self.rgb = (0, 0, 0)
+
+    def set_rgb(self, r, g, b):
+        """Set the colour of the (simulated) illumination, range 0-255"""
+        time.sleep(self.settle_time)
+        self.rgb = (r, g, b)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+
+class SimulatedCamera(object):
+    """A software stand-in for ``picamera.PiCamera`` with the v2 camera module.
+
+    illumination: SimulatedLED
+        The light source the camera is looking at.  If it's None, the camera
+        sees white light.
+    resolution, framerate, lens_shading_table:
+        As for ``PiCamera``.
+    vignetting: tuple
+        The fractional drop in brightness at the corners, for R, G and B.
+    crosstalk: array
+        A 4x3 matrix: the response of the R, Gr, Gb and B channels to the red,
+        green and blue light.
+    sensitivity: float
+        Raw signal (above the black level) per microsecond of exposure, at the
+        centre, for a fully-on LED channel with a gain of 1.
+    read_noise: float
+        Standard deviation of the noise added to raw values, on top of shot
+        noise (with one electron per raw unit).
+    capture_time: float
+        Time (in seconds) that each still capture takes.
+    seed: int
+        Seed for the random noise, to make runs reproducible.
+    """
+    MAX_RESOLUTION = FULL_RESOLUTION
+    revision = 'IMX219'
+
+    def __init__(self, illumination=None, resolution=(640, 480), framerate=30,
+                 lens_shading_table=None, vignetting=(0.55, 0.45, 0.6), crosstalk=DEFAULT_CROSSTALK,
+                 sensitivity=0.04, read_noise=2.0, gamma=2.2, capture_time=0.5, seed=None):
+        self.illumination = illumination
+        self.resolution = tuple(resolution)
+        self.framerate = framerate
+        self.sensor_mode = 0
+        self.vignetting = np.array(vignetting, dtype=float)[[0, 1, 1, 2]]
+        self.crosstalk = np.array(crosstalk, dtype=float)
+        self.sensitivity = sensitivity
+        self.read_noise = read_noise
+        self.gamma = gamma
+        self.capture_time = capture_time
+        self.iso = 0
+        self.shutter_speed = 0
+        self._exposure_mode = 'auto'
+        self._awb_mode = 'auto'
+        self._frozen_exposure = None
+        self._analog_gain = Fraction(1)
+        self._digital_gain = Fraction(1)
+        self._awb_gains = None
+        self._random = np.random.RandomState(seed)
+        self._start_time = time.time() # frames from the video port are timed from here
+        self._lock = threading.Lock()
+        self._encoders = {}
+        self._recordings = {}
+        self._vignettes = {}
+        self._lst_gains = {}
+        self.lens_shading_table = lens_shading_table
+        self.closed = False
+
+    # Settings
+    def _lens_shading_table_shape(self, sensor_mode=None):
+        return (4,) + tuple([(r // 64) + 1 for r in self.MAX_RESOLUTION[::-1]])
+
+    @property
+    def lens_shading_table(self):
+        return self._lens_shading_table
+
+    @lens_shading_table.setter
+    def lens_shading_table(self, table):
+        if isinstance(table, dict): # tables for several sensor modes
+            table = table.get(self.sensor_mode)
+        if table is not None:
+            table = np.asarray(table, dtype=np.uint8)
+            if table.shape != self._lens_shading_table_shape():
+                raise ValueError("The lens shading table should have shape {}".format(
+                    self._lens_shading_table_shape()))
+        self._lens_shading_table = table
+        self._lst_gains = {}
+
+    def _led_response(self):
+        """The raw signal per microsecond in each channel, at the centre of the sensor"""
+        rgb = self.illumination.rgb if self.illumination is not None else (255, 255, 255)
+        return self.crosstalk.dot(np.array(rgb, dtype=float) / 255) * self.sensitivity
+
+    def _auto_exposure(self):
+        """The exposure time (in us) auto-exposure would choose: about a third of full scale"""
+        brightest = max(np.max(self._led_response()), 1e-6)
+        return int(min(1e6 / self.framerate, (WHITE_LEVEL - BLACK_LEVEL) / 3 / brightest))
+
+    @property
+    def exposure_speed(self):
+        if self.shutter_speed:
+            return int(min(self.shutter_speed, 1e6 / self.framerate))
+        if self._exposure_mode == 'off' and self._frozen_exposure is not None:
+            return self._frozen_exposure
+        return self._auto_exposure()
+
+    @property
+    def exposure_mode(self):
+        return self._exposure_mode
+
+    @exposure_mode.setter
+    def exposure_mode(self, value):
+        if value == 'off':
+            self._frozen_exposure = self.exposure_speed
+        self._exposure_mode = value
+
+    @property
+    def analog_gain(self):
+        return self._analog_gain
+
+    @analog_gain.setter
+    def analog_gain(self, value):
+        self._analog_gain = Fraction(value).limit_denominator(256)
+
+    @property
+    def digital_gain(self):
+        return self._digital_gain
+
+    @digital_gain.setter
+    def digital_gain(self, value):
+        self._digital_gain = Fraction(value).limit_denominator(256)
+
+    @property
+    def awb_mode(self):
+        return self._awb_mode
+
+    @awb_mode.setter
+    def awb_mode(self, value):
+        if value == 'off' and self._awb_gains is None:
+            self._awb_gains = self.awb_gains
+        self._awb_mode = value
+
+    @property
+    def awb_gains(self):
+        if self._awb_mode == 'off' and self._awb_gains is not None:
+            return self._awb_gains
+        # Balance the centre of the image to grey
+        r, g1, g2, b = np.maximum(self._led_response(), 1e-6)
+        g = (g1 + g2) / 2
+        return (Fraction(min(g / r, 8)).limit_denominator(256),
+                Fraction(min(g / b, 8)).limit_denominator(256))
+
+    @awb_gains.setter
+    def awb_gains(self, value):
+        if not isinstance(value, tuple):
+            value = (value, value)
+        self._awb_gains = tuple(Fraction(v).limit_denominator(256) for v in value)
+
+    # The image model
+    def _vignette(self, shape):
+        """The relative brightness of each channel, sampled on a (height, width) grid"""
+        if shape not in self._vignettes:
+            h, w = shape
+            y = (np.arange(h) + 0.5) / h * 2 - 1
+            x = (np.arange(w) + 0.5) / w * 2 - 1
+            r2 = (y[:, np.newaxis]**2 + x[np.newaxis, :]**2) / 2
+            self._vignettes[shape] = 1 - r2[:, :, np.newaxis] * self.vignetting[np.newaxis, np.newaxis, :]
+        return self._vignettes[shape]
+
+    def _raw_channels(self, shape):
+        """Simulated raw values of the R, Gr, Gb and B channels on a (height, width) grid"""
+        gain = float(self.analog_gain) * self.exposure_speed
+        signal = self._vignette(shape) * (self._led_response() * gain)[np.newaxis, np.newaxis, :]
+        noise = np.sqrt(signal + self.read_noise**2)
+        raw = BLACK_LEVEL + signal + noise * self._random.standard_normal(signal.shape)
+        return np.clip(np.round(raw), 0, WHITE_LEVEL)
+
+    def _lens_shading_gains(self, shape):
+        """Bilinearly interpolate the lens shading table onto a (height, width) grid"""
+        if self._lens_shading_table is None:
+            return 1
+        if shape not in self._lst_gains:
+            gains = self._lens_shading_table.astype(float) / UNITY_GAIN
+            for axis, n, full in ((1, shape[0], FULL_RESOLUTION[1]), (2, shape[1], FULL_RESOLUTION[0])):
+                coords = (np.arange(n) + 0.5) * full / n
+                position = np.clip((coords - 32) / 64, 0, gains.shape[axis] - 1)
+                i = np.minimum(position.astype(int), gains.shape[axis] - 2)
+                f = position - i
+                fshape = [1, 1, 1]
+                fshape[axis] = -1
+                gains = (np.take(gains, i, axis=axis) * (1 - f).reshape(fshape)
+                         + np.take(gains, i + 1, axis=axis) * f.reshape(fshape))
+            self._lst_gains[shape] = np.stack([gains[0], (gains[1] + gains[2]) / 2, gains[3]], axis=2)
+        return self._lst_gains[shape]
+
+    def _processed_image(self, resolution):
+        """A processed 8-bit RGB image, of the given (width, height)"""
+        shape = (resolution[1], resolution[0])
+        raw = self._raw_channels(shape) - BLACK_LEVEL
+        linear = np.stack([raw[..., 0], (raw[..., 1] + raw[..., 2]) / 2, raw[..., 3]], axis=2)
+        red_gain, blue_gain = self.awb_gains
+        white_balance = np.array([float(red_gain), 1, float(blue_gain)])
+        linear *= white_balance * float(self.digital_gain) / (WHITE_LEVEL - BLACK_LEVEL)
+        linear *= self._lens_shading_gains(shape)
+        return (255 * np.clip(linear, 0, 1)**(1 / self.gamma)).astype(np.uint8)
+
+    def _raw_image(self):
+        """A full-resolution raw Bayer image"""
+        width, height = FULL_RESOLUTION
+        channels = self._raw_channels((height // 2, width // 2))
+        raw = np.empty((height, width), dtype=np.uint16)
+        for c, (dy, dx) in enumerate(BAYER_OFFSETS):
+            raw[dy::2, dx::2] = channels[..., c]
+        return raw
+
+    def _encode(self, format, resolution, bayer=False):
+        """Produce the bytes of a capture in the given format"""
+        if format == 'jpeg':
+            data = encode_jpeg(self._processed_image(resolution))
+            if bayer:
+                data += raw_payload(self._raw_image())
+            return data
+        padded = pad_resolution(resolution)
+        rgb = np.zeros((padded[1], padded[0], 3), dtype=np.uint8)
+        rgb[:resolution[1], :resolution[0]] = self._processed_image(resolution)
+        if format == 'yuv':
+            return rgb_to_yuv420(rgb)
+        if format in ('rgb', 'bgr', 'rgba', 'bgra'):
+            if format.startswith('bgr'):
+                rgb = rgb[..., ::-1]
+            if format.endswith('a'):
+                rgb = np.concatenate([rgb, np.full(rgb.shape[:2] + (1,), 255, dtype=np.uint8)], axis=2)
+            return rgb.tobytes()
+        raise ValueError("The simulated camera can't produce '{}' output".format(format))
+
+    # Capturing
+    def start_preview(self, **options):
+        pass
+
+    def stop_preview(self):
+        pass
+
+    def capture(self, output, format=None, use_video_port=False, resize=None, splitter_port=0,
+                bayer=False, **options):
+        """Capture an image to a filename or file-like object, as ``PiCamera.capture`` does"""
+        if format is None:
+            name = output if isinstance(output, str) else getattr(output, 'name', '')
+            format = {'jpg': 'jpeg'}.get(name.rsplit('.', 1)[-1].lower(), 'jpeg')
+        start = time.time()
+        with self._lock:
+            data = self._encode(format, tuple(resize or self.resolution), bayer and not use_video_port)
+        if use_video_port: # wait for the next frame
+            period = 1.0 / self.framerate
+            ready = self._start_time + np.ceil((start - self._start_time) / period) * period
+        else:
+            ready = start + self.capture_time
+        time.sleep(max(0, ready - time.time()))
+        if isinstance(output, str):
+            with open(output, 'wb') as f:
+                f.write(data)
+        else:
+            output.write(data)
+            if hasattr(output, 'flush'):
+                output.flush()
+
+    def capture_sequence(self, outputs, format='jpeg', use_video_port=False, resize=None,
+                         splitter_port=0, burst=False, bayer=False, **options):
+        """Capture a sequence of images, as ``PiCamera.capture_sequence`` does"""
+        for output in outputs:
+            self.capture(output, format, use_video_port, resize, splitter_port, bayer, **options)
+
+    def start_recording(self, output, format=None, resize=None, splitter_port=1, **options):
+        """Record unencoded frames to a file-like object on a background thread"""
+        if format not in ('yuv', 'rgb', 'bgr', 'rgba', 'bgra'):
+            raise ValueError("The simulated camera can only record unencoded formats, not '{}'".format(format))
+        if splitter_port in self._recordings:
+            raise RuntimeError("The camera is already recording on port {}".format(splitter_port))
+        encoder = self._encoders[splitter_port] = SimulatedEncoder()
+        stop = threading.Event()
+        errors = []
+        def record():
+            start = time.time()
+            index = 0
+            try:
+                while not stop.wait(max(0, start + (index + 1) / self.framerate - time.time())):
+                    with self._lock:
+                        data = self._encode(format, tuple(resize or self.resolution))
+                    encoder.frame = SimulatedFrame(index, int((time.time() - start) * 1e6), True)
+                    output.write(data)
+                    index += 1
+            except Exception as e:
+                errors.append(e)
+        thread = threading.Thread(target=record)
+        thread.daemon = True
+        self._recordings[splitter_port] = (thread, stop, errors)
+        thread.start()
+
+    def wait_recording(self, timeout=0, splitter_port=1):
+        """Wait, re-raising any error from the recording"""
+        time.sleep(timeout)
+        errors = self._recordings[splitter_port][2]
+        if errors:
+            raise errors[0]
+
+    def stop_recording(self, splitter_port=1):
+        thread, stop, errors = self._recordings.pop(splitter_port)
+        stop.set()
+        thread.join()
+        del self._encoders[splitter_port]
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        for splitter_port in list(self._recordings):
+            self.stop_recording(splitter_port)
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
@@ -0,0 +1,9 @@
+"""
+The acquisition scripts aren't a package, so make them importable from the tests.
+
+Released under GNU GPL v3
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,103 @@
+"""
+Tests for burst_capture, using a fake camera and clock.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import os
+import random
+import pytest
+from burst_capture import FrameRing, burst_capture as capture_burst, frame_size
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 10.0
+
+    def __call__(self):
+        return self.now
+
+def frame_data(i, size):
+    return bytes(bytearray([i % 256])) * size
+
+class FakeCamera(object):
+    """Writes each frame of a sequence in randomly sized chunks, one frame per period"""
+    resolution = (64, 48)
+
+    def __init__(self, clock, size, period=0.1, gaps=(), seed=0):
+        self.clock = clock
+        self.size = size
+        self.period = period
+        self.gaps = gaps # frames after which the camera drops a frame
+        self.random = random.Random(seed)
+        self.kwargs = None
+
+    def capture_sequence(self, outputs, format='jpeg', **kwargs):
+        self.kwargs = dict(kwargs, format=format)
+        for i, output in enumerate(outputs):
+            data = frame_data(i, self.size)
+            start = 0
+            while start < len(data):
+                end = min(len(data), start + self.random.randint(1, self.size // 3))
+                output.write(data[start:end])
+                start = end
+            self.clock.now += self.period * (2 if i in self.gaps else 1)
+
+def fill(n_buffers, n_frames, size=30, **kwargs):
+    clock = FakeClock()
+    ring = FrameRing(n_buffers, size, clock=clock)
+    FakeCamera(clock, size, **kwargs).capture_sequence(ring.outputs(n_frames))
+    return ring
+
+def test_frames_without_wraparound():
+    ring = fill(5, 3)
+    frames = ring.frames()
+    assert [i for i, t, buf in frames] == [0, 1, 2]
+    for i, t, buf in frames:
+        assert buf.getbuffer().tobytes() == frame_data(i, 30)
+        assert t == pytest.approx(0.1 * (i + 1))
+
+def test_wraparound():
+    ring = fill(4, 11)
+    frames = ring.frames()
+    assert [i for i, t, buf in frames] == [7, 8, 9, 10]
+    # Each buffer holds exactly one frame, however it was split into chunks
+    for i, t, buf in frames:
+        assert buf.getbuffer().tobytes() == frame_data(i, 30)
+        assert buf is ring.buffers[i % 4]
+    assert all(len(buf._data) == 30 for buf in ring.buffers)
+    stats = ring.stats(framerate=10)
+    assert (stats["frames"], stats["overwritten"], stats["dropped"]) == (11, 7, 0)
+    assert stats["achieved_framerate"] == pytest.approx(10)
+
+def test_dropped_frames():
+    stats = fill(4, 11, gaps=(3, 6)).stats(framerate=10)
+    assert stats["dropped"] == 2
+    assert stats["duration"] == pytest.approx(1.2)
+
+def test_save_frames(tmpdir):
+    ring = fill(3, 5)
+    prefix = str(tmpdir.join("burst_"))
+    filenames = ring.save(prefix, "yuv")
+    assert [os.path.basename(f) for f in filenames] == ["burst_00002.yuv", "burst_00003.yuv", "burst_00004.yuv"]
+    for i, filename in zip((2, 3, 4), filenames):
+        with open(filename, "rb") as f:
+            assert f.read() == frame_data(i, 30)
+    with open(prefix + "times.txt") as f:
+        rows = [line.rstrip("\n").split("\t") for line in f]
+    assert [(name, int(i)) for name, i, t in rows] == [
+        ("burst_00002.yuv", 2), ("burst_00003.yuv", 3), ("burst_00004.yuv", 4)]
+    assert [float(t) for name, i, t in rows] == pytest.approx([0.3, 0.4, 0.5])
+
+def test_burst_capture():
+    size = frame_size((64, 48), 'yuv')
+    camera = FakeCamera(FakeClock(), size)
+    ring = capture_burst(camera, 6, format='yuv', ring_size=4)
+    assert camera.kwargs == {"format": "yuv", "use_video_port": True, "resize": None}
+    assert [i for i, t, buf in ring.frames()] == [2, 3, 4, 5]
+    assert ring.frames()[0][2].getbuffer().tobytes() == frame_data(2, size)
+    with pytest.raises(ValueError):
+        capture_burst(camera, 6, format='jpeg', use_video_port=True)
+
+def test_frame_size():
+    assert frame_size((64, 48), 'yuv') == 64 * 48 * 3 // 2
+    assert frame_size((100, 75), 'rgb') == 128 * 80 * 3
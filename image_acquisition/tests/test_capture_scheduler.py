@@ -0,0 +1,82 @@
+"""
+Tests for capture_scheduler, using a fake clock.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import pytest
+from capture_scheduler import CaptureScheduler
+
+class FakeClock(object):
+    """A clock which only moves when something sleeps or works"""
+    def __init__(self, start=100.0):
+        self.now = start
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def run(policy, durations, interval=1.0, count=6):
+    """Capture with a fake clock; durations[i] is how long the i-th capture takes"""
+    clock = FakeClock()
+    scheduler = CaptureScheduler(interval, count, policy, clock=clock, sleep=clock.sleep,
+                                 wall_clock=lambda: 1000 + clock.now)
+    slots = []
+    for slot in scheduler:
+        slots.append(slot)
+        clock.now += durations[len(slots) - 1]
+    return scheduler, slots
+
+def approx(values):
+    return pytest.approx(values, abs=1e-9)
+
+def test_on_time():
+    scheduler, slots = run("skip", [0.2] * 6)
+    assert [s.index for s in slots] == list(range(6))
+    assert [s.actual_time for s in slots] == approx([0, 1, 2, 3, 4, 5])
+    assert [s.nominal_time for s in slots] == approx([0, 1, 2, 3, 4, 5])
+    assert slots[2].wall_time == approx(1102)
+    assert scheduler.missed == []
+
+def test_skip():
+    # The second capture overruns into slot 3
+    scheduler, slots = run("skip", [0.2, 2.5, 0.2, 0.2, 0.2, 0.2])
+    assert [s.index for s in slots] == [0, 1, 4, 5]
+    assert [s.actual_time for s in slots] == approx([0, 1, 4, 5])
+    assert [s.nominal_time for s in slots] == approx([0, 1, 4, 5])
+    assert [i for i, late in scheduler.missed] == [2, 3]
+    assert [late for i, late in scheduler.missed] == approx([1.5, 0.5])
+
+def test_skip_within_tolerance():
+    # Slightly late slots are released, and aren't counted as missed
+    scheduler, slots = run("skip", [0.2, 1.05, 0.2, 0.2, 0.2, 0.2])
+    assert [s.index for s in slots] == list(range(6))
+    assert slots[2].actual_time == approx(2.05)
+    assert scheduler.missed == []
+
+def test_catch_up():
+    scheduler, slots = run("catch_up", [0.2, 2.5, 0.2, 0.2, 0.2, 0.2])
+    assert [s.index for s in slots] == list(range(6))
+    assert [s.actual_time for s in slots] == approx([0, 1, 3.5, 3.7, 4, 5])
+    assert [s.nominal_time for s in slots] == approx([0, 1, 2, 3, 4, 5])
+    assert [i for i, late in scheduler.missed] == [2, 3]
+    assert [late for i, late in scheduler.missed] == approx([1.5, 0.7])
+
+def test_shift():
+    scheduler, slots = run("shift", [0.2, 2.5, 0.2, 0.2, 0.2, 0.2])
+    assert [s.index for s in slots] == list(range(6))
+    assert [s.actual_time for s in slots] == approx([0, 1, 3.5, 4.5, 5.5, 6.5])
+    # The late slot's nominal time includes its own shift
+    assert [s.nominal_time for s in slots] == approx([0, 1, 3.5, 4.5, 5.5, 6.5])
+    assert [i for i, late in scheduler.missed] == [2]
+    assert [late for i, late in scheduler.missed] == approx([1.5])
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        CaptureScheduler(1.0, 5, policy="wait")
+    with pytest.raises(ValueError):
+        CaptureScheduler(0, 5)
@@ -0,0 +1,129 @@
+"""
+Tests for capture_writer.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import io
+import os
+import threading
+import time
+import pytest
+import capture_writer
+from capture_writer import CaptureBuffer, WriteBehindQueue
+
+class FakeCamera(object):
+    """Captures a numbered image, and remembers which outputs it was given"""
+    def __init__(self, size=100):
+        self.size = size
+        self.count = 0
+        self.outputs = []
+
+    def capture(self, output, format='jpeg', **kwargs):
+        self.outputs.append(output)
+        data = bytes(bytearray([self.count % 256])) * self.size
+        self.count += 1
+        if isinstance(output, str):
+            with open(output, "wb") as f:
+                f.write(data)
+        else:
+            output.write(data)
+
+@pytest.fixture
+def written(monkeypatch):
+    """Record the files the writers open, in order, and make each write slow"""
+    order = []
+    real_open = io.open
+    def slow_open(filename, mode="r"):
+        time.sleep(0.01)
+        order.append(os.path.basename(filename))
+        return real_open(filename, mode)
+    monkeypatch.setattr(capture_writer, "open", slow_open, raising=False)
+    return order
+
+def read(path):
+    with open(str(path), "rb") as f:
+        return f.read()
+
+def test_capture_buffer():
+    buf = CaptureBuffer(4)
+    assert buf.write(b"abc") == 3
+    assert buf.write(b"defg") == 4 # grows the buffer
+    assert buf.getbuffer().tobytes() == b"abcdefg"
+    buf.filename = "x.jpeg"
+    buf.reset()
+    assert buf.getbuffer().tobytes() == b""
+    assert buf.filename is None
+    buf.write(b"hi")
+    assert buf.getbuffer().tobytes() == b"hi"
+
+def test_fifo_and_drain_on_close(tmpdir, written):
+    camera = FakeCamera()
+    names = ["{}.jpeg".format(i) for i in range(10)]
+    writer = WriteBehindQueue(n_buffers=3, buffer_size=100)
+    for name in names:
+        assert writer.capture(camera, str(tmpdir.join(name))) == 100
+    writer.close()
+    assert written == names
+    for i, name in enumerate(names):
+        assert read(tmpdir.join(name)) == bytes(bytearray([i])) * 100
+    stats = writer.stats()
+    assert stats["written"] == 10
+    assert stats["queue_depth"] == 0
+    assert 1 <= stats["max_queue_depth"] <= 3
+
+def test_buffers_are_recycled(tmpdir, written):
+    camera = FakeCamera()
+    with WriteBehindQueue(n_buffers=2, buffer_size=100) as writer:
+        for i in range(8):
+            writer.capture(camera, str(tmpdir.join("{}.jpeg".format(i))))
+    assert len(set(id(output) for output in camera.outputs)) == 2
+    # Each buffer is emptied before it is reused, so it never grows
+    assert all(len(output._data) == 100 for output in camera.outputs)
+
+@pytest.mark.parametrize("policy, dropped, written_through", [("drop", 2, 0), ("write_through", 0, 2)])
+def test_back_pressure(tmpdir, monkeypatch, policy, dropped, written_through):
+    # Hold up the writer, so the only buffer isn't freed
+    unblock = threading.Event()
+    real_open = io.open
+    def blocked_open(filename, mode="r"):
+        unblock.wait()
+        return real_open(filename, mode)
+    monkeypatch.setattr(capture_writer, "open", blocked_open, raising=False)
+    camera = FakeCamera()
+    writer = WriteBehindQueue(n_buffers=1, buffer_size=100, back_pressure=policy)
+    sizes = [writer.capture(camera, str(tmpdir.join("{}.jpeg".format(i)))) for i in range(3)]
+    unblock.set()
+    writer.close()
+    assert sizes == ([100, 0, 0] if policy == "drop" else [100, 100, 100])
+    stats = writer.stats()
+    assert (stats["dropped"], stats["written_through"]) == (dropped, written_through)
+    assert len(tmpdir.listdir()) == 3 - dropped
+
+def test_error_raised_by_next_capture(tmpdir):
+    camera = FakeCamera()
+    writer = WriteBehindQueue(n_buffers=2, buffer_size=100)
+    writer.capture(camera, str(tmpdir.join("missing", "0.jpeg")))
+    while writer.stats()["written"] < 1:
+        time.sleep(0.001)
+    with pytest.raises(IOError):
+        writer.capture(camera, str(tmpdir.join("1.jpeg")))
+    # The error is only raised once, and the queue still works
+    writer.capture(camera, str(tmpdir.join("2.jpeg")))
+    writer.close()
+    assert writer.stats()["errors"] == 1
+    assert os.path.exists(str(tmpdir.join("2.jpeg")))
+
+def test_error_raised_by_close(tmpdir):
+    camera = FakeCamera()
+    writer = WriteBehindQueue(n_buffers=2, buffer_size=100)
+    writer.capture(camera, str(tmpdir.join("missing", "0.jpeg")))
+    with pytest.raises(IOError):
+        writer.close()
+
+def test_close_does_not_hide_exceptions(tmpdir):
+    camera = FakeCamera()
+    with pytest.raises(KeyboardInterrupt):
+        with WriteBehindQueue(n_buffers=2, buffer_size=100) as writer:
+            writer.capture(camera, str(tmpdir.join("missing", "0.jpeg")))
+            raise KeyboardInterrupt()
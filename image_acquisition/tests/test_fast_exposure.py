@@ -0,0 +1,32 @@
+"""
+Tests for fast_exposure, using the simulated camera.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import pytest
+from simulated_hardware import SimulatedCamera, SimulatedLED
+
+# fast_exposure needs PiRGBAnalysis, from either picamera or picam_raw_analysis
+fast_exposure = pytest.importorskip("fast_exposure")
+
+def auto_expose(seed, **kwargs):
+    led = SimulatedLED()
+    led.set_rgb(255, 255, 255)
+    camera = SimulatedCamera(led, seed=seed)
+    try:
+        return fast_exposure.fast_auto_expose(camera, target=230, **kwargs)
+    finally:
+        camera.close()
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_converges_within_tolerance(seed):
+    report = auto_expose(seed)
+    assert abs(report["brightness"] - 230) <= 0.03 * 230
+    assert report["iterations"] <= 2
+
+def test_gamma_correction_needs_fewer_iterations():
+    linear = auto_expose(0, gamma=1.0)
+    corrected = auto_expose(0)
+    assert abs(linear["brightness"] - 230) <= 0.03 * 230
+    assert corrected["iterations"] < linear["iterations"]
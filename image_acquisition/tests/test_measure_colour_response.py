@@ -0,0 +1,92 @@
+"""
+Tests for the camera settings helpers in measure_colour_response, using a fake
+camera and clock.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import pytest
+
+# measure_colour_response needs PiRGBArray, from either picamera or picam_raw_analysis
+measure_colour_response = pytest.importorskip("measure_colour_response")
+
+class FakeTime(object):
+    """Stands in for the time module, so waiting takes no real time"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class RampingCamera(object):
+    """A camera whose gains and exposure only start moving after ``delay``
+
+    They then ramp linearly from ``initial`` to ``final`` over ``ramp`` seconds.
+    """
+    def __init__(self, clock, initial, final, delay=0.3, ramp=0.5):
+        self.clock = clock
+        self.start = clock.now
+        self.initial = initial
+        self.final = final
+        self.delay = delay
+        self.ramp = ramp
+
+    def _value(self, name):
+        fraction = (self.clock.now - self.start - self.delay) / self.ramp
+        fraction = min(max(fraction, 0), 1)
+        return self.initial[name] + fraction * (self.final[name] - self.initial[name])
+
+    analog_gain = property(lambda self: self._value('analog_gain'))
+    digital_gain = property(lambda self: self._value('digital_gain'))
+    exposure_speed = property(lambda self: self._value('exposure_speed'))
+
+INITIAL = {'analog_gain': 1.0, 'digital_gain': 1.0, 'exposure_speed': 10000}
+SETTINGS = {'analog_gain': 4.0, 'digital_gain': 2.0, 'shutter_speed': 30000}
+FINAL = {'analog_gain': 4.0, 'digital_gain': 2.0, 'exposure_speed': 30000}
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(measure_colour_response, "time", clock)
+    return clock
+
+def test_waits_for_delayed_ramp(clock):
+    camera = RampingCamera(clock, INITIAL, FINAL)
+    elapsed = measure_colour_response.wait_for_settings(camera, SETTINGS)
+    # The values are within 5% of the targets near the end of the ramp
+    assert 0.75 < elapsed <= 0.85
+    assert camera.analog_gain == pytest.approx(4.0, rel=0.05)
+    assert camera.exposure_speed == pytest.approx(30000, rel=0.05)
+
+def test_unreachable_values_settle_after_changing(clock, capsys):
+    reachable = dict(FINAL, analog_gain=3.0) # e.g. the sensor's maximum gain
+    camera = RampingCamera(clock, INITIAL, reachable)
+    elapsed = measure_colour_response.wait_for_settings(camera, SETTINGS)
+    # Three polls without change, once the ramp is finished
+    assert 0.8 <= elapsed <= 1.05
+    assert "stopped changing" in capsys.readouterr().out
+
+def test_values_that_never_change_settle_after_settle_time(clock, capsys):
+    camera = RampingCamera(clock, INITIAL, INITIAL)
+    elapsed = measure_colour_response.wait_for_settings(camera, SETTINGS, settle_time=1.0)
+    assert 1.0 <= elapsed <= 1.25
+    assert "stopped changing" in capsys.readouterr().out
+
+def test_returns_immediately_when_matched(clock):
+    camera = RampingCamera(clock, FINAL, FINAL)
+    assert measure_colour_response.wait_for_settings(camera, SETTINGS) == 0
+
+def test_ignores_settings_that_are_not_given(clock):
+    camera = RampingCamera(clock, INITIAL, dict(FINAL, digital_gain=1.0))
+    settings = {'analog_gain': 4.0, 'shutter_speed': 0}
+    elapsed = measure_colour_response.wait_for_settings(camera, settings)
+    assert 0.75 < elapsed <= 0.85
+
+def test_timeout(clock, capsys):
+    camera = RampingCamera(clock, INITIAL, FINAL, delay=0, ramp=100)
+    elapsed = measure_colour_response.wait_for_settings(camera, SETTINGS, timeout=2.0)
+    assert elapsed == pytest.approx(2.0, abs=0.06)
+    assert "hadn't settled" in capsys.readouterr().out
@@ -0,0 +1,100 @@
+"""
+Tests for pretrigger_ring, using a fake camera.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import os
+import threading
+import time
+from collections import namedtuple
+import pytest
+from pretrigger_ring import PreTriggerRing
+
+Frame = namedtuple("Frame", "complete")
+
+class FakeEncoder(object):
+    frame = Frame(False)
+
+class FakeCamera(object):
+    """Records frames to an output in two chunks each, like an encoder"""
+    def __init__(self):
+        self._encoders = {1: FakeEncoder()}
+        self.index = 0
+
+    def chunk(self, output, complete):
+        self._encoders[1].frame = Frame(complete)
+        output.write(frame_data(self.index, complete))
+        if complete:
+            self.index += 1
+
+    def record_frames(self, output, n):
+        for i in range(n):
+            self.chunk(output, False)
+            self.chunk(output, True)
+
+def frame_data(index, second_half):
+    return bytes(bytearray([index % 256, int(second_half)])) * 5
+
+def saved(filenames):
+    """The frame data saved in each file, keyed by frame index"""
+    contents = {}
+    for filename in filenames:
+        with open(filename, "rb") as f:
+            contents[int(os.path.basename(filename).split("_")[1].split(".")[0])] = f.read()
+    return contents
+
+def expected(indices):
+    return {i: frame_data(i, False) + frame_data(i, True) for i in indices}
+
+def test_window_must_leave_a_spare_buffer(tmpdir):
+    ring = PreTriggerRing(FakeCamera(), 4, 10)
+    with pytest.raises(ValueError):
+        ring.dump(str(tmpdir.join("event_")), "yuv", before=4)
+    with pytest.raises(ValueError):
+        ring.dump(str(tmpdir.join("event_")), "yuv", before=2, after=2)
+
+def test_partial_frame_when_dumped(tmpdir):
+    # The next frame has started arriving when the trigger happens, so its
+    # first chunk is already in the ring; it mustn't overwrite the window
+    camera = FakeCamera()
+    ring = PreTriggerRing(camera, 4, 10)
+    camera.record_frames(ring, 10)
+    camera.chunk(ring, False)
+    filenames = ring.dump(str(tmpdir.join("event_")), "yuv", before=3)
+    assert saved(filenames) == expected([7, 8, 9])
+    # The rest of the partial frame is discarded, and recording carries on
+    camera.chunk(ring, True)
+    camera.record_frames(ring, 2)
+    assert ring.stats() == {"frames": 12, "held": 4, "discarded": 1}
+    assert [i for i, t, buf in ring.frames()] == [8, 9, 10, 11]
+    assert ring.frames()[-1][2].getbuffer().tobytes() == frame_data(12, False) + frame_data(12, True)
+
+def test_frames_arriving_during_dump(tmpdir):
+    camera = FakeCamera()
+    ring = PreTriggerRing(camera, 6, 10)
+    camera.record_frames(ring, 10)
+    stop = threading.Event()
+    def record():
+        while not stop.is_set():
+            camera.chunk(ring, False)
+            time.sleep(0.001)
+            camera.chunk(ring, True)
+    thread = threading.Thread(target=record)
+    thread.start()
+    try:
+        filenames = ring.dump(str(tmpdir.join("event_")), "yuv", before=3, after=2, timeout=5)
+    finally:
+        stop.set()
+        thread.join()
+    trigger = min(saved(filenames)) + 3
+    assert saved(filenames) == expected(range(trigger - 3, trigger + 2))
+    with open(str(tmpdir.join("event_times.txt"))) as f:
+        assert len(f.readlines()) == 5
+
+def test_timeout(tmpdir):
+    camera = FakeCamera()
+    ring = PreTriggerRing(camera, 6, 10)
+    camera.record_frames(ring, 3)
+    filenames = ring.dump(str(tmpdir.join("event_")), "yuv", before=2, after=2, timeout=0.01)
+    assert saved(filenames) == expected([1, 2])
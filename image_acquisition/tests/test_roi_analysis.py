@@ -0,0 +1,96 @@
+"""
+Tests for roi_analysis, feeding it synthetic frames.
+
+Released under GNU GPL v3
+"""
+from __future__ import print_function, division
+import numpy as np
+import pytest
+
+# roi_analysis needs the analysis outputs, from either picamera or picam_raw_analysis
+roi_analysis = pytest.importorskip("roi_analysis")
+
+class FakeCamera(object):
+    resolution = (64, 48)
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 5.0
+
+    def __call__(self):
+        return self.now
+
+def flat_calibration():
+    """A calibration that only scales pixels to the range 0-1"""
+    return {"unmixing_matrices": np.tile(np.eye(3), (6, 8, 1, 1)),
+            "white_image": np.full((6, 8, 3), 800.0)}
+
+ROIS = {"left": (0, 0, 10, 8), "right": (40, 20, 4, 5)}
+
+def rgb_frame(step):
+    """An RGB frame whose left and right halves are different colours"""
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    frame[:, :32] = (51 + step, 102, 153)
+    frame[:, 32:] = (255, 0, 51)
+    return frame
+
+def read_rows(path):
+    with open(str(path)) as f:
+        lines = f.read().splitlines()
+    return [line for line in lines if line.startswith("#")], [line.split("\t") for line in lines if not line.startswith("#")]
+
+def test_rgb_rows(tmpdir):
+    path = tmpdir.join("roi_stats.tsv")
+    clock = FakeClock()
+    analysis = roi_analysis.ROIStatisticsRGBAnalysis(
+        FakeCamera(), flat_calibration(), ROIS, str(path), save_every=2, clock=clock)
+    try:
+        for step in range(3):
+            clock.now += 0.5
+            analysis.write(rgb_frame(step).tobytes())
+            # Each frame is on disk as soon as it has been analysed
+            headers, rows = read_rows(path)
+            assert len(rows) == 2 * (step + 1)
+    finally:
+        analysis.close()
+    headers, rows = read_rows(path)
+    assert headers == ["# frame\ttime\troi\tpixels\tR\tG\tB\tintensity\tintensity_std"]
+    assert [(r[0], r[2], r[3]) for r in rows] == [
+        (str(i), name, str(n)) for i in range(3) for name, n in (("left", 80), ("right", 20))]
+    for i in range(3):
+        left, right = rows[2 * i], rows[2 * i + 1]
+        assert float(left[1]) == pytest.approx(0.5 * (i + 1))
+        expected = np.array([51 + i, 102, 153]) / 255
+        assert [float(v) for v in left[4:7]] == pytest.approx(expected, abs=1e-5)
+        assert float(left[7]) == pytest.approx(expected.mean(), abs=1e-5)
+        assert float(left[8]) == pytest.approx(0, abs=1e-5)
+        assert [float(v) for v in right[4:7]] == pytest.approx([1, 0, 0.2], abs=1e-5)
+    assert sorted(p.basename for p in tmpdir.listdir()) == [
+        "roi_stats.tsv", "roi_stats_frame000000.npy", "roi_stats_frame000002.npy"]
+    assert analysis.latest["right"][1] == pytest.approx([1, 0, 0.2], abs=1e-5)
+
+def test_appending_writes_one_header(tmpdir):
+    path = tmpdir.join("roi_stats.tsv")
+    for run in range(2):
+        analysis = roi_analysis.ROIStatisticsRGBAnalysis(
+            FakeCamera(), flat_calibration(), ROIS, str(path))
+        analysis.write(rgb_frame(0).tobytes())
+        analysis.close()
+    headers, rows = read_rows(path)
+    assert len(headers) == 1
+    assert len(rows) == 4
+
+def test_yuv(tmpdir):
+    path = tmpdir.join("roi_stats.tsv")
+    # Y, U and V planes for a 64x48 frame, uniform over the left ROI
+    y = np.full((48, 64), 120, dtype=np.uint8)
+    u = np.full((24, 32), 100, dtype=np.uint8)
+    v = np.full((24, 32), 160, dtype=np.uint8)
+    analysis = roi_analysis.ROIStatisticsYUVAnalysis(
+        FakeCamera(), flat_calibration(), {"left": ROIS["left"]}, str(path))
+    analysis.write(y.tobytes() + u.tobytes() + v.tobytes())
+    analysis.close()
+    headers, rows = read_rows(path)
+    expected = np.clip((np.array([120, 100, 160]) - roi_analysis.YUV_OFFSET).dot(
+        roi_analysis.YUV_TO_RGB.T), 0, 255) / 255
+    assert [float(v) for v in rows[0][4:7]] == pytest.approx(expected, abs=1e-4)
@@ -39,9 +39,9 @@ all that is required to access classes in the package::
 
     import picamera
 
-The :mod:`picamera.array` module is an exception to this as it depends on the
-third-party `numpy`_ package (this avoids making numpy a mandatory dependency
-for picamera).
+The :mod:`picamera.array` and :mod:`picamera.motion` modules are exceptions to
+this as they depend on the third-party `numpy`_ package (this avoids making
+numpy a mandatory dependency for picamera).
 
 .. _numpy: http://www.numpy.org/
 
@@ -57,6 +57,7 @@ package:
 * :mod:`picamera.color`
 * :mod:`picamera.exc`
 * :mod:`picamera.array`
+* :mod:`picamera.motion`
 """
 
 from __future__ import (
@@ -110,6 +111,21 @@ from picamera.renderers import (
     PiPreviewRenderer,
     PiNullSink,
     )
-from picamera.streams import PiCameraCircularIO, CircularIO, BufferIO
-from picamera.color import Color, Red, Green, Blue, Hue, Lightness, Saturation
+from picamera.streams import (
+    PiCameraCircularIO,
+    PiCameraMappedCircularIO,
+    CircularIO,
+    PreallocatedCircularIO,
+    BufferIO,
+    )
+from picamera.color import (
+    Color,
+    ColorArray,
+    Red,
+    Green,
+    Blue,
+    Hue,
+    Lightness,
+    Saturation,
+    )
 
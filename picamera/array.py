@@ -43,8 +43,11 @@ except NameError:
     pass
 
 import io
+import time
 import ctypes as ct
 import warnings
+import threading
+from collections import deque
 
 import numpy as np
 from numpy.lib.stride_tricks import as_strided
@@ -83,6 +86,21 @@ def raw_resolution(resolution, splitter=False):
 def bytes_to_yuv(data, resolution):
     """
     Converts a bytes object containing YUV data to a `numpy`_ array.
+
+    The chrominance (U and V) values are upsampled to full resolution by
+    repeating them (see :func:`yuv420_to_yuv444` for other options).
+    """
+    return yuv420_to_yuv444(data, resolution)
+
+
+def yuv420_planes(data, resolution):
+    """
+    Returns the Y, U and V planes of a YUV420 frame as separate `numpy`_
+    arrays.
+
+    The arrays are views of *data* (so no data is copied), cropped to
+    *resolution*. Y is full resolution, while U and V have half the width and
+    height (rounded up).
     """
     width, height = resolution
     fwidth, fheight = raw_resolution(resolution)
@@ -91,25 +109,144 @@ def bytes_to_yuv(data, resolution):
     if len(data) != (y_len + 2 * uv_len):
         raise PiCameraValueError(
             'Incorrect buffer length for resolution %dx%d' % (width, height))
-    # Separate out the Y, U, and V values from the array
     a = np.frombuffer(data, dtype=np.uint8)
-    Y = a[:y_len].reshape((fheight, fwidth))
-    Uq = a[y_len:-uv_len].reshape((fheight // 2, fwidth // 2))
-    Vq = a[-uv_len:].reshape((fheight // 2, fwidth // 2))
-    # Reshape the values into two dimensions, and double the size of the
-    # U and V values (which only have quarter resolution in YUV4:2:0)
-    U = np.empty_like(Y)
-    V = np.empty_like(Y)
-    U[0::2, 0::2] = Uq
-    U[0::2, 1::2] = Uq
-    U[1::2, 0::2] = Uq
-    U[1::2, 1::2] = Uq
-    V[0::2, 0::2] = Vq
-    V[0::2, 1::2] = Vq
-    V[1::2, 0::2] = Vq
-    V[1::2, 1::2] = Vq
-    # Stack the channels together and crop to the actual resolution
-    return np.dstack((Y, U, V))[:height, :width]
+    uv_height, uv_width = (height + 1) // 2, (width + 1) // 2
+    Y = a[:y_len].reshape((fheight, fwidth))[:height, :width]
+    U = a[y_len:-uv_len].reshape((fheight // 2, fwidth // 2))[:uv_height, :uv_width]
+    V = a[-uv_len:].reshape((fheight // 2, fwidth // 2))[:uv_height, :uv_width]
+    return Y, U, V
+
+
+def _upsample_nearest(plane, out):
+    # Write the half-resolution plane to the full-resolution 2D array out,
+    # repeating each value in a 2x2 block. Each quarter of the pixels (even
+    # or odd rows and columns) is a single strided assignment; the odd rows
+    # and columns of an odd-sized out are one shorter than plane
+    for row in (0, 1):
+        for col in (0, 1):
+            target = out[row::2, col::2]
+            target[...] = plane[:target.shape[0], :target.shape[1]]
+
+
+def _upsample_bilinear(plane, out):
+    # Write the half-resolution plane to the full-resolution 2D array out,
+    # interpolating bilinearly (assuming each chroma value is centred on its
+    # 2x2 block, so each pixel's nearest chroma value has weight 9/16, the
+    # next nearest vertically and horizontally 3/16, and diagonally 1/16).
+    # Integer arithmetic is used throughout
+    p = np.pad(plane.astype(np.int32), 1, mode='edge')
+    centre = 3 * p[1:-1]
+    for row, rows in ((0, centre + p[:-2]), (1, centre + p[2:])):
+        centre_cols = 3 * rows[:, 1:-1]
+        for col, cols in ((0, rows[:, :-2]), (1, rows[:, 2:])):
+            target = out[row::2, col::2]
+            value = centre_cols + cols
+            value += 8
+            value >>= 4
+            target[...] = value[:target.shape[0], :target.shape[1]]
+
+
+def _upsample(plane, out, interpolation):
+    if interpolation == 'nearest':
+        _upsample_nearest(plane, out)
+    elif interpolation == 'bilinear':
+        _upsample_bilinear(plane, out)
+    else:
+        raise PiCameraValueError('Invalid interpolation %s' % interpolation)
+
+
+def yuv420_to_yuv444(data, resolution, out=None, interpolation='nearest'):
+    """
+    Converts a bytes object containing YUV420 data to a 3-dimensional `numpy`_
+    array, organized (rows, columns, channel), with full-resolution U and V.
+
+    The chrominance values are upsampled with the given *interpolation*:
+    ``'nearest'`` (the default, and the fastest) repeats each value for the
+    four pixels it covers, while ``'bilinear'`` interpolates between them.
+    If *out* is given, it must be a ``(height, width, 3)`` array of
+    ``uint8``, which the result is written to (avoiding allocating a new
+    array for every frame).
+    """
+    Y, U, V = yuv420_planes(data, resolution)
+    if out is None:
+        out = np.empty(Y.shape + (3,), dtype=np.uint8)
+    out[..., 0] = Y
+    _upsample(U, out[..., 1], interpolation)
+    _upsample(V, out[..., 2], interpolation)
+    return out
+
+
+# Fixed-point (8 fractional bits) ITU-R BT.601 YUV to RGB conversion, as
+# used by yuv420_to_rgb and yuv444_to_rgb: the luminance scale, and the
+# contributions of U and V to each of R, G and B
+YUV_TO_RGB_Y = 298
+YUV_TO_RGB_UV = ((0, 409), (-100, -208), (516, 0))
+
+
+def _fixed_point_to_rgb(luma, chroma, out):
+    # luma is 298 * (Y - 16) + 128 as int32, chroma(channel, target) writes
+    # the U and V contribution to the given channel into target
+    scratch = np.empty(luma.shape, dtype=np.int32)
+    for channel in range(3):
+        chroma(channel, scratch)
+        scratch += luma
+        scratch >>= 8
+        np.clip(scratch, 0, 255, out=scratch)
+        out[..., channel] = scratch
+    return out
+
+
+def yuv420_to_rgb(data, resolution, out=None, interpolation='nearest'):
+    """
+    Converts a bytes object containing YUV420 data to a 3-dimensional `numpy`_
+    array of RGB values, organized (rows, columns, channel), using the
+    `ITU-R BT.601`_ conversion in integer arithmetic.
+
+    The U and V contributions to each channel are calculated at their own
+    (quarter) resolution and then upsampled with the given *interpolation*
+    (``'nearest'`` or ``'bilinear'``; see :func:`yuv420_to_yuv444`), so only
+    the luminance is converted at full resolution. If *out* is given, it must
+    be a ``(height, width, 3)`` array of ``uint8``, which the result is
+    written to.
+
+    .. _ITU-R BT.601: https://en.wikipedia.org/wiki/YCbCr#ITU-R_BT.601_conversion
+    """
+    Y, U, V = yuv420_planes(data, resolution)
+    if out is None:
+        out = np.empty(Y.shape + (3,), dtype=np.uint8)
+    luma = Y.astype(np.int32)
+    luma -= 16
+    luma *= YUV_TO_RGB_Y
+    luma += 128
+    D = U.astype(np.int32) - 128
+    E = V.astype(np.int32) - 128
+    def chroma(channel, target):
+        u, v = YUV_TO_RGB_UV[channel]
+        _upsample(u * D + v * E, target, interpolation)
+    return _fixed_point_to_rgb(luma, chroma, out)
+
+
+def yuv444_to_rgb(yuv, out=None):
+    """
+    Converts a 3-dimensional YUV array (as produced by
+    :func:`yuv420_to_yuv444`) to RGB, using the same integer `ITU-R BT.601`_
+    conversion as :func:`yuv420_to_rgb`. If *out* is given, it must be an
+    array of ``uint8`` with the same shape as *yuv*, which the result is
+    written to.
+    """
+    if out is None:
+        out = np.empty(yuv.shape, dtype=np.uint8)
+    luma = yuv[..., 0].astype(np.int32)
+    luma -= 16
+    luma *= YUV_TO_RGB_Y
+    luma += 128
+    D = yuv[..., 1].astype(np.int32) - 128
+    E = yuv[..., 2].astype(np.int32) - 128
+    def chroma(channel, target):
+        u, v = YUV_TO_RGB_UV[channel]
+        np.multiply(D, u, out=target)
+        target += v * E
+    return _fixed_point_to_rgb(luma, chroma, out)
 
 
 def bytes_to_rgb(data, resolution):
@@ -299,18 +436,7 @@ class PiYUVArray(PiArrayOutput):
     @property
     def rgb_array(self):
         if self._rgb is None:
-            # Apply the standard biases
-            YUV = self.array.astype(float)
-            YUV[:, :, 0]  = YUV[:, :, 0]  - 16  # Offset Y by 16
-            YUV[:, :, 1:] = YUV[:, :, 1:] - 128 # Offset UV by 128
-            # YUV conversion matrix from ITU-R BT.601 version (SDTV)
-            #              Y       U       V
-            M = np.array([[1.164,  0.000,  1.596],    # R
-                          [1.164, -0.392, -0.813],    # G
-                          [1.164,  2.017,  0.000]])   # B
-            # Calculate the dot product with the matrix to produce RGB output,
-            # clamp the results to byte range and convert to bytes
-            self._rgb = YUV.dot(M.T).clip(0, 255).astype(np.uint8)
+            self._rgb = yuv444_to_rgb(self.array)
         return self._rgb
 
 
@@ -621,6 +747,244 @@ class PiMotionArray(PiArrayOutput):
         self.array = np.frombuffer(b, dtype=motion_dtype).reshape((frames, rows, cols))
 
 
+class PiPreallocatedArrayOutput(io.IOBase):
+    """
+    Base class for capture arrays which re-use a single preallocated buffer.
+
+    This class behaves like :class:`PiArrayOutput` but, instead of growing a
+    :class:`~io.BytesIO` buffer for every capture and copying its value when
+    :meth:`~io.IOBase.flush` is called, it writes captures into a buffer
+    allocated for the camera's resolution (or *size*) when the output is
+    constructed. After :meth:`~io.IOBase.flush` the :attr:`array` attribute
+    is a view of that buffer, rather than a copy of it.
+
+    Emptying the output with ``seek(0)`` or ``truncate(0)`` between captures
+    keeps the buffer, so the same memory (and the same :attr:`array`) is
+    re-used by every capture from
+    :meth:`~picamera.PiCamera.capture_continuous`. If a capture is larger than
+    the buffer (because the resolution was increased), a new buffer is
+    allocated for it.
+
+    .. warning::
+
+        Because :attr:`array` is overwritten by the next capture, copy it if
+        you need to keep it.
+
+    .. attribute:: array
+
+        After :meth:`~io.IOBase.flush` is called, this attribute contains the
+        frame's data as a multi-dimensional `numpy`_ array, organized as in
+        :class:`PiArrayOutput`.
+    """
+
+    def __init__(self, camera, size=None):
+        super(PiPreallocatedArrayOutput, self).__init__()
+        self.camera = camera
+        self.size = size
+        self.array = None
+        self._pos = 0
+        self._length = 0
+        self._allocate(self._frame_size(self.size or self.camera.resolution))
+
+    def _allocate(self, size):
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._arrays = {}
+
+    def _frame_size(self, resolution):
+        raise NotImplementedError
+
+    def _to_array(self, data, resolution):
+        raise NotImplementedError
+
+    def _check_open(self):
+        if self.closed:
+            raise ValueError('I/O operation on a closed stream')
+
+    def close(self):
+        # IOBase.close calls flush, which mustn't convert whatever is left
+        # in the buffer (PiArrayOutput doesn't either)
+        self._length = 0
+        super(PiPreallocatedArrayOutput, self).close()
+        self.array = None
+        self._arrays = {}
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def getvalue(self):
+        """
+        Return ``bytes`` containing the entire contents of the stream.
+        """
+        self._check_open()
+        return self._view[:self._length].tobytes()
+
+    def tell(self):
+        self._check_open()
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._check_open()
+        if whence == io.SEEK_CUR:
+            offset = self._pos + offset
+        elif whence == io.SEEK_END:
+            offset = self._length + offset
+        if offset < 0:
+            raise ValueError('New position is before the start of the stream')
+        self._pos = offset
+        return self._pos
+
+    def read(self, n=-1):
+        self._check_open()
+        if n < 0:
+            n = self._length
+        result = self._view[self._pos:min(self._length, self._pos + n)].tobytes()
+        self._pos += len(result)
+        return result
+
+    def readinto(self, b):
+        self._check_open()
+        result = max(0, min(len(b), self._length - self._pos))
+        b[:result] = self._view[self._pos:self._pos + result]
+        self._pos += result
+        return result
+
+    def truncate(self, size=None):
+        """
+        Resize the stream to the given size in bytes (or the current position
+        if size is not specified). The underlying buffer is not freed, so a
+        truncated output can be re-used without allocating memory. The new
+        size is returned.
+
+        As with :meth:`PiArrayOutput.truncate`, specifying *size* also moves
+        the position of the stream to *size*, but this is deprecated.
+        """
+        self._check_open()
+        if size is not None:
+            warnings.warn(
+                PiCameraDeprecated(
+                    'This method changes the position of the stream to the '
+                    'truncated length; this is deprecated functionality and '
+                    'you should not rely on it (seek before or after truncate '
+                    'to ensure position is consistent)'))
+            self._length = min(self._length, size)
+            self.seek(size)
+        else:
+            self._length = min(self._length, self._pos)
+        return self._length
+
+    def write(self, b):
+        self._check_open()
+        size = len(b)
+        end = self._pos + size
+        if end > len(self._buffer):
+            # The buffer is too small (the resolution must have increased), so
+            # allocate a new one. Any arrays already returned keep the old one
+            old = self._view
+            self._allocate(max(end, self._frame_size(
+                self.size or self.camera.resolution)))
+            self._view[:self._length] = old[:self._length]
+        if self._pos > self._length:
+            # Fill the gap left by seeking beyond the end with NULs, as
+            # BytesIO does
+            self._view[self._length:self._pos] = b'\x00' * (self._pos - self._length)
+        self._view[self._pos:end] = b
+        self._pos = end
+        self._length = max(self._length, end)
+        return size
+
+    def flush(self):
+        super(PiPreallocatedArrayOutput, self).flush()
+        if self._length:
+            self.array = self._to_array(
+                np.frombuffer(self._buffer, dtype=np.uint8, count=self._length),
+                self.size or self.camera.resolution)
+
+
+class PiPreallocatedRGBArray(PiPreallocatedArrayOutput):
+    """
+    Produces a 3-dimensional RGB array from an RGB capture, re-using a single
+    preallocated buffer (see :class:`PiPreallocatedArrayOutput`).
+
+    This is otherwise equivalent to :class:`PiRGBArray`. For example, to
+    process frames as quickly as possible without allocating memory for each
+    one::
+
+        import picamera
+        import picamera.array
+
+        with picamera.PiCamera() as camera:
+            camera.resolution = (1280, 720)
+            with picamera.array.PiPreallocatedRGBArray(camera) as output:
+                for foo in camera.capture_continuous(
+                        output, 'rgb', use_video_port=True):
+                    print(output.array.mean(axis=(0, 1)))
+                    output.seek(0)
+    """
+
+    def _frame_size(self, resolution):
+        fwidth, fheight = raw_resolution(resolution)
+        return fwidth * fheight * 3
+
+    def _to_array(self, data, resolution):
+        # The array is a view of the buffer, so the same one can be returned
+        # for every capture of the same size
+        key = (len(data), tuple(resolution))
+        try:
+            return self._arrays[key]
+        except KeyError:
+            result = self._arrays[key] = bytes_to_rgb(data, resolution)
+            return result
+
+
+class PiPreallocatedYUVArray(PiPreallocatedArrayOutput):
+    """
+    Produces 3-dimensional YUV and RGB arrays from a YUV capture, re-using
+    preallocated buffers (see :class:`PiPreallocatedArrayOutput`).
+
+    This is otherwise equivalent to :class:`PiYUVArray`. The U and V values
+    are upsampled into a preallocated array by :func:`yuv420_to_yuv444`, and
+    :attr:`rgb_array` is likewise calculated into a preallocated array by
+    :func:`yuv444_to_rgb` when it is first queried after each capture.
+    """
+
+    def __init__(self, camera, size=None):
+        super(PiPreallocatedYUVArray, self).__init__(camera, size)
+        self._rgb = None
+        self._rgb_out = None
+
+    def _frame_size(self, resolution):
+        fwidth, fheight = raw_resolution(resolution)
+        return fwidth * fheight + 2 * ((fwidth // 2) * (fheight // 2))
+
+    def _to_array(self, data, resolution):
+        width, height = resolution
+        out = self.array
+        if out is None or out.shape != (height, width, 3):
+            out = None
+        self._rgb = None
+        return yuv420_to_yuv444(data, resolution, out=out)
+
+    def close(self):
+        super(PiPreallocatedYUVArray, self).close()
+        self._rgb = None
+        self._rgb_out = None
+
+    @property
+    def rgb_array(self):
+        if self._rgb is None and self.array is not None:
+            if self._rgb_out is None or self._rgb_out.shape != self.array.shape:
+                self._rgb_out = np.empty_like(self.array)
+            self._rgb = yuv444_to_rgb(self.array, out=self._rgb_out)
+        return self._rgb
+
+
 class PiAnalysisOutput(io.IOBase):
     """
     Base class for analysis outputs.
@@ -689,9 +1053,12 @@ class PiRGBAnalysis(PiAnalysisOutput):
 
     def write(self, b):
         result = super(PiRGBAnalysis, self).write(b)
-        self.analyze(bytes_to_rgb(b, self.size or self.camera.resolution))
+        self.analyze(self._to_array(b))
         return result
 
+    def _to_array(self, b):
+        return bytes_to_rgb(b, self.size or self.camera.resolution)
+
 
 class PiYUVAnalysis(PiAnalysisOutput):
     """
@@ -718,14 +1085,19 @@ class PiYUVAnalysis(PiAnalysisOutput):
     (rows, columns, channel) where the channel 0 is Y (luminance), while 1 and
     2 are U and V (chrominance) respectively. The chrominance values normally
     have quarter resolution of the luminance values but this class makes all
-    channels equal resolution for ease of use.
+    channels equal resolution for ease of use. If your analysis needs RGB
+    values, :func:`yuv444_to_rgb` converts the array far more quickly than a
+    floating point matrix product.
     """
 
     def write(self, b):
         result = super(PiYUVAnalysis, self).write(b)
-        self.analyze(bytes_to_yuv(b, self.size or self.camera.resolution))
+        self.analyze(self._to_array(b))
         return result
 
+    def _to_array(self, b):
+        return bytes_to_yuv(b, self.size or self.camera.resolution)
+
 
 class PiMotionAnalysis(PiAnalysisOutput):
     """
@@ -793,14 +1165,220 @@ class PiMotionAnalysis(PiAnalysisOutput):
 
     def write(self, b):
         result = super(PiMotionAnalysis, self).write(b)
+        self.analyze(self._to_array(b))
+        return result
+
+    def _to_array(self, b):
         if self.cols is None:
             width, height = self.size or self.camera.resolution
             self.cols = ((width + 15) // 16) + 1
             self.rows = (height + 15) // 16
-        self.analyze(
-                np.frombuffer(b, dtype=motion_dtype).\
-                reshape((self.rows, self.cols)))
-        return result
+        return np.frombuffer(b, dtype=motion_dtype).\
+                reshape((self.rows, self.cols))
+
+
+# Py2.7 doesn't have time.monotonic
+_timer = getattr(time, 'monotonic', time.time)
+
+
+class PiThreadedAnalysisMixin(object):
+    """
+    Runs the :meth:`~PiAnalysisOutput.analyze` method of an analysis output
+    on a pool of worker threads.
+
+    The analysis outputs above call :meth:`~PiAnalysisOutput.analyze` from
+    the camera's callback thread, so an analysis which is slower than the
+    framerate holds up the camera. When this class is mixed in (see
+    :class:`PiThreadedRGBAnalysis`, :class:`PiThreadedYUVAnalysis` and
+    :class:`PiThreadedMotionAnalysis`), :meth:`write` just copies each frame
+    into a buffer and returns; the conversion to an array and the analysis
+    happen on one of *workers* threads.
+
+    At most *queue_size* frames wait to be analyzed. When a frame arrives and
+    the queue is full, either the oldest waiting frame (if *drop* is
+    ``'oldest'``, the default) or the new frame (if *drop* is ``'newest'``)
+    is dropped. Frames are copied into a fixed pool of ``workers +
+    queue_size`` buffers which are re-used, so the array passed to
+    :meth:`~PiAnalysisOutput.analyze` is only valid until it returns (copy
+    it if you need to keep it). With more than one worker,
+    :meth:`~PiAnalysisOutput.analyze` must be thread-safe, and may be called
+    for frames out of order. Any other keyword arguments are passed on to
+    the analysis output the class is mixed with.
+
+    The :attr:`frames_received`, :attr:`frames_analyzed` and
+    :attr:`frames_dropped` attributes count frames, and :attr:`latency`,
+    :attr:`mean_latency` and :attr:`max_latency` report the time (in seconds)
+    between a frame's arrival and the end of its analysis. If
+    :meth:`~PiAnalysisOutput.analyze` raises an exception, it is re-raised
+    by the next call to :meth:`write` or :meth:`flush` (the latter is called
+    when recording stops). :meth:`close` waits for the waiting frames to be
+    analyzed, and stops the workers.
+
+    .. note::
+
+        Thanks to the GIL, worker threads only help if the analysis spends
+        most of its time in code which releases it, like most `numpy`_
+        operations on large arrays.
+    """
+
+    def __init__(
+            self, camera, size=None, workers=1, queue_size=2, drop='oldest',
+            **kwargs):
+        if workers < 1:
+            raise PiCameraValueError('workers must be at least 1')
+        if queue_size < 1:
+            raise PiCameraValueError('queue_size must be at least 1')
+        if drop not in ('oldest', 'newest'):
+            raise PiCameraValueError('Invalid drop policy %s' % drop)
+        super(PiThreadedAnalysisMixin, self).__init__(camera, size, **kwargs)
+        self.drop = drop
+        self.frames_received = 0
+        self.frames_analyzed = 0
+        self.frames_dropped = 0
+        self.latency = None
+        self.max_latency = 0.0
+        self._total_latency = 0.0
+        self._queue_size = queue_size
+        self._queue = deque()
+        # Buffers are allocated on the first frames, at the size of a frame
+        self._free = [None] * (workers + queue_size)
+        self._busy = 0
+        self._error = None
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker_run)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def mean_latency(self):
+        """
+        The mean time (in seconds) between the arrival of a frame and the end
+        of its analysis, or ``None`` if no frames have been analyzed yet.
+        """
+        with self._cond:
+            if self.frames_analyzed:
+                return self._total_latency / self.frames_analyzed
+
+    def _check_error(self):
+        # Must be called with self._cond held
+        if self._error:
+            error, self._error = self._error, None
+            raise error
+
+    def write(self, b):
+        size = len(b)
+        with self._cond:
+            self._check_error()
+            self.frames_received += 1
+            if len(self._queue) < self._queue_size:
+                buf = self._free.pop()
+            elif self.drop == 'newest':
+                self.frames_dropped += 1
+                return size
+            else:
+                buf, _ = self._queue.popleft()
+                self.frames_dropped += 1
+        # Copy the frame outside the lock, so workers can take frames from
+        # the queue meanwhile; there's always a free buffer because there
+        # are only ever queue_size frames waiting, and workers being analyzed
+        received = _timer()
+        if buf is None or len(buf) != size:
+            buf = bytearray(size)
+        buf[:] = b
+        with self._cond:
+            self._queue.append((buf, received))
+            self._cond.notify()
+        return size
+
+    def flush(self):
+        """
+        Waits for all waiting frames to be analyzed, and raises any exception
+        raised by :meth:`~PiAnalysisOutput.analyze` since the last call to
+        :meth:`write` or :meth:`flush`.
+        """
+        super(PiThreadedAnalysisMixin, self).flush()
+        with self._cond:
+            while (self._queue or self._busy) and self._threads:
+                self._cond.wait()
+            self._check_error()
+
+    def close(self):
+        if self._threads:
+            with self._cond:
+                self._stopping = True
+                self._cond.notify_all()
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+        super(PiThreadedAnalysisMixin, self).close()
+
+    def _worker_run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue:
+                    break
+                buf, received = self._queue.popleft()
+                self._busy += 1
+            try:
+                self.analyze(self._to_array(buf))
+            except Exception as e:
+                with self._cond:
+                    self._error = e
+            finally:
+                latency = _timer() - received
+                with self._cond:
+                    self._busy -= 1
+                    self._free.append(buf)
+                    self.frames_analyzed += 1
+                    self.latency = latency
+                    self.max_latency = max(self.max_latency, latency)
+                    self._total_latency += latency
+                    self._cond.notify_all()
+
+
+class PiThreadedRGBAnalysis(PiThreadedAnalysisMixin, PiRGBAnalysis):
+    """
+    A :class:`PiRGBAnalysis` which analyzes frames on a pool of worker
+    threads; see :class:`PiThreadedAnalysisMixin` for the parameters. For
+    example, to analyze frames on two threads, dropping frames which arrive
+    while two others are waiting::
+
+        import picamera
+        import picamera.array
+
+        class MyAnalysis(picamera.array.PiThreadedRGBAnalysis):
+            def analyze(self, a):
+                print(a.mean(axis=(0, 1)))
+
+        with picamera.PiCamera() as camera:
+            with MyAnalysis(camera, workers=2, queue_size=2) as output:
+                camera.start_recording(output, format='rgb')
+                camera.wait_recording(30)
+                camera.stop_recording()
+                print('Analyzed %d of %d frames (%.1fms latency)' % (
+                    output.frames_analyzed, output.frames_received,
+                    output.mean_latency * 1000))
+    """
+
+
+class PiThreadedYUVAnalysis(PiThreadedAnalysisMixin, PiYUVAnalysis):
+    """
+    A :class:`PiYUVAnalysis` which analyzes frames on a pool of worker
+    threads; see :class:`PiThreadedAnalysisMixin` for the parameters.
+    """
+
+
+class PiThreadedMotionAnalysis(PiThreadedAnalysisMixin, PiMotionAnalysis):
+    """
+    A :class:`PiMotionAnalysis` which analyzes motion data on a pool of
+    worker threads; see :class:`PiThreadedAnalysisMixin` for the parameters.
+    """
 
 
 class MMALArrayBuffer(mo.MMALBuffer):
@@ -298,6 +298,31 @@ class PiCamera(object):
         'raw':          mmal.MMAL_PARAM_TIMESTAMP_MODE_RAW_STC,
         }
 
+    # For each sensor mode: the output resolution, the binning factor, and the
+    # (x, y) offset of the region read out from the full sensor.  These are
+    # used to size lens shading tables; mode 0 (automatic) is treated as the
+    # full resolution of the sensor.
+    SENSOR_MODES = {
+        'OV5647': {
+            1: (mo.PiResolution(1920, 1080), 1, (336, 432)),
+            2: (mo.PiResolution(2592, 1944), 1, (0, 0)),
+            3: (mo.PiResolution(2592, 1944), 1, (0, 0)),
+            4: (mo.PiResolution(1296, 972),  2, (0, 0)),
+            5: (mo.PiResolution(1296, 730),  2, (0, 242)),
+            6: (mo.PiResolution(640, 480),   4, (16, 12)),
+            7: (mo.PiResolution(640, 480),   4, (16, 12)),
+            },
+        'IMX219': {
+            1: (mo.PiResolution(1920, 1080), 1, (680, 692)),
+            2: (mo.PiResolution(3280, 2464), 1, (0, 0)),
+            3: (mo.PiResolution(3280, 2464), 1, (0, 0)),
+            4: (mo.PiResolution(1640, 1232), 2, (0, 0)),
+            5: (mo.PiResolution(1640, 922),  2, (0, 310)),
+            6: (mo.PiResolution(1280, 720),  2, (360, 512)),
+            7: (mo.PiResolution(640, 480),   2, (1000, 752)),
+            },
+        }
+
     _METER_MODES_R    = {v: k for (k, v) in METER_MODES.items()}
     _EXPOSURE_MODES_R = {v: k for (k, v) in EXPOSURE_MODES.items()}
     _FLASH_MODES_R    = {v: k for (k, v) in FLASH_MODES.items()}
@@ -1024,6 +1049,14 @@ class PiCamera(object):
 
         * *quantization* - Deprecated alias for *quality*.
 
+        All formats accept the *zero_copy* option. If this is ``True``, *output*
+        is written a :class:`memoryview` of the encoder's buffer, rather than a
+        copy of it as :class:`bytes`, saving a copy of every buffer. The view
+        is only valid during the call to *output*'s ``write`` method, so only
+        use this with outputs that copy what they're given (like files,
+        :class:`io.BytesIO` and :class:`~picamera.CircularIO`), rather than
+        keeping a reference to it.
+
         .. versionchanged:: 1.0
             The *resize* parameter was added, and ``'mjpeg'`` was added as a
             recording format
@@ -2027,7 +2060,7 @@ class PiCamera(object):
             (port.framesize, port.framerate, port.params[mmal.MMAL_PARAMETER_FPS_RANGE])
             for port in self._camera.outputs
             ]
-        self._upload_lens_shading_table(lens_shading_table)
+        self._upload_lens_shading_table(lens_shading_table, sensor_mode)
         if old_sensor_mode != 0 or sensor_mode != 0:
             self._camera.control.params[mmal.MMAL_PARAMETER_CAMERA_CUSTOM_SENSOR_CONFIG] = sensor_mode
         if not self._camera.control.enabled:
@@ -2231,14 +2264,35 @@ class PiCamera(object):
         
         The lens shading table is not the full resolution of the camera - it
         is defined with one point per 64x64 pixel block.  This means the table
-        should be 1/64 times the size of the sensor, rounding **up** to the 
-        nearest integer.
+        should be 1/64 times the size of the sensor mode's output, rounding
+        **up** to the nearest integer.  Binned and cropped modes therefore
+        need smaller tables than the full-resolution modes.
         """
         if sensor_mode is None:
             sensor_mode = self.sensor_mode
-        #TODO: make sure the resolution is appropriate to the camera mode!
-        full_resolution = [self.MAX_RESOLUTION.width, self.MAX_RESOLUTION.height]
-        return (4,) + tuple([(r // 64) + 1 for r in full_resolution[::-1]])
+        try:
+            resolution = self.SENSOR_MODES[self._revision.upper()][sensor_mode][0]
+        except KeyError:
+            resolution = self.MAX_RESOLUTION
+        return (4,) + tuple([(r // 64) + 1 for r in resolution[::-1]])
+
+    def _select_lens_shading_table(self, lens_shading_table, sensor_mode):
+        """Pick the table for a sensor mode, if several tables were supplied.
+
+        Lens shading tables may be given as a dictionary, keyed by sensor mode,
+        so that the right one is used whenever the mode changes.  If there is
+        no table for the mode, we fall back to the built-in lens shading.
+        """
+        if not isinstance(lens_shading_table, dict):
+            return lens_shading_table
+        try:
+            return lens_shading_table[sensor_mode]
+        except KeyError:
+            warnings.warn(
+                PiCameraFallback(
+                    "No lens shading table supplied for sensor mode %d; "
+                    "using the default lens shading" % sensor_mode))
+            return None
         
     def _validate_lens_shading_table(self, lens_shading_table, sensor_mode):
         """Check a lens shading table is valid and raise an exception if not."""
@@ -2255,8 +2309,12 @@ class PiCamera(object):
             
     def _upload_lens_shading_table(self, lens_shading_table, sensor_mode=None):
         """Actually commit the lens shading table to the camera."""
+        if sensor_mode is None:
+            sensor_mode = self.sensor_mode
+        tables = lens_shading_table
+        lens_shading_table = self._select_lens_shading_table(tables, sensor_mode)
         if lens_shading_table is None:
-            self._lens_shading_table = None
+            self._lens_shading_table = tables
             # Given that we reset the camera each time anyway, hopefully we revert
             # to built-in lens shading correction by simply doing nothing here!
             return
@@ -2283,7 +2341,7 @@ class PiCamera(object):
 
         shared_memory.copy_from_array(lens_shading_table) # copy in the array
         self._camera.control.params[mmal.MMAL_PARAMETER_LENS_SHADING_OVERRIDE] = lens_shading_parameters
-        self._lens_shading_table = lens_shading_table
+        self._lens_shading_table = tables
 
     def _get_lens_shading_table(self):
         self._check_camera_open()
@@ -2292,6 +2350,10 @@ class PiCamera(object):
         self._check_camera_open()
         self._check_recording_stopped()
         #TODO: validate the table here?
+        # The firmware only reads the lens shading override when the camera
+        # is enabled, so a new table needs a full reconfigure (changing
+        # sensor_mode picks the right table from a dict in the reconfigure it
+        # already does)
         sensor_mode = self.sensor_mode
         clock_mode = self.CLOCK_MODES[self.clock_mode]
         resolution = self.resolution
@@ -2327,8 +2389,14 @@ class PiCamera(object):
             shading table back from the GPU, so this property will only have a
             useful value if you have previously set it manually.
             
-            Also, using this property with binned or cropped modes of the
-            camera may produce unpredictable results.
+        The table must match the :attr:`sensor_mode`: binned and cropped modes
+        need smaller tables than the full-resolution modes.  Rather than a
+        single table, you may supply a :class:`dict` mapping sensor modes to
+        tables (as generated by ``picam_raw_analysis.lst_from_raw_white_image
+        --all_sensor_modes``).  The table for the current mode is then used,
+        and changing :attr:`sensor_mode` picks the matching table as part of
+        the same reconfiguration.  Modes without a table fall back to the
+        built-in lens shading.
 
         The initial value of this property can be specified with the
         *lens_shading_table* parameter in the :class:`PiCamera` constructor.
@@ -48,6 +48,12 @@ from math import pi, sqrt, atan2, degrees, radians, sin, cos, exp
 from fractions import Fraction
 from collections import namedtuple
 
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed by ColorArray, so null-out the reference
+    np = None
+
 
 # From the CSS Color Module Level 3 specification, section 4.3
 # <http://www.w3.org/TR/css3-color/#svg-color>
@@ -1105,3 +1111,578 @@ class Color(namedtuple('Color', ('red', 'green', 'blue'))):
         RT = -2 * sqrt(C_ ** 7 / (C_ ** 7 + 25 ** 7)) * sin(radians(60 * exp(-(((h_ - 275) / 25) ** 2))))
         return sqrt((dL / SL) ** 2 + (dC / SC) ** 2 + (dH / SH) ** 2 + RT * (dC / SC) * (dH / SH))
 
+
+def _from_srgb_array(c):
+    with np.errstate(invalid='ignore'):
+        return np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+
+
+def _to_srgb_array(c):
+    with np.errstate(invalid='ignore'):
+        return np.where(c <= 0.0031308, 12.92 * c, 1.055 * c ** (1/2.4) - 0.055)
+
+
+def _hue_array(r, g, b, maxc, rangec):
+    # The hue calculation shared by colorsys.rgb_to_hls and rgb_to_hsv
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rc = (maxc - r) / rangec
+        gc = (maxc - g) / rangec
+        bc = (maxc - b) / rangec
+    h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    return np.where(rangec == 0, 0.0, (h / 6.0) % 1.0)
+
+
+def _hls_value_array(m1, m2, hue):
+    # Equivalent to colorsys._v
+    hue = hue % 1.0
+    return np.select(
+        [hue < 1.0/6.0, hue < 0.5, hue < 2.0/3.0],
+        [m1 + (m2 - m1) * hue * 6.0, m2, m1 + (m2 - m1) * (2.0/3.0 - hue) * 6.0],
+        m1)
+
+
+class ColorArray(object):
+    """
+    The ColorArray class represents an array of colors as a `numpy`_ array of
+    red, green, and blue components, with shape ``(..., 3)``.
+
+    It is the vectorized counterpart of :class:`Color`, for working with many
+    colors at once (e.g. every pixel of an image): it provides the same
+    constructors and conversion properties, and the same
+    :meth:`difference` methods, calculated over the whole array with the same
+    formulae as :class:`Color`. Each constructor accepts an array whose last
+    dimension holds the three components of the color system, and each
+    conversion property returns one. For example::
+
+        >>> import numpy as np
+        >>> from picamera.color import Color, ColorArray
+        >>> pixels = ColorArray.from_rgb_bytes(np.array([[255, 0, 0], [0, 128, 0]]))
+        >>> pixels.hls
+        array([[0.        , 0.5       , 1.        ],
+               [0.33333333, 0.25098039, 1.        ]])
+        >>> pixels.difference(Color('red'), method='cie1976')
+        array([  0.        , 133.10729836])
+
+    Indexing a ColorArray returns a :class:`Color` for a single element, or a
+    ColorArray for a slice of the array. The :attr:`rgb` property returns the
+    underlying array (without copying it), and instances can be passed
+    directly to numpy functions.
+
+    Unlike :class:`Color`, this class requires `numpy`_.
+
+    .. _numpy: http://www.numpy.org/
+    """
+
+    __slots__ = ('_rgb',)
+
+    def __init__(self, rgb):
+        if np is None:
+            raise ImportError('ColorArray requires numpy')
+        rgb = np.asarray(rgb, dtype=np.float64)
+        if rgb.shape[-1:] != (3,):
+            raise ValueError('ColorArray requires an array of shape (..., 3)')
+        self._rgb = rgb
+
+    @staticmethod
+    def _split(values, dtype=None):
+        if dtype is None:
+            dtype = np.float64
+        values = np.asarray(values, dtype=dtype)
+        if values.shape[-1:] != (3,):
+            raise ValueError('Expected an array of shape (..., 3)')
+        return values[..., 0], values[..., 1], values[..., 2]
+
+    @staticmethod
+    def _matrix_mult(m, values):
+        # Equivalent to matrix_mult, but for arrays of shape (..., 3)
+        return np.stack([
+            mrow[0] * values[0] + mrow[1] * values[1] + mrow[2] * values[2]
+            for mrow in m
+            ], axis=-1)
+
+    @classmethod
+    def from_colors(cls, colors):
+        """
+        Construct a :class:`ColorArray` from a sequence of :class:`Color`
+        instances, or of strings accepted by :meth:`Color.from_string`.
+        """
+        return cls([
+            c if isinstance(c, Color) else Color.from_string(c)
+            for c in colors
+            ])
+
+    @classmethod
+    def from_rgb(cls, rgb):
+        """
+        Construct a :class:`ColorArray` from an array of `RGB`_ float values
+        between 0.0 and 1.0.
+
+        .. _RGB: https://en.wikipedia.org/wiki/RGB_color_space
+        """
+        return cls(rgb)
+
+    @classmethod
+    def from_rgb_565(cls, n):
+        """
+        Construct a :class:`ColorArray` from an array of unsigned 16-bit
+        integers in RGB565 format (with any shape; the result has an extra
+        dimension).
+        """
+        n = np.asarray(n, dtype=np.int64)
+        return cls(np.stack((
+            (n & 0xF800) / 0xF800,
+            (n & 0x07E0) / 0x07E0,
+            (n & 0x001F) / 0x001F,
+            ), axis=-1))
+
+    @classmethod
+    def from_rgb_bytes(cls, rgb):
+        """
+        Construct a :class:`ColorArray` from an array of `RGB`_ byte values
+        between 0 and 255.
+        """
+        return cls(np.asarray(rgb, dtype=np.float64) / 255.0)
+
+    @classmethod
+    def from_yuv(cls, yuv):
+        """
+        Construct a :class:`ColorArray` from an array of `Y'UV`_ float values,
+        as :meth:`Color.from_yuv`.
+
+        .. _Y'UV: https://en.wikipedia.org/wiki/YUV
+        """
+        y, u, v = cls._split(yuv)
+        return cls(np.clip(np.stack((
+            y + 1.14  * v,
+            y - 0.395 * u - 0.581 * v,
+            y + 2.033 * u,
+            ), axis=-1), 0.0, 1.0))
+
+    @classmethod
+    def from_yuv_bytes(cls, yuv):
+        """
+        Construct a :class:`ColorArray` from an array of `Y'UV`_ byte values,
+        biased as described in :meth:`Color.from_yuv_bytes` (e.g. the
+        unpacked output of the camera's ``'yuv'`` format).
+        """
+        y, u, v = cls._split(yuv, dtype=np.int32)
+        c = 298 * (y - 16) + 128
+        d = u - 128
+        e = v - 128
+        return cls.from_rgb_bytes(np.clip(np.stack((
+            (c + 409 * e) >> 8,
+            (c - 100 * d - 208 * e) >> 8,
+            (c + 516 * d) >> 8,
+            ), axis=-1), 0, 255))
+
+    @classmethod
+    def from_yiq(cls, yiq):
+        """
+        Construct a :class:`ColorArray` from an array of `Y'IQ`_ float values,
+        as :meth:`Color.from_yiq`.
+
+        .. _Y'IQ: https://en.wikipedia.org/wiki/YIQ
+        """
+        # The constants used by colorsys.yiq_to_rgb
+        y, i, q = cls._split(yiq)
+        return cls(np.clip(np.stack((
+            y + 0.9468822170900693 * i + 0.6235565819861433 * q,
+            y - 0.27478764629897834 * i - 0.6356910791873801 * q,
+            y - 1.1085450346420322 * i + 1.7090069284064666 * q,
+            ), axis=-1), 0.0, 1.0))
+
+    @classmethod
+    def from_hls(cls, hls):
+        """
+        Construct a :class:`ColorArray` from an array of `HLS`_ (hue,
+        lightness, saturation) floats between 0.0 and 1.0.
+
+        .. _HLS: https://en.wikipedia.org/wiki/HSL_and_HSV
+        """
+        h, l, s = cls._split(hls)
+        m2 = np.where(l <= 0.5, l * (1.0 + s), l + s - (l * s))
+        m1 = 2.0 * l - m2
+        rgb = np.stack((
+            _hls_value_array(m1, m2, h + 1.0/3.0),
+            _hls_value_array(m1, m2, h),
+            _hls_value_array(m1, m2, h - 1.0/3.0),
+            ), axis=-1)
+        return cls(np.where((s == 0.0)[..., np.newaxis], l[..., np.newaxis], rgb))
+
+    @classmethod
+    def from_hsv(cls, hsv):
+        """
+        Construct a :class:`ColorArray` from an array of `HSV`_ (hue,
+        saturation, value) floats between 0.0 and 1.0.
+
+        .. _HSV: https://en.wikipedia.org/wiki/HSL_and_HSV
+        """
+        h, s, v = cls._split(hsv)
+        i = (h * 6.0).astype(np.int64)
+        f = (h * 6.0) - i
+        p = v * (1.0 - s)
+        q = v * (1.0 - s * f)
+        t = v * (1.0 - s * (1.0 - f))
+        i = (i % 6)[..., np.newaxis]
+        rgb = np.select(
+            [i == 0, i == 1, i == 2, i == 3, i == 4],
+            [np.stack(c, axis=-1) for c in (
+                (v, t, p), (q, v, p), (p, v, t), (p, q, v), (t, p, v))],
+            np.stack((v, p, q), axis=-1))
+        return cls(np.where((s == 0.0)[..., np.newaxis], v[..., np.newaxis], rgb))
+
+    @classmethod
+    def from_cie_xyz(cls, xyz):
+        """
+        Construct a :class:`ColorArray` from an array of (X, Y, Z) float values
+        in the `CIE 1931 color space`_, as :meth:`Color.from_cie_xyz`.
+
+        .. _CIE 1931 color space: https://en.wikipedia.org/wiki/CIE_1931_color_space
+        """
+        m = cls._matrix_mult(
+            (( 3.2404542, -1.5371385, -0.4985314),
+             (-0.9692660,  1.8760108,  0.0415560),
+             ( 0.0556434, -0.2040259,  1.0572252),
+             ),
+            cls._split(xyz))
+        return cls(_to_srgb_array(m))
+
+    @classmethod
+    def from_cie_lab(cls, lab):
+        """
+        Construct a :class:`ColorArray` from an array of (L*, a*, b*) float
+        values in the `CIE Lab color space`_, as :meth:`Color.from_cie_lab`.
+
+        .. _CIE Lab color space: https://en.wikipedia.org/wiki/Lab_color_space
+        """
+        l, a, b = cls._split(lab)
+        theta = 6 / 29
+        fy = (l + 16) / 116
+        fx = fy + a / 500
+        fz = fy - b / 200
+        xyz = np.stack([
+            np.where(n > theta, n ** 3, 3 * theta ** 2 * (n - 4 / 29))
+            for n in (fx, fy, fz)
+            ], axis=-1)
+        return cls.from_cie_xyz(xyz * D65)
+
+    @classmethod
+    def from_cie_luv(cls, luv):
+        """
+        Construct a :class:`ColorArray` from an array of (L*, u*, v*) float
+        values in the `CIE Luv color space`_, as :meth:`Color.from_cie_luv`.
+
+        .. _CIE Luv color space: https://en.wikipedia.org/wiki/CIELUV
+        """
+        l, u, v = cls._split(luv)
+        uw = U(*D65)
+        vw = V(*D65)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u_p = u / (13 * l) + uw
+            v_p = v / (13 * l) + vw
+            y = D65[1] * np.where(l <= 8, l * (3 / 29) ** 3, ((l + 16) / 116) ** 3)
+            x = y * (9 * u_p) / (4 * v_p)
+            z = y * (12 - 3 * u_p - 20 * v_p) / (4 * v_p)
+        return cls.from_cie_xyz(np.stack((x, y, z), axis=-1))
+
+    def __repr__(self):
+        return '<ColorArray shape=%r>' % (self.shape,)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self._rgb
+        return self._rgb.astype(dtype)
+
+    def __len__(self):
+        return len(self._rgb)
+
+    def __getitem__(self, index):
+        result = self._rgb[index]
+        if result.ndim == 1:
+            return Color.from_rgb(*(float(c) for c in result))
+        return ColorArray(result)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def shape(self):
+        """
+        Returns the shape of the array of colors (excluding the final
+        dimension of three components).
+        """
+        return self._rgb.shape[:-1]
+
+    @property
+    def rgb(self):
+        """
+        Returns the array of (red, green, blue) float values (between 0.0 and
+        1.0), with shape ``(..., 3)``.
+        """
+        return self._rgb
+
+    @property
+    def red(self):
+        """
+        Returns an array of the red component of each color.
+        """
+        return self._rgb[..., 0]
+
+    @property
+    def green(self):
+        """
+        Returns an array of the green component of each color.
+        """
+        return self._rgb[..., 1]
+
+    @property
+    def blue(self):
+        """
+        Returns an array of the blue component of each color.
+        """
+        return self._rgb[..., 2]
+
+    @property
+    def rgb_565(self):
+        """
+        Returns an array of unsigned 16-bit integers representing each color
+        in the RGB565 encoding.
+        """
+        r, g, b = self._split(self._rgb)
+        return (
+                ((r * 0xF800).astype(np.int64) & 0xF800) |
+                ((g * 0x07E0).astype(np.int64) & 0x07E0) |
+                ((b * 0x001F).astype(np.int64) & 0x001F))
+
+    @property
+    def rgb_bytes(self):
+        """
+        Returns an array of (red, green, blue) byte values.
+        """
+        return (self._rgb * 255).astype(np.int64)
+
+    @property
+    def yuv(self):
+        """
+        Returns an array of (y, u, v) float values, as :attr:`Color.yuv`.
+        """
+        r, g, b = self._split(self._rgb)
+        y = 0.299 * r + 0.587 * g + 0.114 * b
+        return np.stack((y, 0.492 * (b - y), 0.877 * (r - y)), axis=-1)
+
+    @property
+    def yuv_bytes(self):
+        """
+        Returns an array of (y, u, v) byte values, biased as
+        :attr:`Color.yuv_bytes`.
+        """
+        r, g, b = self._split(self.rgb_bytes, dtype=np.int64)
+        return np.stack((
+                (( 66 * r + 129 * g +  25 * b + 128) >> 8) + 16,
+                ((-38 * r -  73 * g + 112 * b + 128) >> 8) + 128,
+                ((112 * r -  94 * g -  18 * b + 128) >> 8) + 128,
+                ), axis=-1)
+
+    @property
+    def yiq(self):
+        """
+        Returns an array of (y, i, q) float values, as :attr:`Color.yiq`.
+        """
+        # The constants used by colorsys.rgb_to_yiq
+        r, g, b = self._split(self._rgb)
+        y = 0.30 * r + 0.59 * g + 0.11 * b
+        return np.stack((
+                y,
+                0.74 * (r - y) - 0.27 * (b - y),
+                0.48 * (r - y) + 0.41 * (b - y),
+                ), axis=-1)
+
+    @property
+    def cie_xyz(self):
+        """
+        Returns an array of (X, Y, Z) float values representing the colors in
+        the `CIE 1931 color space`_, as :attr:`Color.cie_xyz`.
+        """
+        return self._matrix_mult(
+            ((0.4124564, 0.3575761, 0.1804375),
+             (0.2126729, 0.7151522, 0.0721750),
+             (0.0193339, 0.1191920, 0.9503041),
+             ),
+            self._split(_from_srgb_array(self._rgb)))
+
+    @property
+    def cie_lab(self):
+        """
+        Returns an array of (L*, a*, b*) float values representing the colors
+        in the `CIE Lab color space`_, as :attr:`Color.cie_lab`.
+        """
+        K = (1 / 3) * (29 / 6) ** 2
+        e = (6 / 29) ** 3
+        with np.errstate(invalid='ignore'):
+            fx, fy, fz = (
+                np.where(n > e, n ** (1 / 3), K * n + 4 / 29)
+                for n in self._split(self.cie_xyz / D65)
+                )
+        return np.stack((116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)), axis=-1)
+
+    @property
+    def cie_luv(self):
+        """
+        Returns an array of (L*, u*, v*) float values representing the colors
+        in the `CIE Luv color space`_, as :attr:`Color.cie_luv`. As with
+        :attr:`Color.cie_luv`, u* and v* are undefined (here, NaN) for black.
+        """
+        K = (29 / 3) ** 3
+        e = (6 / 29) ** 3
+        XYZ = self._split(self.cie_xyz)
+        yr = XYZ[1] / D65[1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            L = np.where(yr > e, 116 * yr ** (1 / 3) - 16, K * yr)
+            u = 13 * L * (U(*XYZ) - U(*D65))
+            v = 13 * L * (V(*XYZ) - V(*D65))
+        return np.stack((L, u, v), axis=-1)
+
+    @property
+    def hls(self):
+        """
+        Returns an array of (hue, lightness, saturation) float values (between
+        0.0 and 1.0).
+        """
+        r, g, b = self._split(self._rgb)
+        maxc = np.maximum(np.maximum(r, g), b)
+        minc = np.minimum(np.minimum(r, g), b)
+        sumc = maxc + minc
+        rangec = maxc - minc
+        l = sumc / 2.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s = np.where(l <= 0.5, rangec / sumc, rangec / (2.0 - maxc - minc))
+        s = np.where(rangec == 0, 0.0, s)
+        return np.stack((_hue_array(r, g, b, maxc, rangec), l, s), axis=-1)
+
+    @property
+    def hsv(self):
+        """
+        Returns an array of (hue, saturation, value) float values (between 0.0
+        and 1.0).
+        """
+        r, g, b = self._split(self._rgb)
+        maxc = np.maximum(np.maximum(r, g), b)
+        minc = np.minimum(np.minimum(r, g), b)
+        rangec = maxc - minc
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s = np.where(rangec == 0, 0.0, rangec / maxc)
+        return np.stack((_hue_array(r, g, b, maxc, rangec), s, maxc), axis=-1)
+
+    @property
+    def hue(self):
+        """
+        Returns an array of the hue of each color (between 0.0 and 1.0).
+        """
+        return self.hls[..., 0]
+
+    @property
+    def lightness(self):
+        """
+        Returns an array of the lightness of each color.
+        """
+        return self.hls[..., 1]
+
+    @property
+    def saturation(self):
+        """
+        Returns an array of the saturation of each color.
+        """
+        return self.hls[..., 2]
+
+    def difference(self, other, method='euclid'):
+        """
+        Determines the difference between each of these colors and *other*,
+        using the specified *method*, and returns an array of the results.
+
+        *other* may be another :class:`ColorArray` or anything it can be
+        constructed from (including a single :class:`Color`), as long as its
+        shape can be `broadcast`_ against this array's. The methods, and the
+        formulae used, are the same as those of :meth:`Color.difference`. For
+        example, to find which of a set of reference colors each pixel of an
+        image is closest to::
+
+            >>> refs = ColorArray.from_colors(['red', 'green', 'blue'])
+            >>> pixels = ColorArray.from_rgb_bytes(image)
+            >>> nearest = np.argmin(
+            ...     pixels[..., np.newaxis, :].difference(refs, 'cie1976'),
+            ...     axis=-1)
+
+        .. _broadcast: https://docs.scipy.org/doc/numpy/user/basics.broadcasting.html
+        """
+        if not isinstance(other, ColorArray):
+            other = ColorArray(other)
+        if isinstance(method, bytes):
+            method = method.decode('ascii')
+        if method == 'euclid':
+            return np.sqrt(np.sum((self._rgb - other._rgb) ** 2, axis=-1))
+        elif method == 'cie1976':
+            return np.sqrt(np.sum((self.cie_lab - other.cie_lab) ** 2, axis=-1))
+        elif method.startswith('cie1994'):
+            return self._cie1994(other, method)
+        elif method == 'ciede2000':
+            return self._ciede2000(other)
+        else:
+            raise ValueError('invalid method: %s' % method)
+
+    def _cie1994(self, other, method):
+        L1, a1, b1 = self._split(self.cie_lab)
+        L2, a2, b2 = self._split(other.cie_lab)
+        dL = L1 - L2
+        C1 = np.sqrt(a1 ** 2 + b1 ** 2)
+        C2 = np.sqrt(a2 ** 2 + b2 ** 2)
+        dC = C1 - C2
+        dH2 = (a1 - a2) ** 2 + (b1 - b2) ** 2 - dC ** 2
+        kL, K1, K2 = {
+            'cie1994g': (1, 0.045, 0.015),
+            'cie1994t': (2, 0.048, 0.014),
+            }[method]
+        SC = 1 + K1 * C1
+        SH = 1 + K2 * C1
+        return np.sqrt((dL ** 2 / kL) + (dC ** 2 / SC) + (dH2 / SH))
+
+    def _ciede2000(self, other):
+        # This follows Color._ciede2000 exactly (including its calculation of
+        # C2 from the first color), so the two give the same results
+        L1, a1, b1 = self._split(self.cie_lab)
+        L2, a2, b2 = self._split(other.cie_lab)
+        L_ = (L1 + L2) / 2
+        dL = L2 - L1
+        C1 = np.sqrt(a1 ** 2 + b1 ** 2)
+        C2 = np.sqrt(a1 ** 2 + b1 ** 2)
+        C_ = (C1 + C2) / 2
+        dC = C2 - C1
+        G = (1 - np.sqrt(C_ ** 7 / (C_ ** 7 + 25 ** 7))) / 2
+        a1 = (1 + G) * a1
+        a2 = (1 + G) * a2
+        h1 = np.where((b1 == 0) & (a1 == 0), 0.0, np.degrees(np.arctan2(b1, a1)) % 360)
+        h2 = np.where((b2 == 0) & (a2 == 0), 0.0, np.degrees(np.arctan2(b2, a2)) % 360)
+        zero = C1 * C2 == 0.0
+        near = np.abs(h1 - h2) <= 180
+        dh = np.select(
+            [zero, near, h2 <= h1],
+            [0.0, h2 - h1, h2 - h1 + 360],
+            h2 - h1 - 360)
+        h_ = np.select(
+            [zero, near, h1 + h2 >= 360],
+            [h1 + h2, (h1 + h2) / 2, (h1 + h2 + 360) / 2],
+            (h1 + h2 - 360) / 2)
+        dH = 2 * np.sqrt(C1 * C2) * np.sin(np.radians(dh / 2))
+        T = (
+                1 -
+                0.17 * np.cos(np.radians(h_ - 30)) +
+                0.24 * np.cos(np.radians(2 * h_)) +
+                0.32 * np.cos(np.radians(3 * h_ + 6)) -
+                0.20 * np.cos(np.radians(4 * h_ - 63))
+                )
+        SL = 1 + (0.015 * (L_ - 50) ** 2) / np.sqrt(20 + (L_ - 50) ** 2)
+        SC = 1 + 0.045 * C_
+        SH = 1 + 0.015 * C_ * T
+        RT = -2 * np.sqrt(C_ ** 7 / (C_ ** 7 + 25 ** 7)) * np.sin(np.radians(60 * np.exp(-(((h_ - 275) / 25) ** 2))))
+        with np.errstate(invalid='ignore'):
+            return np.sqrt((dL / SL) ** 2 + (dC / SC) ** 2 + (dH / SH) ** 2 + RT * (dC / SC) * (dH / SH))
@@ -41,9 +41,10 @@ import datetime
 import threading
 import warnings
 import ctypes as ct
+from contextlib import contextmanager
 
 from . import bcm_host, mmal, mmalobj as mo
-from .frames import PiVideoFrame, PiVideoFrameType
+from .frames import PiVideoFrame, PiVideoFrameType, PiVideoFrameRecord
 from .exc import (
     PiCameraMMALError,
     PiCameraValueError,
@@ -162,6 +163,16 @@ class PiEncoder(object):
 
         The :class:`~mmalobj.MMALResizer` component, or ``None`` if no resizer
         component has been created.
+
+    .. attribute:: zero_copy
+
+        If ``True`` (set by the *zero_copy* option), outputs are written a
+        :class:`memoryview` of each MMAL buffer's memory instead of a
+        :class:`bytes` copy of it. The view is only valid until the output's
+        ``write`` method returns, so this must only be used with outputs that
+        copy the data they are given (as files, :class:`io.BytesIO` and
+        :class:`~picamera.CircularIO` do) rather than keeping a reference to
+        it.
     """
 
     DEBUG = 0
@@ -179,6 +190,7 @@ class PiEncoder(object):
         self.outputs = {}
         self.exception = None
         self.event = threading.Event()
+        self.zero_copy = options.pop('zero_copy', False)
         try:
             if parent and parent.closed:
                 raise PiCameraRuntimeError("Camera is closed")
@@ -284,8 +296,9 @@ class PiEncoder(object):
         The method is expected to return a boolean to indicate whether output
         is complete (``True``) or whether more data is expected (``False``).
 
-        The default implementation simply writes the contents of the buffer to
-        the output identified by *key*, and returns ``True`` if the buffer
+        The default implementation simply writes the contents of the buffer
+        (or a view of them, if :attr:`zero_copy` is set) to the output
+        identified by *key*, and returns ``True`` if the buffer
         flags indicate end of stream. Image encoders will typically override
         the return value to indicate ``True`` on end of frame (as they only
         wish to output a single image). Video encoders will typically override
@@ -295,7 +308,11 @@ class PiEncoder(object):
             with self.outputs_lock:
                 try:
                     output = self.outputs[key][0]
-                    written = output.write(buf.data)
+                    if self.zero_copy:
+                        with buf.view() as data:
+                            written = output.write(data)
+                    else:
+                        written = output.write(buf.data)
                 except KeyError:
                     # No output associated with the key type; discard the
                     # data
@@ -462,6 +479,10 @@ class MMALBufferAlphaStrip(mo.MMALBuffer):
     def data(self):
         return self._stripped
 
+    @contextmanager
+    def view(self):
+        yield memoryview(self._stripped)
+
 
 class PiRawMixin(PiEncoder):
     """
@@ -600,7 +621,8 @@ class PiVideoEncoder(PiEncoder):
         super(PiVideoEncoder, self).__init__(
                 parent, camera_port, input_port, format, resize, **options)
         self._next_output = []
-        self.frame = None
+        self._frame = None
+        self._frame_copy = (None, None)
 
     def _create_encoder(
             self, format, bitrate=17000000, intra_period=None, profile='high',
@@ -794,19 +816,33 @@ class PiVideoEncoder(PiEncoder):
         self.encoder.inputs[0].params[mmal.MMAL_PARAMETER_VIDEO_IMMUTABLE_INPUT] = True
         self.encoder.enable()
 
+    @property
+    def frame(self):
+        """
+        The :class:`PiVideoFrame` describing the most recent buffer output by
+        the encoder, or ``None`` if the encoder hasn't been started.
+
+        The encoder keeps this meta-data in a mutable
+        :class:`~picamera.frames.PiVideoFrameRecord`, so the
+        :class:`PiVideoFrame` is only constructed when this attribute is read
+        (and is reused until the next buffer arrives).
+        """
+        record = self._frame
+        if record is None:
+            return None
+        version, frame = self._frame_copy
+        if version != record.version:
+            version = record.version
+            frame = record.frame()
+            self._frame_copy = (version, frame)
+        return frame
+
     def start(self, output, motion_output=None):
         """
         Extended to initialize video frame meta-data tracking.
         """
-        self.frame = PiVideoFrame(
-                index=0,
-                frame_type=None,
-                frame_size=0,
-                video_size=0,
-                split_size=0,
-                timestamp=0,
-                complete=False,
-                )
+        self._frame = PiVideoFrameRecord()
+        self._frame_copy = (None, None)
         if motion_output is not None:
             self._open_output(motion_output, PiVideoFrameType.motion_data)
         super(PiVideoEncoder, self).start(output)
@@ -863,39 +899,33 @@ class PiVideoEncoder(PiEncoder):
         splitting video recording to the next output when :meth:`split` is
         called.
         """
-        self.frame = PiVideoFrame(
-            index=
-                self.frame.index + 1
-                if self.frame.complete else
-                self.frame.index,
-            frame_type=
-                PiVideoFrameType.key_frame
-                if buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_KEYFRAME else
-                PiVideoFrameType.sps_header
-                if buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_CONFIG else
-                PiVideoFrameType.motion_data
-                if buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_CODECSIDEINFO else
-                PiVideoFrameType.frame,
-            frame_size=
-                buf.length
-                if self.frame.complete else
-                self.frame.frame_size + buf.length,
-            video_size=
-                self.frame.video_size
-                if buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_CODECSIDEINFO else
-                self.frame.video_size + buf.length,
-            split_size=
-                self.frame.split_size
-                if buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_CODECSIDEINFO else
-                self.frame.split_size + buf.length,
-            timestamp=
-                None
-                if buf.pts in (0, mmal.MMAL_TIME_UNKNOWN) else
-                buf.pts,
-            complete=
-                bool(buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_FRAME_END),
-            )
-        if self._intra_period == 1 or (buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_CONFIG):
+        flags = buf.flags
+        length = buf.length
+        pts = buf.pts
+        # Update the frame meta-data in place; version is odd while the
+        # record is inconsistent (see PiVideoFrameRecord.frame)
+        frame = self._frame
+        frame.version += 1
+        if frame.complete:
+            frame.index += 1
+            frame.frame_size = length
+        else:
+            frame.frame_size += length
+        if flags & mmal.MMAL_BUFFER_HEADER_FLAG_KEYFRAME:
+            frame.frame_type = PiVideoFrameType.key_frame
+        elif flags & mmal.MMAL_BUFFER_HEADER_FLAG_CONFIG:
+            frame.frame_type = PiVideoFrameType.sps_header
+        elif flags & mmal.MMAL_BUFFER_HEADER_FLAG_CODECSIDEINFO:
+            frame.frame_type = PiVideoFrameType.motion_data
+        else:
+            frame.frame_type = PiVideoFrameType.frame
+        if not flags & mmal.MMAL_BUFFER_HEADER_FLAG_CODECSIDEINFO:
+            frame.video_size += length
+            frame.split_size += length
+        frame.timestamp = None if pts in (0, mmal.MMAL_TIME_UNKNOWN) else pts
+        frame.complete = bool(flags & mmal.MMAL_BUFFER_HEADER_FLAG_FRAME_END)
+        frame.version += 1
+        if self._intra_period == 1 or (flags & mmal.MMAL_BUFFER_HEADER_FLAG_CONFIG):
             with self.outputs_lock:
                 try:
                     new_outputs = self._next_output.pop(0)
@@ -906,17 +936,11 @@ class PiVideoEncoder(PiEncoder):
                     self._close_output(new_key)
                     self._open_output(new_output, new_key)
                     if new_key == PiVideoFrameType.frame:
-                        self.frame = PiVideoFrame(
-                                index=self.frame.index,
-                                frame_type=self.frame.frame_type,
-                                frame_size=self.frame.frame_size,
-                                video_size=self.frame.video_size,
-                                split_size=0,
-                                timestamp=self.frame.timestamp,
-                                complete=self.frame.complete,
-                                )
+                        frame.version += 1
+                        frame.split_size = 0
+                        frame.version += 1
                 self.event.set()
-        if buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_CODECSIDEINFO:
+        if flags & mmal.MMAL_BUFFER_HEADER_FLAG_CODECSIDEINFO:
             key = PiVideoFrameType.motion_data
         return super(PiVideoEncoder, self)._callback_write(buf, key)
 
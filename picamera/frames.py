@@ -214,3 +214,60 @@ class PiVideoFrame(namedtuple('PiVideoFrame', (
                 'PiVideoFrameType.sps_header instead'))
         return self.frame_type == PiVideoFrameType.sps_header
 
+
+
+class PiVideoFrameRecord(object):
+    """
+    A mutable record of the same fields as :class:`PiVideoFrame`.
+
+    :class:`~picamera.PiVideoEncoder` updates a single instance of this class
+    in place for every buffer it receives, rather than constructing a new
+    :class:`PiVideoFrame` each time; :meth:`frame` returns an immutable
+    :class:`PiVideoFrame` copy when one is actually needed.
+
+    As the record may be updated by the encoder's callback thread at any
+    time, :attr:`version` is incremented before and after each update (so it
+    is odd during an update); :meth:`frame` uses this to ensure it returns a
+    consistent copy. Users should never need this class directly.
+    """
+    __slots__ = PiVideoFrame._fields + ('version',)
+
+    def __init__(
+            self, index=0, frame_type=None, frame_size=0, video_size=0,
+            split_size=0, timestamp=0, complete=False):
+        self.index = index
+        self.frame_type = frame_type
+        self.frame_size = frame_size
+        self.video_size = video_size
+        self.split_size = split_size
+        self.timestamp = timestamp
+        self.complete = complete
+        self.version = 0
+
+    @property
+    def position(self):
+        """
+        Returns the zero-based position of the frame in the stream containing
+        it.
+        """
+        return self.split_size - self.frame_size
+
+    def frame(self):
+        """
+        Returns the record's current content as a :class:`PiVideoFrame`,
+        retrying if it is updated part way through.
+        """
+        while True:
+            version = self.version
+            if not version & 1:
+                result = PiVideoFrame(
+                    index=self.index,
+                    frame_type=self.frame_type,
+                    frame_size=self.frame_size,
+                    video_size=self.video_size,
+                    split_size=self.split_size,
+                    timestamp=self.timestamp,
+                    complete=self.complete,
+                    )
+                if self.version == version:
+                    return result
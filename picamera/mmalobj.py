@@ -47,6 +47,7 @@ import warnings
 import weakref
 from threading import Thread, Event
 from collections import namedtuple
+from contextlib import contextmanager
 from fractions import Fraction
 from itertools import cycle
 from functools import reduce
@@ -1738,6 +1739,42 @@ class MMALBuffer(object):
         mmal.mmal_buffer_header_mem_unlock(self._buf)
         return False
 
+    @contextmanager
+    def view(self):
+        """
+        Locks the buffer's memory, and returns a :class:`memoryview` of the
+        data held in the buffer (:attr:`length` bytes from :attr:`offset`),
+        for use as a context manager::
+
+            def callback(port, buf):
+                with buf.view() as data:
+                    output.write(data)
+
+        Unlike :attr:`data`, this doesn't copy the buffer's data, but the view
+        is only valid within the ``with`` block: it is released, and the
+        memory unlocked, at the end of the block, so anything that needs the
+        data afterwards must copy it. Under Python 2 (which lacks
+        :meth:`memoryview.cast`), the view is of a copy of the data.
+        """
+        with self as buf:
+            offset = self._buf[0].offset
+            length = self._buf[0].length
+            try:
+                whole = memoryview(buf).cast('B')
+            except AttributeError:
+                whole = memoryview(ct.string_at(ct.byref(buf, offset), length))
+                offset = 0
+            data = whole[offset:offset + length]
+            try:
+                yield data
+            finally:
+                try:
+                    data.release()
+                    whole.release()
+                except AttributeError:
+                    # Py2.7 doesn't have memoryview.release
+                    pass
+
     def __repr__(self):
         if self._buf is not None:
             return '<MMALBuffer object: flags=%s command=%s length=%d>' % (
@@ -1759,6 +1796,53 @@ class MMALBuffer(object):
             return '<MMALBuffer object: ???>'
 
 
+class MMALLocalBuffer(MMALBuffer):
+    """
+    A stand-in for an :class:`MMALBuffer` whose header and data are allocated
+    by Python, rather than taken from an MMAL pool.
+
+    This is intended for testing code that handles buffers (e.g. encoder
+    callbacks like :meth:`~picamera.PiEncoder._callback_write`, or outputs)
+    without a camera. *size* is the number of bytes allocated for data; the
+    other attributes behave as they do for MMAL's buffers, but locking the
+    buffer's memory does nothing, and :meth:`acquire`, :meth:`release` and
+    :meth:`reset` only affect the header (there is no pool to return the
+    buffer to)::
+
+        buf = MMALLocalBuffer(1024)
+        buf.data = b'frame data'
+        buf.flags = mmal.MMAL_BUFFER_HEADER_FLAG_FRAME_END
+        encoder._callback_write(buf)
+    """
+    __slots__ = ('_header', '_type', '_memory')
+
+    def __init__(self, size):
+        self._header = mmal.MMAL_BUFFER_HEADER_T()
+        self._type = mmal.MMAL_BUFFER_HEADER_TYPE_SPECIFIC_T()
+        self._memory = (ct.c_uint8 * size)()
+        super(MMALLocalBuffer, self).__init__(ct.pointer(self._header))
+        self.reset()
+
+    def acquire(self):
+        pass
+
+    def release(self):
+        pass
+
+    def reset(self):
+        ct.memset(ct.byref(self._header), 0, ct.sizeof(self._header))
+        self._header.data = ct.cast(self._memory, ct.POINTER(ct.c_uint8))
+        self._header.alloc_size = len(self._memory)
+        self._header.type = ct.pointer(self._type)
+        self._header.pts = self._header.dts = mmal.MMAL_TIME_UNKNOWN
+
+    def __enter__(self):
+        return self._memory
+
+    def __exit__(self, *exc):
+        return False
+
+
 class MMALQueue(object):
     """
     Represents an MMAL buffer queue. Buffers can be added to the queue with the
@@ -0,0 +1,439 @@
+# vim: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Python camera library for the Rasperry-Pi camera module
+# Copyright (c) 2013-2017 Dave Jones <dave@waveform.org.uk>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+The :mod:`picamera.motion` module provides vectorized analysis of the motion
+vector data produced by the H.264 encoder (see
+:class:`~picamera.array.PiMotionArray` and
+:class:`~picamera.array.PiMotionAnalysis`), using `numpy`_.
+
+Each function accepts either a single frame of motion data, as passed to
+:meth:`~picamera.array.PiAnalysisOutput.analyze` with shape ``(rows, cols)``,
+or a whole recording, as in :attr:`~picamera.array.PiArrayOutput.array` with shape ``(frames,
+rows, cols)``. Results have the same leading dimensions, so a recording can be
+analyzed in one call rather than a Python loop over its frames.
+
+.. _numpy: http://www.numpy.org/
+"""
+
+from __future__ import (
+    unicode_literals,
+    print_function,
+    division,
+    absolute_import,
+    )
+
+# Make Py2's str and range equivalent to Py3's
+native_str = str
+str = type('')
+try:
+    range = xrange
+except NameError:
+    pass
+
+from collections import namedtuple
+
+import numpy as np
+
+from .exc import PiCameraValueError
+from .array import PiMotionAnalysis
+
+
+blob_dtype = np.dtype([
+    (native_str('frame'), np.int32),
+    (native_str('label'), np.int32),
+    (native_str('size'),  np.int32),
+    (native_str('row'),   np.float32),
+    (native_str('col'),   np.float32),
+    (native_str('x'),     np.float32),
+    (native_str('y'),     np.float32),
+    (native_str('sad'),   np.float32),
+    ])
+
+
+region_dtype = np.dtype([
+    (native_str('size'),      np.int32),
+    (native_str('x'),         np.float32),
+    (native_str('y'),         np.float32),
+    (native_str('magnitude'), np.float32),
+    (native_str('sad'),       np.float32),
+    ])
+
+
+def motion_magnitude(a):
+    """
+    Returns the magnitude of each motion vector in *a* (an array of
+    :data:`~picamera.array.motion_dtype`) as an array of floats with the same
+    shape.
+    """
+    return np.hypot(a['x'].astype(np.float32), a['y'].astype(np.float32))
+
+
+def motion_direction(a):
+    """
+    Returns the direction of each motion vector in *a* as an array of angles
+    in radians, between -pi and pi, measured from the positive x axis towards
+    the positive y axis (i.e. clockwise, as rows are numbered downwards).
+    """
+    return np.arctan2(a['y'].astype(np.float32), a['x'].astype(np.float32))
+
+
+def motion_mask(a, threshold=2.0, max_sad=None):
+    """
+    Returns a boolean array which is ``True`` where the magnitude of the motion
+    vector in *a* is at least *threshold*.
+
+    Blocks where the encoder's match was poor, with a `sum of absolute
+    differences`_ above *max_sad*, are excluded if *max_sad* is given, as their
+    vectors are unreliable.
+
+    .. _sum of absolute differences: https://en.wikipedia.org/wiki/Sum_of_absolute_differences
+    """
+    # Compare squared magnitudes, to avoid the square root
+    x = a['x'].astype(np.int32)
+    y = a['y'].astype(np.int32)
+    result = (x * x + y * y) >= threshold * threshold
+    if max_sad is not None:
+        result &= a['sad'] <= max_sad
+    return result
+
+
+def _frame_shape(a):
+    # The leading (frame) dimensions of a motion array, and their size
+    frames = a.shape[:-2]
+    return frames, int(np.prod(frames))
+
+
+def direction_histogram(a, bins=8, mask=None):
+    """
+    Returns a histogram of the directions of the motion vectors in *a* for
+    each frame, with shape ``(..., bins)``.
+
+    The bins divide the circle equally, with the first centred on the positive
+    x axis and the rest following clockwise (see :func:`motion_direction`). If
+    *mask* is given (e.g. from :func:`motion_mask`) only the vectors where it
+    is ``True`` are counted; otherwise zero vectors are excluded.
+    """
+    if mask is None:
+        mask = (a['x'] != 0) | (a['y'] != 0)
+    frames, n = _frame_shape(a)
+    width = 2 * np.pi / bins
+    index = np.floor(motion_direction(a) / width + 0.5).astype(np.intp) % bins
+    index += (np.arange(n) * bins).reshape(frames + (1, 1))
+    return np.bincount(
+        index[mask], minlength=n * bins).reshape(frames + (bins,))
+
+
+def region_means(a, regions):
+    """
+    Returns the mean motion in each of a set of regions, for each frame in *a*.
+
+    *regions* is an integer array with the shape of a frame, ``(rows,
+    cols)``, in which zero marks blocks to ignore and 1 to *n* mark the blocks
+    in each region. The result is an array of :data:`region_dtype` with shape
+    ``(..., n)``, where element ``i`` describes region ``i + 1``: its ``size``
+    in blocks and its mean ``x``, ``y``, ``magnitude`` and ``sad``.
+    """
+    regions = np.asarray(regions)
+    if regions.shape != a.shape[-2:]:
+        raise PiCameraValueError(
+            'regions of shape %r do not match motion data of shape %r' % (
+                regions.shape, a.shape[-2:]))
+    count = int(regions.max())
+    frames, n = _frame_shape(a)
+    inside = np.broadcast_to(regions > 0, a.shape)
+    index = np.broadcast_to(regions, a.shape).astype(np.intp) - 1
+    index += (np.arange(n) * count).reshape(frames + (1, 1))
+    index = index[inside]
+    result = np.zeros(frames + (count,), dtype=region_dtype)
+    sizes = np.bincount(regions.ravel(), minlength=count + 1)[1:]
+    result['size'] = sizes
+    sizes = np.maximum(sizes, 1)
+    for field, values in (
+            ('x', a['x']), ('y', a['y']), ('magnitude', motion_magnitude(a)),
+            ('sad', a['sad'])):
+        result[field] = np.bincount(
+            index, weights=values[inside], minlength=n * count
+            ).reshape(frames + (count,)) / sizes
+    return result
+
+
+def _neighbours(labels, connectivity):
+    # Yield views of labels shifted by one block in each direction, within
+    # each frame (labels is padded by one block around each frame)
+    yield labels[..., :-2, 1:-1]
+    yield labels[..., 2:, 1:-1]
+    yield labels[..., 1:-1, :-2]
+    yield labels[..., 1:-1, 2:]
+    if connectivity == 8:
+        yield labels[..., :-2, :-2]
+        yield labels[..., :-2, 2:]
+        yield labels[..., 2:, :-2]
+        yield labels[..., 2:, 2:]
+
+
+def motion_blobs(mask, connectivity=4):
+    """
+    Labels the connected groups ("blobs") of ``True`` blocks in *mask* (e.g.
+    from :func:`motion_mask`), separately for each frame.
+
+    Blocks are connected to their horizontal and vertical neighbours, and also
+    to their diagonal neighbours if *connectivity* is 8. Returns a tuple of
+    ``(labels, counts)``: *labels* is an integer array with the shape of
+    *mask*, which is zero outside the blobs and numbers the blobs in each frame
+    from 1, and *counts* is the number of blobs in each frame.
+
+    All frames are labelled together: each block starts with its own label,
+    and repeatedly takes the smallest label of its neighbours, so this takes
+    as many whole-array steps as the longest path across a blob (halved at
+    each step by following labels to the block they came from).
+    """
+    if connectivity not in (4, 8):
+        raise PiCameraValueError('connectivity must be 4 or 8')
+    mask = np.asarray(mask, dtype=bool)
+    frames, n = _frame_shape(mask)
+    rows, cols = mask.shape[-2:]
+    size = mask.size
+    # Each block's label is the flat index of a block in the same blob; the
+    # background is labelled size, which is larger than any block's label
+    flat = np.where(mask.ravel(), np.arange(size), size)
+    pad = [(0, 0)] * len(frames) + [(1, 1), (1, 1)]
+    while True:
+        labels = np.pad(
+            flat.reshape(mask.shape), pad, mode='constant', constant_values=size)
+        smallest = labels[..., 1:-1, 1:-1].copy()
+        for neighbour in _neighbours(labels, connectivity):
+            np.minimum(smallest, neighbour, out=smallest)
+        smallest = np.where(mask, smallest, size).ravel()
+        # Follow each label to the block it came from, which may by now have
+        # a smaller label itself
+        inside = smallest < size
+        smallest[inside] = smallest[smallest[inside]]
+        if np.array_equal(smallest, flat):
+            break
+        flat = smallest
+    # Renumber the blobs of each frame from 1; as labels are flat indices,
+    # sorting them groups them by frame
+    inside = flat < size
+    unique, inverse = np.unique(flat[inside], return_inverse=True)
+    counts = np.bincount(unique // (rows * cols), minlength=n)
+    first = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = np.zeros(size, dtype=np.int32)
+    result[inside] = inverse - np.repeat(first, counts)[inverse] + 1
+    return result.reshape(mask.shape), counts.reshape(frames)
+
+
+def blob_properties(a, labels, counts):
+    """
+    Describes each blob found by :func:`motion_blobs` in the motion data *a*.
+
+    Returns a one-dimensional array of :data:`blob_dtype`, with a record for
+    each blob, ordered by frame and label. Each record contains the (flat)
+    index of its ``frame``, its ``label`` within the frame, its ``size`` in
+    blocks, the mean ``row`` and ``col`` of its blocks (its centroid), and its
+    mean ``x``, ``y`` and ``sad``.
+    """
+    frames, n = _frame_shape(a)
+    counts = np.asarray(counts).ravel()
+    total = int(counts.sum())
+    first = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    # Give each blob in the whole array a unique index
+    index = labels.astype(np.intp) - 1
+    index += first.reshape(frames + (1, 1))
+    inside = labels > 0
+    index = index[inside]
+    result = np.zeros(total, dtype=blob_dtype)
+    result['frame'] = np.repeat(np.arange(n), counts)
+    result['label'] = np.arange(total) - np.repeat(first, counts) + 1
+    sizes = np.bincount(index, minlength=total)
+    result['size'] = sizes
+    rows, cols = np.indices(a.shape[-2:])
+    for field, values in (
+            ('row', np.broadcast_to(rows, a.shape)),
+            ('col', np.broadcast_to(cols, a.shape)),
+            ('x', a['x']), ('y', a['y']), ('sad', a['sad'])):
+        result[field] = np.bincount(
+            index, weights=values[inside], minlength=total) / sizes
+    return result
+
+
+class PiMotionStatistics(namedtuple('PiMotionStatistics', (
+    'magnitude',  # 0
+    'mask',       # 1
+    'histogram',  # 2
+    'regions',    # 3
+    'labels',     # 4
+    'counts',     # 5
+    'blobs',      # 6
+    ))):
+    """
+    This class is a :func:`~collections.namedtuple` derivative holding the
+    results of :func:`motion_statistics`.
+
+    .. attribute:: magnitude
+
+        The magnitude of each motion vector (see :func:`motion_magnitude`).
+
+    .. attribute:: mask
+
+        Which blocks are moving (see :func:`motion_mask`).
+
+    .. attribute:: histogram
+
+        The directions of the moving blocks' vectors (see
+        :func:`direction_histogram`).
+
+    .. attribute:: regions
+
+        The mean motion in each region, or ``None`` if no regions were given
+        (see :func:`region_means`).
+
+    .. attribute:: labels
+
+        The blob each moving block belongs to (see :func:`motion_blobs`).
+
+    .. attribute:: counts
+
+        The number of blobs in each frame.
+
+    .. attribute:: blobs
+
+        A description of each blob (see :func:`blob_properties`).
+    """
+
+    __slots__ = () # workaround python issue #24931
+
+
+def motion_statistics(
+        a, threshold=2.0, max_sad=None, bins=8, regions=None, connectivity=4):
+    """
+    Calculates all the statistics provided by this module for the motion data
+    *a*, which may be a single frame or a whole recording, and returns them as
+    a :class:`PiMotionStatistics` tuple. The parameters are passed on to
+    :func:`motion_mask`, :func:`direction_histogram`, :func:`region_means`
+    and :func:`motion_blobs`.
+
+    For example, to count the frames of a recording in which something moved
+    through the middle third of the frame::
+
+        import numpy as np
+        import picamera
+        import picamera.array
+        import picamera.motion
+
+        with picamera.PiCamera() as camera:
+            with picamera.array.PiMotionArray(camera) as output:
+                camera.resolution = (640, 480)
+                camera.start_recording(
+                      '/dev/null', format='h264', motion_output=output)
+                camera.wait_recording(30)
+                camera.stop_recording()
+                regions = np.zeros(output.array.shape[1:], dtype=np.int8)
+                regions[:, regions.shape[1] // 3:2 * regions.shape[1] // 3] = 1
+                stats = picamera.motion.motion_statistics(
+                    output.array, regions=regions)
+                moving = stats.regions['magnitude'][:, 0] > 1
+                print('%d frames with motion' % moving.sum())
+    """
+    mask = motion_mask(a, threshold, max_sad)
+    labels, counts = motion_blobs(mask, connectivity)
+    return PiMotionStatistics(
+        magnitude=motion_magnitude(a),
+        mask=mask,
+        histogram=direction_histogram(a, bins, mask),
+        regions=None if regions is None else region_means(a, regions),
+        labels=labels,
+        counts=counts,
+        blobs=blob_properties(a, labels, counts),
+        )
+
+
+class PiMotionStatisticsAnalysis(PiMotionAnalysis):
+    """
+    Calculates the :func:`motion_statistics` of each frame of motion data
+    during recording.
+
+    This extends :class:`~picamera.array.PiMotionAnalysis`: each frame's
+    motion data is passed to :func:`motion_statistics` with the given
+    *threshold*, *max_sad*, *bins*, *regions* and *connectivity*, and the
+    resulting :class:`PiMotionStatistics` is passed to the stub
+    :meth:`analyze_statistics` method (which deliberately raises
+    :exc:`NotImplementedError` in this class). For example, a crude detector
+    of objects crossing the frame::
+
+        import picamera
+        import picamera.motion
+
+        class DetectObjects(picamera.motion.PiMotionStatisticsAnalysis):
+            def analyze_statistics(self, stats):
+                big = stats.blobs[stats.blobs['size'] > 10]
+                for blob in big:
+                    print('Object at %.1f, %.1f' % (blob['col'], blob['row']))
+
+        with picamera.PiCamera() as camera:
+            with DetectObjects(camera, threshold=3) as output:
+                camera.resolution = (640, 480)
+                camera.start_recording(
+                      '/dev/null', format='h264', motion_output=output)
+                camera.wait_recording(30)
+                camera.stop_recording()
+
+    To keep the statistics off the camera's callback thread, combine this
+    class with :class:`~picamera.array.PiThreadedAnalysisMixin`, which takes
+    its own parameters and passes the rest on::
+
+        import picamera.array
+
+        class ThreadedDetectObjects(
+                picamera.array.PiThreadedAnalysisMixin, DetectObjects):
+            pass
+
+        output = ThreadedDetectObjects(camera, threshold=3, workers=2)
+    """
+
+    def __init__(
+            self, camera, size=None, threshold=2.0, max_sad=None, bins=8,
+            regions=None, connectivity=4):
+        super(PiMotionStatisticsAnalysis, self).__init__(camera, size)
+        self.threshold = threshold
+        self.max_sad = max_sad
+        self.bins = bins
+        self.regions = regions
+        self.connectivity = connectivity
+
+    def analyze(self, array):
+        self.analyze_statistics(motion_statistics(
+            array, self.threshold, self.max_sad, self.bins, self.regions,
+            self.connectivity))
+
+    def analyze_statistics(self, stats):
+        """
+        Stub method for users to override.
+        """
+        raise NotImplementedError
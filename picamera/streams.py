@@ -39,10 +39,15 @@ str = type('')
 
 
 import io
+import os
+import mmap
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
 from threading import RLock
 from collections import deque
 
-from picamera.exc import PiCameraValueError
+from picamera.exc import PiCameraValueError, PiCameraRuntimeError
 from picamera.frames import PiVideoFrame, PiVideoFrameType
 
 
@@ -524,6 +529,417 @@ class CircularIO(io.IOBase):
             return result
 
 
+def _byte_view(b):
+    """
+    Return a one-dimensional, unsigned byte :class:`memoryview` of *b*.
+
+    The view refers to *b*'s own memory wherever possible; a copy is only made
+    for buffers that cannot be cast (non-contiguous buffers, or any buffer
+    other than ``str`` under Py2.7 which lacks :meth:`memoryview.cast`).
+    """
+    view = memoryview(b)
+    if view.ndim != 1 or view.format != 'B':
+        try:
+            view = view.cast('B')
+        except (AttributeError, TypeError):
+            view = memoryview(view.tobytes())
+    return view
+
+
+class PreallocatedCircularIO(CircularIO):
+    """
+    A :class:`CircularIO` which stores its content in a single preallocated
+    :class:`bytearray`.
+
+    :class:`CircularIO` copies every write into a new :class:`bytes` object
+    and keeps the chunks in a :class:`~collections.deque`, so a busy encoder
+    causes an allocation (and later a deallocation) for every buffer it
+    writes. This class instead allocates *size* bytes up front and copies each
+    write straight into that storage, wrapping around its end when it is
+    full; writing (at the end of the stream, or in the middle) never
+    allocates. :meth:`readinto` likewise copies directly into the caller's
+    buffer.
+
+    The stream behaves identically to :class:`CircularIO`, with the same
+    :attr:`~CircularIO.lock`, except that as the stream no longer remembers
+    where each write started and ended, :meth:`read1` returns content up to
+    the point where the storage wraps around, rather than up to the end of
+    the write which added it.
+    """
+    def __init__(self, size):
+        super(PreallocatedCircularIO, self).__init__(size)
+        self._data = self._allocate(size)
+        self._view = memoryview(self._data)
+        # _start is the offset in _data of the first byte of the stream, and
+        # _discarded the number of bytes that have been dropped from the
+        # start of the stream to make room for new content
+        self._start = 0
+        self._discarded = 0
+
+    def _allocate(self, size):
+        # Return the writable buffer used for storage
+        return bytearray(size)
+
+    def close(self):
+        super(PreallocatedCircularIO, self).close()
+        try:
+            self._view.release()
+        except AttributeError:
+            # Py2.7 doesn't have memoryview.release
+            pass
+
+    def _set_pos(self, value):
+        self._pos = value
+
+    def _copy_out(self, pos, b):
+        # Copy len(b) bytes, starting at stream position pos, to the
+        # memoryview b; this must not extend beyond the end of the stream
+        offset = (self._start + pos) % self._size
+        head = min(len(b), self._size - offset)
+        b[:head] = self._view[offset:offset + head]
+        if head < len(b):
+            b[head:] = self._view[:len(b) - head]
+
+    def _copy_in(self, pos, b):
+        # Copy the memoryview b to stream position pos; len(b) must not
+        # exceed the size of the ring
+        offset = (self._start + pos) % self._size
+        head = min(len(b), self._size - offset)
+        self._view[offset:offset + head] = b[:head]
+        if head < len(b):
+            self._view[:len(b) - head] = b[head:]
+
+    def getvalue(self):
+        """
+        Return ``bytes`` containing the entire contents of the buffer.
+        """
+        with self.lock:
+            result = bytearray(self._length)
+            self._copy_out(0, memoryview(result))
+            return bytes(result)
+
+    def read(self, n=-1):
+        """
+        Read up to *n* bytes from the stream and return them. As a convenience,
+        if *n* is unspecified or -1, :meth:`readall` is called. Fewer than *n*
+        bytes may be returned if there are fewer than *n* bytes from the
+        current stream position to the end of the stream.
+
+        If 0 bytes are returned, and *n* was not 0, this indicates end of the
+        stream.
+        """
+        self._check_open()
+        if n < 0:
+            return self.readall()
+        with self.lock:
+            n = min(n, self._length - self._pos)
+            if n <= 0:
+                return b''
+            offset = (self._start + self._pos) % self._size
+            head = min(n, self._size - offset)
+            result = self._view[offset:offset + head].tobytes()
+            if head < n:
+                result += self._view[:n - head].tobytes()
+            self._pos += n
+            return result
+
+    def readinto(self, b):
+        """
+        Read bytes into a pre-allocated, writable bytes-like object *b*, and
+        return the number of bytes read. Fewer than ``len(b)`` bytes are read
+        if there are fewer than that from the current stream position to the
+        end of the stream.
+        """
+        self._check_open()
+        b = _byte_view(b)
+        if b.readonly:
+            raise ValueError('buffer object is not writeable')
+        with self.lock:
+            n = max(0, min(len(b), self._length - self._pos))
+            if n:
+                self._copy_out(self._pos, b[:n])
+                self._pos += n
+            return n
+
+    def read1(self, n=-1):
+        """
+        Read up to *n* bytes from the stream using only a single call to the
+        underlying object.
+
+        In the case of :class:`PreallocatedCircularIO` this returns the content
+        from the current position up to the point at which the underlying
+        storage wraps around (or the end of the stream, if that comes first).
+        """
+        self._check_open()
+        with self.lock:
+            offset = (self._start + self._pos) % self._size
+            available = min(self._length - self._pos, self._size - offset)
+            if available <= 0:
+                return b''
+            if n < 0:
+                n = available
+            result = self._view[offset:offset + min(n, available)].tobytes()
+            self._pos += len(result)
+            return result
+
+    def truncate(self, size=None):
+        """
+        Resize the stream to the given *size* in bytes (or the current position
+        if *size* is not specified). This resizing can extend or reduce the
+        current stream size. In case of extension, the contents of the new file
+        area will be NUL (``\\x00``) bytes. The new stream size is returned.
+
+        The current stream position isn’t changed unless the resizing is
+        expanding the stream, in which case it may be set to the maximum stream
+        size if the expansion causes the ring buffer to loop around.
+        """
+        self._check_open()
+        with self.lock:
+            if size is None:
+                size = self._pos
+            if size < 0:
+                raise ValueError('size must be zero, or a positive integer')
+            if size > self._length:
+                # Backfill the space between stream end and current position
+                # with NUL bytes
+                fill = bytearray(size - self._length)
+                self._pos = self._length
+                self.write(fill)
+            else:
+                self._length = size
+            return self._length
+
+    def write(self, b):
+        """
+        Write the given bytes-like object, *b*, to the underlying stream and
+        return the number of bytes written.
+        """
+        self._check_open()
+        b = _byte_view(b)
+        with self.lock:
+            # Special case: stream position is beyond the end of the stream.
+            # Call truncate to backfill space first
+            if self._pos > self._length:
+                self.truncate()
+            result = len(b)
+            end = self._pos + result
+            # If the stream would grow beyond the specified size limit, the
+            # excess is dropped from its start, including the start of b if
+            # b extends all the way back there
+            excess = max(0, end - self._size)
+            skip = max(0, excess - self._pos)
+            self._copy_in(self._pos + skip, b[skip:])
+            self._start = (self._start + excess) % self._size
+            self._discarded += excess
+            self._length = max(self._length, end) - excess
+            self._pos = end - excess
+            return result
+
+
+class PiCameraFrameIndex(object):
+    """
+    A compact index of the frames recorded to a :class:`PiCameraCircularIO`.
+
+    The meta-data of each complete frame is kept in parallel arrays (end
+    position, size, timestamp, type and index), with a separate list of the
+    frames of each type, so that the start of a copy can be found by
+    bisection rather than by walking back through every frame. Positions are
+    measured from the start of the recording (:attr:`written` counts every
+    byte appended to the stream), so they don't change as the ring buffer
+    discards old content; :meth:`discard_before` forgets frames whose start
+    has been discarded.
+
+    Frame numbers passed to and returned by the methods of this class are
+    also counted from the start of the recording. Users should never need
+    this class directly.
+    """
+    # Frames are forgotten in batches of at least this many, to keep
+    # discarding cheap
+    compact_threshold = 1024
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """
+        Forget all frames, and reset :attr:`written` to zero.
+        """
+        self.written = 0
+        # _base is the number of the frame at the start of the arrays, and
+        # _first the number of the first frame which is still in the stream
+        self._base = 0
+        self._first = 0
+        self._indexes = array('d')
+        self._ends = array('d')
+        self._sizes = array('d')
+        # _offsets is the total size of all frames before each one
+        self._offsets = array('d')
+        # Unknown timestamps are filled with the previous known one (so the
+        # array can be bisected), and marked as such in _stamped
+        self._timestamps = array('d')
+        self._stamped = array('b')
+        self._types = array('b')
+        self._by_type = {}
+        self._total_size = 0
+        self._last_timestamp = float('-inf')
+
+    def __len__(self):
+        return self._base + len(self._ends) - self._first
+
+    def add_chunk(self, size, frame=None):
+        """
+        Record that *size* bytes were appended to the stream. If they complete
+        a frame, *frame* is its :class:`PiVideoFrame`.
+        """
+        self.written += size
+        if frame is not None:
+            self._by_type.setdefault(frame.frame_type, array('d')).append(
+                self._base + len(self._ends))
+            self._indexes.append(frame.index)
+            self._ends.append(self.written)
+            self._sizes.append(frame.frame_size)
+            self._offsets.append(self._total_size)
+            self._total_size += frame.frame_size
+            if frame.timestamp is not None:
+                self._last_timestamp = frame.timestamp
+            self._timestamps.append(self._last_timestamp)
+            self._stamped.append(frame.timestamp is not None)
+            self._types.append(frame.frame_type)
+
+    def discard_before(self, position):
+        """
+        Forget the frames which start before *position* (measured from the
+        start of the recording).
+        """
+        end = self._base + len(self._ends)
+        while (
+                self._first < end and
+                self._ends[self._first - self._base] -
+                self._sizes[self._first - self._base] < position):
+            self._first += 1
+        discard = self._first - self._base
+        if discard >= max(self.compact_threshold, len(self._ends) // 2):
+            for a in (
+                    self._indexes, self._ends, self._sizes, self._offsets,
+                    self._timestamps, self._stamped, self._types):
+                del a[:discard]
+            for a in self._by_type.values():
+                del a[:bisect_left(a, self._first)]
+            self._base = self._first
+
+    def truncate(self, position):
+        """
+        Forget the frames which end after *position* (measured from the start
+        of the recording), and rewind :attr:`written` to it.
+        """
+        keep = bisect_right(self._ends, position)
+        if keep < len(self._ends):
+            self._total_size = self._offsets[keep]
+            self._last_timestamp = (
+                self._timestamps[keep - 1] if keep else float('-inf'))
+            for a in (
+                    self._indexes, self._ends, self._sizes, self._offsets,
+                    self._timestamps, self._stamped, self._types):
+                del a[keep:]
+            for a in self._by_type.values():
+                del a[bisect_left(a, self._base + keep):]
+            self._first = min(self._first, self._base + keep)
+        self.written = position
+
+    def frame(self, n, offset=0):
+        """
+        Return the :class:`PiVideoFrame` for frame number *n*, with its
+        positions measured relative to *offset* (the number of bytes that have
+        been discarded from the start of the stream).
+        """
+        i = n - self._base
+        end = int(self._ends[i]) - offset
+        return PiVideoFrame(
+            index=int(self._indexes[i]),
+            frame_type=self._types[i],
+            frame_size=int(self._sizes[i]),
+            video_size=end,
+            split_size=end,
+            timestamp=int(self._timestamps[i]) if self._stamped[i] else None,
+            complete=True,
+            )
+
+    def start(self, n):
+        """
+        Return the position (from the start of the recording) at which frame
+        number *n* starts.
+        """
+        i = n - self._base
+        return int(self._ends[i] - self._sizes[i])
+
+    def frame_numbers(self):
+        """
+        Return the range of the numbers of the frames in the index.
+        """
+        return range(self._first, self._base + len(self._ends))
+
+    def _first_of_type(self, n, frame_type):
+        # The first frame, from number n onwards, of the given type (or of
+        # any type if frame_type is None)
+        end = self._base + len(self._ends)
+        if frame_type is None:
+            return n if n < end else None
+        frames = self._by_type.get(frame_type, ())
+        i = bisect_left(frames, n)
+        return int(frames[i]) if i < len(frames) else None
+
+    def find_all(self, first_frame):
+        """
+        Return the number of the first frame of type *first_frame* (or of any
+        type if it's ``None``), or ``None`` if there isn't one.
+        """
+        return self._first_of_type(self._first, first_frame)
+
+    def find_size(self, size, first_frame):
+        """
+        Return the number of the first frame of type *first_frame* from which
+        the rest of the frames fit in *size* bytes, or the last frame if it
+        alone doesn't fit.
+        """
+        lo = self._first - self._base
+        if lo == len(self._ends):
+            return None
+        i = bisect_left(self._offsets, self._total_size - size, lo) - 1
+        return self._first_of_type(self._base + max(i, lo), first_frame)
+
+    def find_seconds(self, seconds, first_frame):
+        """
+        Return the number of the first frame of type *first_frame* in the last
+        *seconds* of the recording. The frame with the latest timestamp
+        *seconds* before the last frame's is included.
+        """
+        lo = self._first - self._base
+        if lo == len(self._ends):
+            return None
+        # The frame with the last known timestamp sets the limit, so the
+        # search is among the frames before it
+        last = len(self._ends) - 1
+        while last > lo and not self._stamped[last]:
+            last -= 1
+        limit = self._timestamps[last] - int(seconds * 1000000)
+        i = bisect_right(self._timestamps, limit, lo, last) - 1
+        while i >= lo and not self._stamped[i]:
+            i -= 1
+        return self._first_of_type(self._base + max(i, lo), first_frame)
+
+
+def _completed_frame(encoder):
+    # Return the meta-data of the frame that the encoder's last buffer
+    # completed, or None if it didn't complete a frame. PiVideoEncoder's
+    # mutable frame record is used directly where possible, to avoid
+    # constructing a PiVideoFrame for every buffer
+    try:
+        frame = encoder._frame
+    except AttributeError:
+        frame = encoder.frame
+    return frame if frame.complete else None
+
+
 class PiCameraDequeHack(deque):
     def __init__(self, camera, splitter_port=1):
         super(PiCameraDequeHack, self).__init__()
@@ -533,32 +949,15 @@ class PiCameraDequeHack(deque):
             raise PiCameraValueError('camera must be a valid PiCamera object')
         self.camera = camera
         self.splitter_port = splitter_port
+        self.index = PiCameraFrameIndex()
 
     def append(self, item):
-        encoder = self.camera._encoders[self.splitter_port]
-        if encoder.frame.complete:
-            # If the chunk being appended is the end of a new frame, include
-            # the frame's metadata from the camera
-            return super(PiCameraDequeHack, self).append((item, encoder.frame))
-        else:
-            return super(PiCameraDequeHack, self).append((item, None))
-
-    def pop(self):
-        return super(PiCameraDequeHack, self).pop()[0]
-
-    def popleft(self):
-        return super(PiCameraDequeHack, self).popleft()[0]
-
-    def __getitem__(self, index):
-        return super(PiCameraDequeHack, self).__getitem__(index)[0]
-
-    def __setitem__(self, index, value):
-        frame = super(PiCameraDequeHack, self).__getitem__(index)[1]
-        return super(PiCameraDequeHack, self).__setitem__(index, (value, frame))
-
-    def __iter__(self):
-        for item, frame in super(PiCameraDequeHack, self).__iter__():
-            yield item
+        super(PiCameraDequeHack, self).append(item)
+        # If the chunk being appended is the end of a new frame, include
+        # the frame's metadata from the camera in the index
+        self.index.add_chunk(
+            len(item),
+            _completed_frame(self.camera._encoders[self.splitter_port]))
 
 
 class PiCameraDequeFrames(object):
@@ -568,46 +967,142 @@ class PiCameraDequeFrames(object):
 
     def __iter__(self):
         with self.stream.lock:
-            pos = 0
-            for item, frame in super(PiCameraDequeHack, self.stream._data).__iter__():
-                pos += len(item)
-                if frame:
-                    # Rewrite the video_size and split_size attributes according
-                    # to the current position of the chunk
-                    frame = PiVideoFrame(
-                        index=frame.index,
-                        frame_type=frame.frame_type,
-                        frame_size=frame.frame_size,
-                        video_size=pos,
-                        split_size=pos,
-                        timestamp=frame.timestamp,
-                        complete=frame.complete,
-                        )
-                    # Only yield the frame meta-data if the start of the frame
-                    # still exists in the stream
-                    if pos - frame.frame_size >= 0:
-                        yield frame
+            index = self.stream._index
+            offset = index.written - self.stream._length
+            for n in index.frame_numbers():
+                # Only yield the frame meta-data if the start of the frame
+                # still exists in the stream
+                if index.start(n) >= offset:
+                    yield index.frame(n, offset)
 
     def __reversed__(self):
         with self.stream.lock:
-            pos = self.stream._length
-            for item, frame in super(PiCameraDequeHack, self.stream._data).__reversed__():
-                if frame:
-                    frame = PiVideoFrame(
-                        index=frame.index,
-                        frame_type=frame.frame_type,
-                        frame_size=frame.frame_size,
-                        video_size=pos,
-                        split_size=pos,
-                        timestamp=frame.timestamp,
-                        complete=frame.complete,
-                        )
-                    if pos - frame.frame_size >= 0:
-                        yield frame
-                pos -= len(item)
-
-
-class PiCameraCircularIO(CircularIO):
+            index = self.stream._index
+            offset = index.written - self.stream._length
+            for n in reversed(index.frame_numbers()):
+                if index.start(n) >= offset:
+                    yield index.frame(n, offset)
+
+    def __len__(self):
+        with self.stream.lock:
+            return len(self.stream._index)
+
+
+class PiCameraCircularMixin(object):
+    """
+    Frame lookup and copying for :class:`PiCameraCircularIO` and
+    :class:`PiCameraMappedCircularIO`.
+
+    Classes using this must keep a :class:`PiCameraFrameIndex` in ``_index``,
+    and implement ``_snapshot(pos)``, which is called with the stream locked
+    and returns whatever is needed to copy the stream from *pos* to its
+    current end, and ``_copy_snapshot(snapshot, output)``, which copies it
+    to *output* without the lock.
+    """
+    def clear(self):
+        """
+        Resets the stream to empty safely.
+
+        This method truncates the stream to empty, and clears the associated
+        frame meta-data too, ensuring that subsequent writes operate correctly
+        (see the warning in the :class:`PiCameraCircularIO` class
+        documentation).
+        """
+        with self.lock:
+            self.seek(0)
+            self.truncate()
+            self._index.clear()
+
+    def truncate(self, size=None):
+        """
+        Resize the stream to the given *size* in bytes (or the current position
+        if *size* is not specified), as for :meth:`CircularIO.truncate`. The
+        meta-data of frames which end beyond the new size is discarded.
+        """
+        with self.lock:
+            if size is None:
+                size = self._pos
+            removed = self._length - size
+            result = super(PiCameraCircularMixin, self).truncate(size)
+            if removed > 0:
+                self._index.truncate(self._index.written - removed)
+            return result
+
+    def _position(self, n):
+        # Convert a frame number from the index to a stream position
+        if n is not None:
+            return self._index.start(n) - (self._index.written - self._length)
+
+    def _find_size(self, size, first_frame):
+        return self._position(self._index.find_size(size, first_frame))
+
+    def _find_seconds(self, seconds, first_frame):
+        return self._position(self._index.find_seconds(seconds, first_frame))
+
+    def _find_all(self, first_frame):
+        return self._position(self._index.find_all(first_frame))
+
+    def copy_to(
+            self, output, size=None, seconds=None,
+            first_frame=PiVideoFrameType.sps_header):
+        """
+        copy_to(output, size=None, seconds=None, first_frame=PiVideoFrameType.sps_header)
+
+        Copies content from the stream to *output*.
+
+        By default, this method copies all complete frames from the circular
+        stream to the filename or file-like object given by *output*.
+
+        If *size* is specified then the copy will be limited to the whole
+        number of frames that fit within the specified number of bytes. If
+        *seconds* if specified, then the copy will be limited to that number of
+        seconds worth of frames. Only one of *size* or *seconds* can be
+        specified.  If neither is specified, all frames are copied.
+
+        If *first_frame* is specified, it defines the frame type of the first
+        frame to be copied. By default this is
+        :attr:`~PiVideoFrameType.sps_header` as this must usually be the first
+        frame in an H264 stream. If *first_frame* is ``None``, not such limit
+        will be applied.
+
+        .. warning::
+
+            Note that if a frame of the specified type (e.g. SPS header) cannot
+            be found within the specified number of seconds or bytes then this
+            method will simply copy nothing (but no error will be raised).
+
+        The stream's position is not affected by this method. The stream is
+        only locked while the frames to copy are found, so recording continues
+        while they are written to *output*; frames recorded meanwhile aren't
+        copied.
+        """
+        if size is not None and seconds is not None:
+            raise PiCameraValueError('You cannot specify both size and seconds')
+        if isinstance(output, bytes):
+            output = output.decode('utf-8')
+        opened = isinstance(output, str)
+        if opened:
+            output = io.open(output, 'wb')
+        try:
+            # Only hold the lock while finding the start, and taking a snapshot
+            # of the chunks to copy, so the encoder isn't blocked while they're
+            # written to the output
+            with self.lock:
+                if size is not None:
+                    pos = self._find_size(size, first_frame)
+                elif seconds is not None:
+                    pos = self._find_seconds(seconds, first_frame)
+                else:
+                    pos = self._find_all(first_frame)
+                snapshot = self._snapshot(pos) if pos is not None else None
+            if snapshot is not None:
+                self._copy_snapshot(snapshot, output)
+        finally:
+            if opened:
+                output.close()
+
+
+class PiCameraCircularIO(PiCameraCircularMixin, CircularIO):
     """
     A derivative of :class:`CircularIO` which tracks camera frames.
 
@@ -618,15 +1113,11 @@ class PiCameraCircularIO(CircularIO):
 
     .. warning::
 
-        The class makes a couple of assumptions which will cause the frame
-        meta-data tracking to break if they are not adhered to:
-
-        * the stream is only ever appended to - no writes ever start from
-          the middle of the stream
-
-        * the stream is never truncated (from the right; being ring buffer
-          based, left truncation will occur automatically); the exception
-          to this is the :meth:`clear` method.
+        The class assumes that the stream is only ever appended to - no
+        writes ever start from the middle of the stream. The frame meta-data
+        tracking will break if this is not adhered to. The stream may be
+        truncated (e.g. by :meth:`clear`), which discards the meta-data of
+        the frames beyond the new end of the stream.
 
     The *camera* parameter specifies the :class:`PiCamera` instance that will
     be recording video to the stream. If specified, the *size* parameter
@@ -674,8 +1165,141 @@ class PiCameraCircularIO(CircularIO):
             size = bitrate * seconds // 8
         super(PiCameraCircularIO, self).__init__(size)
         self._data = PiCameraDequeHack(camera, splitter_port)
+        self._index = self._data.index
         self.frames = PiCameraDequeFrames(self)
 
+    def write(self, b):
+        with self.lock:
+            result = super(PiCameraCircularIO, self).write(b)
+            # Forget the frames which no longer start within the stream
+            self._index.discard_before(self._index.written - self._length)
+            return result
+
+    def _snapshot(self, pos):
+        # Return a list of the chunks from pos to the end of the stream. The
+        # chunks are immutable, so this copies only references (and the part
+        # of the first chunk from pos), and the list stays valid after the
+        # lock is released
+        chunks = []
+        remaining = self._length - pos
+        for chunk in reversed(self._data):
+            if remaining <= 0:
+                break
+            if len(chunk) > remaining:
+                chunk = chunk[-remaining:]
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        chunks.reverse()
+        return chunks
+
+
+    def _copy_snapshot(self, chunks, output):
+        for chunk in chunks:
+            output.write(chunk)
+
+
+def _copy_fd_range(fd, offset, count, output):
+    # Copy count bytes, from offset in the file descriptor fd, to output
+    # within the kernel (with copy_file_range or sendfile) if output is a real
+    # file. Returns the number of bytes that could not be copied this way,
+    # which the caller must write itself
+    try:
+        out_fd = output.fileno()
+    except (AttributeError, IOError, OSError, ValueError):
+        return count
+    output.flush()
+    for method in ('copy_file_range', 'sendfile'):
+        copy = getattr(os, method, None)
+        if copy is None:
+            continue
+        try:
+            while count:
+                if method == 'copy_file_range':
+                    n = copy(fd, out_fd, count, offset)
+                else:
+                    n = copy(out_fd, fd, offset, count)
+                if not n:
+                    break
+                offset += n
+                count -= n
+        except OSError:
+            # e.g. copy_file_range across file-systems on older kernels
+            continue
+        if not count:
+            break
+    if output.seekable():
+        # Make sure output's idea of its position matches its descriptor's
+        output.seek(os.lseek(out_fd, 0, os.SEEK_CUR))
+    return count
+
+
+class PiCameraMappedCircularIO(PiCameraCircularMixin, PreallocatedCircularIO):
+    """
+    A :class:`PiCameraCircularIO` which stores the stream in a memory-mapped
+    file instead of in memory.
+
+    PiCameraMappedCircularIO behaves like :class:`PiCameraCircularIO`, with
+    the same :attr:`frames` tracking, :meth:`copy_to` and warnings, but the
+    ring buffer is a file of *size* bytes mapped into memory. The operating
+    system writes modified pages back to the file and drops them from memory
+    as it needs to, so the stream can be far larger than the free memory:
+    several minutes of full bitrate video rather than a few seconds.
+
+    If *filename* is given, the ring buffer is stored in that file (which is
+    overwritten, and left in place afterwards); otherwise a temporary file is
+    used, and deleted when the stream is closed. The file should be on local
+    storage; temporary files are created in :func:`tempfile.gettempdir`,
+    which may be in memory (tmpfs) on some systems.
+
+    When *output* is a real file (or a socket or pipe), :meth:`copy_to`
+    copies the data within the kernel, using :func:`os.copy_file_range` or
+    :func:`os.sendfile`. As the copy takes place without the lock, recording
+    continues meanwhile; if it overwrites the start of the region being
+    copied before it has been copied (i.e. the region was almost the whole
+    ring), :exc:`PiCameraRuntimeError` is raised.
+
+    This class requires Python 3, and the size of the stream is limited by
+    the address space (around 2GB on a 32-bit Raspberry Pi OS).
+    """
+    # copy_to copies this many bytes at a time, checking after each piece
+    # that recording hasn't overwritten it
+    copy_chunk_size = 16 * 1048576
+
+    def __init__(
+            self, camera, size=None, seconds=None, bitrate=17000000,
+            splitter_port=1, filename=None):
+        if size is None and seconds is None:
+            raise PiCameraValueError('You must specify either size, or seconds')
+        if size is not None and seconds is not None:
+            raise PiCameraValueError('You cannot specify both size and seconds')
+        if seconds is not None:
+            size = bitrate * seconds // 8
+        try:
+            camera._encoders
+        except AttributeError:
+            raise PiCameraValueError('camera must be a valid PiCamera object')
+        self.camera = camera
+        self.splitter_port = splitter_port
+        self._filename = filename
+        self._file = None
+        super(PiCameraMappedCircularIO, self).__init__(int(size))
+        self._index = PiCameraFrameIndex()
+        self.frames = PiCameraDequeFrames(self)
+
+    def _allocate(self, size):
+        if self._filename is None:
+            self._file = tempfile.TemporaryFile()
+        else:
+            self._file = io.open(self._filename, 'w+b')
+        self._file.truncate(size)
+        return mmap.mmap(self._file.fileno(), size)
+
+    def close(self):
+        super(PiCameraMappedCircularIO, self).close()
+        if self._file is not None:
+            self._data.close()
+            self._file.close()
+
     def clear(self):
         """
         Resets the stream to empty safely.
@@ -686,97 +1310,40 @@ class PiCameraCircularIO(CircularIO):
         documentation).
         """
         with self.lock:
-            self.seek(0)
-            self.truncate()
-
-    def _find_size(self, size, first_frame):
-        pos = None
-        for frame in reversed(self.frames):
-            if first_frame in (None, frame.frame_type):
-                pos = frame.position
-            if size < frame.frame_size:
-                break
-            size -= frame.frame_size
-        return pos
-
-    def _find_seconds(self, seconds, first_frame):
-        pos = None
-        last = None
-        seconds = int(seconds * 1000000)
-        for frame in reversed(self.frames):
-            if first_frame in (None, frame.frame_type):
-                pos = frame.position
-            if frame.timestamp is not None:
-                if last is None:
-                    last = frame.timestamp
-                elif last - frame.timestamp >= seconds:
-                    break
-        return pos
-
-    def _find_all(self, first_frame):
-        for frame in self.frames:
-            if first_frame in (None, frame.frame_type):
-                return frame.position
-
-    def copy_to(
-            self, output, size=None, seconds=None,
-            first_frame=PiVideoFrameType.sps_header):
-        """
-        copy_to(output, size=None, seconds=None, first_frame=PiVideoFrameType.sps_header)
-
-        Copies content from the stream to *output*.
-
-        By default, this method copies all complete frames from the circular
-        stream to the filename or file-like object given by *output*.
-
-        If *size* is specified then the copy will be limited to the whole
-        number of frames that fit within the specified number of bytes. If
-        *seconds* if specified, then the copy will be limited to that number of
-        seconds worth of frames. Only one of *size* or *seconds* can be
-        specified.  If neither is specified, all frames are copied.
+            super(PiCameraMappedCircularIO, self).clear()
+            self._discarded = 0
 
-        If *first_frame* is specified, it defines the frame type of the first
-        frame to be copied. By default this is
-        :attr:`~PiVideoFrameType.sps_header` as this must usually be the first
-        frame in an H264 stream. If *first_frame* is ``None``, not such limit
-        will be applied.
-
-        .. warning::
-
-            Note that if a frame of the specified type (e.g. SPS header) cannot
-            be found within the specified number of seconds or bytes then this
-            method will simply copy nothing (but no error will be raised).
+    def write(self, b):
+        with self.lock:
+            result = super(PiCameraMappedCircularIO, self).write(b)
+            # If the write completes a new frame, record the frame's metadata
+            # from the camera
+            self._index.add_chunk(
+                self._discarded + self._length - self._index.written,
+                _completed_frame(self.camera._encoders[self.splitter_port]))
+            self._index.discard_before(self._discarded)
+            return result
 
-        The stream's position is not affected by this method.
-        """
-        if size is not None and seconds is not None:
-            raise PiCameraValueError('You cannot specify both size and seconds')
-        if isinstance(output, bytes):
-            output = output.decode('utf-8')
-        opened = isinstance(output, str)
-        if opened:
-            output = io.open(output, 'wb')
-        try:
+    def _snapshot(self, pos):
+        # The region to copy, measured from the start of the recording, and
+        # the offset which converts those positions to offsets in the file
+        return (
+            self._discarded + pos,
+            self._discarded + self._length,
+            (self._start - self._discarded) % self._size,
+            )
+
+    def _copy_snapshot(self, snapshot, output):
+        start, end, origin = snapshot
+        while start < end:
+            offset = (start + origin) % self._size
+            n = min(end - start, self._size - offset, self.copy_chunk_size)
+            remaining = _copy_fd_range(self._file.fileno(), offset, n, output)
+            if remaining:
+                output.write(self._view[offset + n - remaining:offset + n])
             with self.lock:
-                save_pos = self.tell()
-                try:
-                    if size is not None:
-                        pos = self._find_size(size, first_frame)
-                    elif seconds is not None:
-                        pos = self._find_seconds(seconds, first_frame)
-                    else:
-                        pos = self._find_all(first_frame)
-                    # Copy chunks efficiently from the position found
-                    if pos is not None:
-                        self.seek(pos)
-                        while True:
-                            buf = self.read1()
-                            if not buf:
-                                break
-                            output.write(buf)
-                finally:
-                    self.seek(save_pos)
-        finally:
-            if opened:
-                output.close()
-
+                if self._discarded > start:
+                    raise PiCameraRuntimeError(
+                        'recording overwrote the stream while it was being '
+                        'copied; copy less of it, or use a larger stream')
+            start += n
@@ -0,0 +1,310 @@
+import io
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from picamera.exc import PiCameraValueError, PiCameraDeprecated
+from picamera.array import (
+    raw_resolution,
+    bytes_to_yuv,
+    yuv420_planes,
+    yuv420_to_yuv444,
+    yuv420_to_rgb,
+    yuv444_to_rgb,
+    PiRGBArray,
+    PiYUVArray,
+    PiPreallocatedRGBArray,
+    PiPreallocatedYUVArray,
+    PiThreadedRGBAnalysis,
+    PiThreadedYUVAnalysis,
+    PiThreadedMotionAnalysis,
+    )
+
+
+class FakeCamera(object):
+    resolution = (64, 48)
+
+
+def reference_yuv444(data, resolution):
+    # The conversion bytes_to_yuv used before it was vectorized
+    width, height = resolution
+    fwidth, fheight = raw_resolution(resolution)
+    y_len = fwidth * fheight
+    uv_len = (fwidth // 2) * (fheight // 2)
+    a = np.frombuffer(data, dtype=np.uint8)
+    Y = a[:y_len].reshape((fheight, fwidth))
+    Uq = a[y_len:-uv_len].reshape((fheight // 2, fwidth // 2))
+    Vq = a[-uv_len:].reshape((fheight // 2, fwidth // 2))
+    U = np.empty_like(Y)
+    V = np.empty_like(Y)
+    for rows in (slice(0, None, 2), slice(1, None, 2)):
+        for cols in (slice(0, None, 2), slice(1, None, 2)):
+            U[rows, cols] = Uq
+            V[rows, cols] = Vq
+    return np.dstack((Y, U, V))[:height, :width]
+
+
+def reference_rgb(yuv):
+    yuv = yuv.astype(float) - [16, 128, 128]
+    m = np.array([
+        [1.164,  0.000,  1.596],
+        [1.164, -0.392, -0.813],
+        [1.164,  2.017,  0.000]])
+    return np.clip(yuv.dot(m.T), 0, 255)
+
+
+def random_yuv420(resolution, seed=1):
+    fwidth, fheight = raw_resolution(resolution)
+    rng = np.random.RandomState(seed)
+    return rng.randint(0, 256, fwidth * fheight * 3 // 2).astype(np.uint8).tobytes()
+
+
+@pytest.mark.parametrize('resolution', [
+    (32, 16), (33, 17), (31, 15), (100, 75), (64, 49), (1, 1), (3, 2), (2, 3)])
+def test_yuv420_conversions(resolution):
+    data = random_yuv420(resolution)
+    expected = reference_yuv444(data, resolution)
+    yuv = yuv420_to_yuv444(data, resolution)
+    assert yuv.shape == expected.shape
+    assert (yuv == expected).all()
+    assert (bytes_to_yuv(data, resolution) == expected).all()
+    out = np.zeros_like(expected)
+    yuv420_to_yuv444(data, resolution, out=out)
+    assert (out == expected).all()
+    rgb = yuv420_to_rgb(data, resolution)
+    assert np.abs(rgb - reference_rgb(expected)).max() <= 1
+    assert (yuv444_to_rgb(expected) == rgb).all()
+
+
+@pytest.mark.parametrize('resolution', [(32, 16), (33, 17), (100, 75)])
+def test_yuv420_bilinear(resolution):
+    data = random_yuv420(resolution)
+    yuv = yuv420_to_yuv444(data, resolution, interpolation='bilinear')
+    Y, U, V = yuv420_planes(data, resolution)
+    height, width = yuv.shape[:2]
+    assert (yuv[..., 0] == Y[:height, :width]).all()
+    for k, plane in ((1, U), (2, V)):
+        # Chroma samples sit between each 2x2 block of pixels
+        ys = np.clip((np.arange(height) + 0.5) / 2 - 0.5, 0, plane.shape[0] - 1)
+        xs = np.clip((np.arange(width) + 0.5) / 2 - 0.5, 0, plane.shape[1] - 1)
+        y0 = np.floor(ys).astype(int)
+        x0 = np.floor(xs).astype(int)
+        y1 = np.minimum(y0 + 1, plane.shape[0] - 1)
+        x1 = np.minimum(x0 + 1, plane.shape[1] - 1)
+        fy = (ys - y0)[:, np.newaxis]
+        fx = (xs - x0)[np.newaxis, :]
+        p = plane.astype(float)
+        expected = (
+            (1 - fy) * (1 - fx) * p[y0][:, x0] + (1 - fy) * fx * p[y0][:, x1] +
+            fy * (1 - fx) * p[y1][:, x0] + fy * fx * p[y1][:, x1])
+        assert np.abs(yuv[..., k] - expected).max() <= 0.5 + 1e-9
+
+
+def test_yuv420_wrong_size():
+    with pytest.raises(PiCameraValueError):
+        yuv420_planes(b'123', (32, 16))
+
+
+class SlowAnalysis(PiThreadedRGBAnalysis):
+    def __init__(self, *args, **kwargs):
+        super(SlowAnalysis, self).__init__(*args, **kwargs)
+        self.delay = 0.01
+        self.seen = []
+
+    def analyze(self, array):
+        time.sleep(self.delay)
+        self.seen.append(int(array[0, 0, 0]))
+
+
+def rgb_frames(count):
+    width, height = raw_resolution(FakeCamera.resolution)
+    return [bytes(bytearray([i % 256]) * (width * height * 3)) for i in range(count)]
+
+
+@pytest.mark.parametrize('drop', ['oldest', 'newest'])
+def test_threaded_analysis_drops(drop):
+    with SlowAnalysis(FakeCamera(), workers=1, queue_size=2, drop=drop) as output:
+        for frame in rgb_frames(50):
+            output.write(frame)
+            time.sleep(0.001)
+        output.flush()
+        assert output.frames_received == 50
+        assert output.frames_analyzed + output.frames_dropped == 50
+        assert output.frames_dropped > 0
+        assert output.seen == sorted(output.seen)
+        if drop == 'oldest':
+            assert output.seen[-1] == 49
+        else:
+            assert output.seen[:3] == [0, 1, 2]
+        assert 0 < output.mean_latency <= output.max_latency
+    assert output.closed
+
+
+def test_threaded_analysis_workers():
+    output = SlowAnalysis(FakeCamera(), workers=4, queue_size=100)
+    output.delay = 0.005
+    for frame in rgb_frames(50):
+        output.write(frame)
+    output.close()
+    assert sorted(output.seen) == list(range(50))
+    assert output.frames_dropped == 0
+
+
+def test_threaded_analysis_errors():
+    class BadAnalysis(PiThreadedYUVAnalysis):
+        def analyze(self, array):
+            raise ValueError('bad frame')
+
+    width, height = raw_resolution(FakeCamera.resolution)
+    output = BadAnalysis(FakeCamera())
+    output.write(bytes(bytearray(width * height * 3 // 2)))
+    with pytest.raises(ValueError):
+        output.flush()
+    output.close()
+    with pytest.raises(PiCameraValueError):
+        PiThreadedRGBAnalysis(FakeCamera(), drop='random')
+    with pytest.raises(PiCameraValueError):
+        PiThreadedRGBAnalysis(FakeCamera(), workers=0)
+
+
+def test_threaded_motion_analysis():
+    class ShapeAnalysis(PiThreadedMotionAnalysis):
+        def analyze(self, array):
+            self.shape = array.shape
+
+    with ShapeAnalysis(FakeCamera()) as output:
+        # 64x48 gives 5 columns (including the extra one) and 3 rows
+        output.write(bytes(bytearray(5 * 3 * 4)))
+        output.flush()
+        assert output.shape == (3, 5)
+
+
+def random_rgb(resolution, seed=1):
+    fwidth, fheight = raw_resolution(resolution)
+    rng = np.random.RandomState(seed)
+    return rng.randint(0, 256, fwidth * fheight * 3).astype(np.uint8).tobytes()
+
+
+def capture(output, data):
+    output.seek(0)
+    output.truncate()
+    output.write(data)
+    output.flush()
+
+
+@pytest.mark.parametrize('cls,frame', [
+    (PiPreallocatedRGBArray, random_rgb),
+    (PiPreallocatedYUVArray, random_yuv420)])
+def test_preallocated_array_reuse(cls, frame):
+    with cls(FakeCamera()) as output:
+        buf = output._buffer
+        capture(output, frame(FakeCamera.resolution, seed=1))
+        array = output.array
+        first = array.copy()
+        capture(output, frame(FakeCamera.resolution, seed=2))
+        assert output._buffer is buf
+        assert output.array is array
+        assert not (output.array == first).all()
+        # Emptying the output with truncate(0) also keeps the buffer
+        with pytest.warns(PiCameraDeprecated):
+            output.truncate(0)
+        output.write(frame(FakeCamera.resolution, seed=1))
+        output.flush()
+        assert output._buffer is buf
+        assert output.array is array
+        assert (output.array == first).all()
+
+
+def test_preallocated_yuv_rgb_reuse():
+    with PiPreallocatedYUVArray(FakeCamera()) as output:
+        capture(output, random_yuv420(FakeCamera.resolution, seed=1))
+        rgb = output.rgb_array
+        assert output.rgb_array is rgb
+        first = rgb.copy()
+        capture(output, random_yuv420(FakeCamera.resolution, seed=2))
+        assert output.rgb_array is rgb
+        assert not (rgb == first).all()
+
+
+@pytest.mark.parametrize('cls,frame', [
+    (PiPreallocatedRGBArray, random_rgb),
+    (PiPreallocatedYUVArray, random_yuv420)])
+def test_preallocated_array_reallocates(cls, frame):
+    camera = FakeCamera()
+    with cls(camera) as output:
+        buf = output._buffer
+        capture(output, frame(camera.resolution))
+        small = output.array
+        expected = small.copy()
+        camera.resolution = (128, 96)
+        capture(output, frame(camera.resolution, seed=2))
+        assert output._buffer is not buf
+        assert len(output._buffer) >= len(frame(camera.resolution))
+        assert output.array.shape == (96, 128, 3)
+        # The earlier array still refers to the old buffer, which is unchanged
+        assert (small == expected).all()
+        buf = output._buffer
+        camera.resolution = (64, 48)
+        capture(output, frame(camera.resolution))
+        assert output._buffer is buf
+        assert (output.array == expected).all()
+
+
+def test_preallocated_array_truncate_deprecated():
+    with PiPreallocatedRGBArray(FakeCamera()) as output, io.BytesIO() as expected:
+        for stream in (output, expected):
+            stream.write(b'abcdefgh')
+        with pytest.warns(PiCameraDeprecated):
+            assert output.truncate(4) == 4
+        expected.truncate(4)
+        expected.seek(4)
+        assert output.tell() == expected.tell() == 4
+        output.seek(0)
+        assert output.read() == b'abcd'
+        # Truncating can't extend the stream
+        with pytest.warns(PiCameraDeprecated):
+            assert output.truncate(6) == 4
+        assert output.tell() == 6
+
+
+def test_preallocated_array_read_past_end():
+    with PiPreallocatedRGBArray(FakeCamera()) as output, io.BytesIO() as expected:
+        for stream in (output, expected):
+            stream.write(b'abcdefgh')
+            stream.seek(12)
+        assert output.read() == expected.read() == b''
+        b = bytearray(4)
+        assert output.readinto(b) == expected.readinto(b) == 0
+        assert b == bytearray(4)
+        assert output.tell() == expected.tell() == 12
+        # Writing there fills the gap with NULs, as BytesIO does
+        for stream in (output, expected):
+            stream.write(b'ij')
+            stream.seek(6)
+        assert output.read(3) == expected.read(3) == b'gh\x00'
+        assert output.readinto(b) == expected.readinto(b) == 4
+        assert b == bytearray(b'\x00\x00\x00i')
+        assert output.getvalue() == expected.getvalue()
+
+
+@pytest.mark.parametrize('resolution', [(64, 48), (33, 17), (100, 75)])
+def test_preallocated_arrays_match(resolution):
+    camera = FakeCamera()
+    camera.resolution = resolution
+    data = random_yuv420(resolution)
+    with PiYUVArray(camera) as expected, PiPreallocatedYUVArray(camera) as output:
+        for stream in (expected, output):
+            stream.write(data)
+            stream.flush()
+        assert output.array.shape == expected.array.shape
+        assert (output.array == expected.array).all()
+        assert (output.rgb_array == expected.rgb_array).all()
+    data = random_rgb(resolution)
+    with PiRGBArray(camera) as expected, PiPreallocatedRGBArray(camera) as output:
+        for stream in (expected, output):
+            stream.write(data)
+            stream.flush()
+        assert output.array.shape == expected.array.shape
+        assert (output.array == expected.array).all()
@@ -0,0 +1,54 @@
+import warnings
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from picamera import PiCamera
+from picamera.exc import PiCameraValueError, PiCameraFallback
+
+
+def make_camera(revision='imx219'):
+    # The lens shading helpers only need the camera's revision
+    camera = PiCamera.__new__(PiCamera)
+    camera._revision = revision
+    return camera
+
+
+@pytest.mark.parametrize('sensor_mode, shape', [
+    (1, (4, 17, 31)),
+    (2, (4, 39, 52)),
+    (4, (4, 20, 26)),
+    (5, (4, 15, 26)),
+    (6, (4, 12, 21)),
+    (7, (4, 8, 11)),
+    ])
+def test_lens_shading_table_shape(sensor_mode, shape):
+    assert make_camera()._lens_shading_table_shape(sensor_mode) == shape
+
+
+def test_select_lens_shading_table():
+    camera = make_camera()
+    tables = {
+        mode: np.full(camera._lens_shading_table_shape(mode), mode, np.uint8)
+        for mode in (1, 4, 7)}
+    for mode in (1, 4, 7):
+        assert camera._select_lens_shading_table(tables, mode) is tables[mode]
+        camera._validate_lens_shading_table(tables[mode], mode)
+    # A single table is used whatever the mode
+    assert camera._select_lens_shading_table(tables[4], 1) is tables[4]
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        assert camera._select_lens_shading_table(tables, 5) is None
+    assert len(w) == 1
+    assert issubclass(w[0].category, PiCameraFallback)
+
+
+def test_validate_lens_shading_table():
+    camera = make_camera()
+    with pytest.raises(PiCameraValueError):
+        camera._validate_lens_shading_table(
+            np.zeros(camera._lens_shading_table_shape(2), np.uint8), 4)
+    with pytest.raises(PiCameraValueError):
+        camera._validate_lens_shading_table(
+            np.zeros(camera._lens_shading_table_shape(4), np.float32), 4)
@@ -0,0 +1,124 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from picamera.color import Color, ColorArray
+
+
+def assert_close(values, expected, tol=1e-9):
+    # NaNs (where Color raises an error) must match too
+    values = np.asarray(values, dtype=float)
+    expected = np.asarray(expected, dtype=float)
+    assert values.shape == expected.shape
+    assert (
+        np.isclose(values, expected, rtol=tol, atol=tol) |
+        (np.isnan(values) & np.isnan(expected))
+        ).all()
+
+
+def or_nan(f, nan=(np.nan, np.nan, np.nan)):
+    try:
+        return f()
+    except (ZeroDivisionError, ValueError):
+        return nan
+
+
+@pytest.fixture(scope='module')
+def rgb():
+    rng = np.random.RandomState(0)
+    rgb = rng.rand(300, 3)
+    # Include primaries, black and white, and colors where the components tie
+    rgb[:20] = np.round(rgb[:20])
+    rgb[20:30, 1] = rgb[20:30, 0]
+    rgb[30:40] = rgb[30:40, :1]
+    return rgb
+
+
+@pytest.mark.parametrize('prop', [
+    'rgb', 'rgb_bytes', 'rgb_565', 'yuv', 'yuv_bytes', 'yiq', 'cie_xyz',
+    'cie_lab', 'hls', 'hsv', 'hue', 'lightness', 'saturation', 'red'])
+def test_properties(rgb, prop):
+    expected = [
+        or_nan(lambda: getattr(Color.from_rgb(*c), prop)) for c in rgb]
+    assert_close(getattr(ColorArray(rgb), prop), expected)
+
+
+def test_cie_luv(rgb):
+    expected = [
+        or_nan(lambda: Color.from_rgb(*c).cie_luv, (0.0, np.nan, np.nan))
+        for c in rgb]
+    assert_close(ColorArray(rgb).cie_luv, expected)
+
+
+@pytest.mark.parametrize('prop', [
+    'yuv', 'yiq', 'hls', 'hsv', 'cie_xyz', 'cie_lab'])
+def test_constructors(rgb, prop):
+    values = np.array([getattr(Color.from_rgb(*c), prop) for c in rgb])
+    constructor = 'from_' + prop
+    expected = [getattr(Color, constructor)(*v) for v in values]
+    assert_close(getattr(ColorArray, constructor)(values).rgb, expected)
+
+
+def test_byte_constructors():
+    rng = np.random.RandomState(1)
+    values = rng.randint(0, 256, (200, 3))
+    assert_close(
+        ColorArray.from_yuv_bytes(values).rgb,
+        [Color.from_yuv_bytes(*map(int, v)) for v in values])
+    assert_close(
+        ColorArray.from_rgb_bytes(values).rgb,
+        [Color.from_rgb_bytes(*map(int, v)) for v in values])
+    n = rng.randint(0, 65536, 200)
+    assert_close(
+        ColorArray.from_rgb_565(n).rgb,
+        [Color.from_rgb_565(int(v)) for v in n])
+
+
+@pytest.mark.parametrize('method', [
+    'euclid', 'cie1976', 'cie1994g', 'cie1994t', 'ciede2000'])
+def test_difference(rgb, method):
+    other = Color('wheat')
+    assert_close(
+        ColorArray(rgb).difference(other, method),
+        [or_nan(lambda: Color.from_rgb(*c).difference(other, method), np.nan)
+         for c in rgb], 1e-7)
+    others = np.random.RandomState(2).rand(*rgb.shape)
+    assert_close(
+        ColorArray(rgb).difference(ColorArray(others), method),
+        [or_nan(
+            lambda: Color.from_rgb(*c).difference(Color.from_rgb(*o), method),
+            np.nan)
+         for c, o in zip(rgb, others)], 1e-7)
+
+
+def test_shape():
+    colors = ColorArray(np.zeros((48, 64, 3)))
+    assert colors.shape == (48, 64)
+    assert len(colors) == 48
+    assert np.asarray(colors).shape == (48, 64, 3)
+    with pytest.raises(ValueError):
+        ColorArray(np.zeros((4, 2)))
+
+
+def test_import_without_numpy():
+    # Color must still work without numpy; only ColorArray needs it
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = '\n'.join((
+        'import sys',
+        'sys.path.insert(0, %r)' % root,
+        "sys.modules['numpy'] = None",
+        'import picamera',
+        'from picamera.color import Color, ColorArray',
+        "assert Color('red').rgb_bytes == (255, 0, 0)",
+        'try:',
+        '    ColorArray([[1, 0, 0]])',
+        'except ImportError:',
+        '    pass',
+        'else:',
+        "    raise AssertionError('ColorArray worked without numpy')",
+        ))
+    subprocess.check_call([sys.executable, '-c', script])
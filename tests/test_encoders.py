@@ -0,0 +1,127 @@
+import io
+import random
+import threading
+
+import pytest
+
+from picamera import mmal
+from picamera.mmalobj import MMALLocalBuffer
+from picamera.encoders import PiEncoder, PiVideoEncoder
+from picamera.frames import PiVideoFrame, PiVideoFrameType, PiVideoFrameRecord
+from picamera.streams import PreallocatedCircularIO
+
+
+def make_encoder(cls, zero_copy=False, intra_period=30):
+    # Just enough of an encoder to call _callback_write, without MMAL
+    encoder = cls.__new__(cls)
+    encoder.outputs_lock = threading.Lock()
+    encoder.outputs = {}
+    encoder.zero_copy = zero_copy
+    encoder.event = threading.Event()
+    encoder._next_output = []
+    encoder._intra_period = intra_period
+    encoder._frame = PiVideoFrameRecord()
+    encoder._frame_copy = (None, None)
+    encoder._open_output = lambda output, key=PiVideoFrameType.frame: (
+        encoder.outputs.__setitem__(key, (output, False)))
+    encoder._close_output = lambda key=PiVideoFrameType.frame: (
+        encoder.outputs.pop(key, None))
+    return encoder
+
+
+def next_frame(frame, buf, split):
+    # The frame meta-data as PiVideoEncoder calculated it before it was kept
+    # in a PiVideoFrameRecord
+    frame = PiVideoFrame(
+        index=frame.index + 1 if frame.complete else frame.index,
+        frame_type=
+            PiVideoFrameType.key_frame
+            if buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_KEYFRAME else
+            PiVideoFrameType.sps_header
+            if buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_CONFIG else
+            PiVideoFrameType.motion_data
+            if buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_CODECSIDEINFO else
+            PiVideoFrameType.frame,
+        frame_size=
+            buf.length if frame.complete else frame.frame_size + buf.length,
+        video_size=
+            frame.video_size
+            if buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_CODECSIDEINFO else
+            frame.video_size + buf.length,
+        split_size=
+            frame.split_size
+            if buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_CODECSIDEINFO else
+            frame.split_size + buf.length,
+        timestamp=
+            None if buf.pts in (0, mmal.MMAL_TIME_UNKNOWN) else buf.pts,
+        complete=bool(buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_FRAME_END),
+        )
+    if split and buf.flags & mmal.MMAL_BUFFER_HEADER_FLAG_CONFIG:
+        frame = frame._replace(split_size=0)
+    return frame
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_frame_meta_data(seed):
+    rnd = random.Random(seed)
+    encoder = make_encoder(PiVideoEncoder)
+    encoder.outputs[PiVideoFrameType.frame] = (io.BytesIO(), False)
+    expected = PiVideoFrame(0, None, 0, 0, 0, 0, False)
+    buf = MMALLocalBuffer(100)
+    for i in range(2000):
+        buf.data = b'x' * rnd.randint(1, 100)
+        buf.flags = rnd.choice([
+            0,
+            mmal.MMAL_BUFFER_HEADER_FLAG_FRAME_END,
+            mmal.MMAL_BUFFER_HEADER_FLAG_FRAME_END |
+            mmal.MMAL_BUFFER_HEADER_FLAG_KEYFRAME,
+            mmal.MMAL_BUFFER_HEADER_FLAG_FRAME_END |
+            mmal.MMAL_BUFFER_HEADER_FLAG_CONFIG,
+            mmal.MMAL_BUFFER_HEADER_FLAG_FRAME_END |
+            mmal.MMAL_BUFFER_HEADER_FLAG_CODECSIDEINFO,
+            ])
+        buf.pts = rnd.choice([0, mmal.MMAL_TIME_UNKNOWN, i * 1000])
+        if rnd.random() < 0.01:
+            encoder._next_output.append({PiVideoFrameType.frame: io.BytesIO()})
+        split = bool(encoder._next_output)
+        encoder._callback_write(buf)
+        expected = next_frame(expected, buf, split)
+        if rnd.random() < 0.5:
+            assert encoder.frame == expected
+            # The frame is only constructed again when it changes
+            assert encoder.frame is encoder.frame
+    assert encoder.frame == expected
+
+
+@pytest.mark.parametrize('zero_copy', [False, True])
+def test_zero_copy(zero_copy):
+    written = []
+
+    class Keeper(object):
+        def write(self, b):
+            written.append(b)
+            return len(b)
+
+    encoder = make_encoder(PiEncoder, zero_copy=zero_copy)
+    ring = PreallocatedCircularIO(10)
+    stream = io.BytesIO()
+    keeper = Keeper()
+    encoder.outputs = {0: (ring, False), 1: (stream, False), 2: (keeper, False)}
+    buf = MMALLocalBuffer(64)
+    for data in (b'abcdefgh', b'ijklmnop'):
+        buf.data = data
+        buf.flags = 0
+        for key in (0, 1, 2):
+            assert not encoder._callback_write(buf, key=key)
+    buf.flags = mmal.MMAL_BUFFER_HEADER_FLAG_EOS
+    assert encoder._callback_write(buf, key=3)
+    assert ring.getvalue() == b'ghijklmnop'
+    assert stream.getvalue() == b'abcdefghijklmnop'
+    if zero_copy:
+        # Outputs are passed a view of the buffer, which is released when the
+        # write returns
+        assert all(isinstance(b, memoryview) for b in written)
+        with pytest.raises(ValueError):
+            written[0].tobytes()
+    else:
+        assert written == [b'abcdefgh', b'ijklmnop']
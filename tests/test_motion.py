@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from picamera.array import motion_dtype, PiThreadedAnalysisMixin
+from picamera.motion import (
+    motion_mask,
+    motion_blobs,
+    blob_properties,
+    motion_statistics,
+    PiMotionStatisticsAnalysis,
+    )
+
+
+class FakeCamera(object):
+    resolution = (640, 480)
+
+
+def random_motion(frames=20, rows=30, cols=41, seed=0):
+    rng = np.random.RandomState(seed)
+    a = np.zeros((frames, rows, cols), motion_dtype)
+    a['x'] = rng.randint(-128, 128, a.shape)
+    a['y'] = rng.randint(-128, 128, a.shape)
+    a['sad'] = rng.randint(0, 2000, a.shape)
+    return a
+
+
+@pytest.mark.parametrize('connectivity', [4, 8])
+@pytest.mark.parametrize('threshold', [100, 150, 170])
+def test_blobs_match_ndimage_label(connectivity, threshold):
+    ndimage = pytest.importorskip('scipy.ndimage')
+    a = random_motion()
+    mask = motion_mask(a, threshold)
+    labels, counts = motion_blobs(mask, connectivity)
+    structure = ndimage.generate_binary_structure(2, 1 if connectivity == 4 else 2)
+    for f in range(len(a)):
+        expected, n = ndimage.label(mask[f], structure)
+        assert counts[f] == n
+        assert labels[f].max() == n
+        assert (labels[f][~mask[f]] == 0).all()
+        # The labels may be numbered differently, but must describe the same
+        # blobs
+        pairs = set(zip(expected[mask[f]], labels[f][mask[f]]))
+        assert len(pairs) == n
+        assert len(set(label for e, label in pairs)) == n
+    props = blob_properties(a, labels, counts)
+    assert len(props) == counts.sum()
+    for p in props:
+        blob = labels[p['frame']] == p['label']
+        rows, cols = np.nonzero(blob)
+        assert p['size'] == blob.sum()
+        assert p['row'] == pytest.approx(rows.mean())
+        assert p['col'] == pytest.approx(cols.mean())
+        assert p['x'] == pytest.approx(a['x'][p['frame']][blob].mean())
+
+
+def test_winding_blob():
+    mask = np.zeros((9, 9), bool)
+    mask[::2, :] = True
+    mask[1::4, -1] = True
+    mask[3::4, 0] = True
+    labels, count = motion_blobs(mask)
+    assert count == 1
+    assert (labels[mask] == 1).all()
+
+
+def test_threaded_statistics_analysis():
+    class Threaded(PiThreadedAnalysisMixin, PiMotionStatisticsAnalysis):
+        def analyze_statistics(self, stats):
+            self.stats = stats
+
+    a = random_motion(frames=1, cols=41)[0]
+    regions = np.zeros(a.shape, int)
+    regions[:10, :10] = 1
+    with Threaded(
+            FakeCamera(), threshold=3, max_sad=800, regions=regions,
+            connectivity=8, workers=2) as output:
+        assert (output.threshold, output.max_sad) == (3, 800)
+        assert output.connectivity == 8
+        output.write(a.tobytes())
+        output.flush()
+        expected = motion_statistics(a, 3, 800, 8, regions, 8)
+        assert (output.stats.labels == expected.labels).all()
+        assert (output.stats.histogram == expected.histogram).all()
+        assert output.frames_analyzed == 1
@@ -0,0 +1,280 @@
+import io
+import random
+from collections import deque
+
+import pytest
+
+from picamera.streams import (
+    CircularIO,
+    PreallocatedCircularIO,
+    PiCameraCircularIO,
+    PiCameraMappedCircularIO,
+    )
+from picamera.frames import PiVideoFrame, PiVideoFrameType
+
+
+class FakeEncoder(object):
+    frame = PiVideoFrame(0, PiVideoFrameType.frame, 0, 0, 0, None, False)
+
+
+class FakeCamera(object):
+    def __init__(self):
+        self._encoders = {1: FakeEncoder()}
+
+
+class ReferenceDeque(deque):
+    # The frame tracking of PiCameraCircularIO before it was indexed: each
+    # chunk is stored with the meta-data of the frame it completes
+    def __init__(self, camera):
+        super(ReferenceDeque, self).__init__()
+        self.camera = camera
+
+    def append(self, item):
+        frame = self.camera._encoders[1].frame
+        super(ReferenceDeque, self).append(
+            (item, frame if frame.complete else None))
+
+    def pop(self):
+        return super(ReferenceDeque, self).pop()[0]
+
+    def popleft(self):
+        return super(ReferenceDeque, self).popleft()[0]
+
+    def __getitem__(self, index):
+        return super(ReferenceDeque, self).__getitem__(index)[0]
+
+    def __setitem__(self, index, value):
+        frame = super(ReferenceDeque, self).__getitem__(index)[1]
+        super(ReferenceDeque, self).__setitem__(index, (value, frame))
+
+    def __iter__(self):
+        for item, frame in super(ReferenceDeque, self).__iter__():
+            yield item
+
+    def frames(self):
+        pos = 0
+        for item, frame in super(ReferenceDeque, self).__iter__():
+            pos += len(item)
+            if frame and pos - frame.frame_size >= 0:
+                yield PiVideoFrame(
+                    frame.index, frame.frame_type, frame.frame_size,
+                    pos, pos, frame.timestamp, frame.complete)
+
+
+class ReferenceCircularIO(CircularIO):
+    def __init__(self, camera, size):
+        super(ReferenceCircularIO, self).__init__(size)
+        self._data = ReferenceDeque(camera)
+
+    def clear(self):
+        with self.lock:
+            self.seek(0)
+            self.truncate()
+
+    def frames(self):
+        return list(self._data.frames())
+
+    def _find_size(self, size, first_frame):
+        pos = None
+        for frame in reversed(self.frames()):
+            if first_frame in (None, frame.frame_type):
+                pos = frame.position
+            if size < frame.frame_size:
+                break
+            size -= frame.frame_size
+        return pos
+
+    def _find_seconds(self, seconds, first_frame):
+        pos = None
+        last = None
+        seconds = int(seconds * 1000000)
+        for frame in reversed(self.frames()):
+            if first_frame in (None, frame.frame_type):
+                pos = frame.position
+            if frame.timestamp is not None:
+                if last is None:
+                    last = frame.timestamp
+                elif last - frame.timestamp >= seconds:
+                    break
+        return pos
+
+    def _find_all(self, first_frame):
+        for frame in self.frames():
+            if first_frame in (None, frame.frame_type):
+                return frame.position
+
+    def copy_to(self, output, size=None, seconds=None,
+                first_frame=PiVideoFrameType.sps_header):
+        if size is not None:
+            pos = self._find_size(size, first_frame)
+        elif seconds is not None:
+            pos = self._find_seconds(seconds, first_frame)
+        else:
+            pos = self._find_all(first_frame)
+        if pos is not None:
+            save_pos = self.tell()
+            self.seek(pos)
+            output.write(self.read())
+            self.seek(save_pos)
+
+
+def record(camera, streams, rnd, count, first=0, timestamp=0):
+    # Write count random frames, each split into random chunks, to all of
+    # the streams; returns the number and timestamp of the next frame
+    for index in range(first, first + count):
+        if index % 10 == 0:
+            frame_type, stamp = PiVideoFrameType.sps_header, None
+        else:
+            frame_type = (
+                PiVideoFrameType.key_frame if index % 10 == 1 else
+                PiVideoFrameType.frame)
+            stamp = timestamp
+        timestamp += rnd.randint(20000, 40000)
+        left = rnd.randint(1, 300)
+        done = 0
+        while left:
+            n = rnd.randint(1, left)
+            left -= n
+            done += n
+            camera._encoders[1].frame = PiVideoFrame(
+                index, frame_type, done, 0, 0, stamp, not left)
+            data = bytes(bytearray(rnd.randrange(256) for i in range(n)))
+            for stream in streams:
+                stream.write(data)
+    return first + count, timestamp
+
+
+def assert_same_frames(reference, stream, rnd):
+    assert list(stream.frames) == reference.frames()
+    assert list(reversed(stream.frames)) == list(reversed(reference.frames()))
+    for kwargs in (
+            {}, {'size': rnd.randint(0, 3000)}, {'size': 0},
+            {'seconds': rnd.random() * 2}, {'seconds': 0}):
+        for first_frame in (
+                None, PiVideoFrameType.sps_header, PiVideoFrameType.key_frame):
+            expected = io.BytesIO()
+            reference.copy_to(expected, first_frame=first_frame, **kwargs)
+            output = io.BytesIO()
+            stream.copy_to(output, first_frame=first_frame, **kwargs)
+            assert output.getvalue() == expected.getvalue()
+
+
+@pytest.fixture(params=[PiCameraCircularIO, PiCameraMappedCircularIO])
+def stream_class(request):
+    return request.param
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_frame_index(stream_class, seed):
+    rnd = random.Random(seed)
+    camera = FakeCamera()
+    size = rnd.randint(200, 5000)
+    reference = ReferenceCircularIO(camera, size)
+    with stream_class(camera, size=size) as stream:
+        stream._index.compact_threshold = rnd.choice([1, 4, 1024])
+        n, timestamp = record(camera, (reference, stream), rnd, rnd.randint(0, 300))
+        assert_same_frames(reference, stream, rnd)
+        reference.clear()
+        stream.clear()
+        assert list(stream.frames) == []
+        record(camera, (reference, stream), rnd, 50, n, timestamp)
+        assert_same_frames(reference, stream, rnd)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_frame_index_truncate(stream_class, seed):
+    rnd = random.Random(seed)
+    camera = FakeCamera()
+    size = rnd.randint(2000, 5000)
+    reference = ReferenceCircularIO(camera, size)
+    with stream_class(camera, size=size) as stream:
+        stream._index.compact_threshold = rnd.choice([1, 4, 1024])
+        n, timestamp = record(camera, (reference, stream), rnd, rnd.randint(10, 100))
+        # Truncate at a chunk boundary, as the reference can't truncate a
+        # chunk which completes a frame without keeping the frame
+        boundaries = [0]
+        for chunk in reference._data:
+            boundaries.append(boundaries[-1] + len(chunk))
+        pos = rnd.choice(boundaries[:-1])
+        for s in (reference, stream):
+            s.seek(pos)
+            s.truncate()
+        assert stream.tell() == len(stream.getvalue()) == pos
+        assert_same_frames(reference, stream, rnd)
+        record(camera, (reference, stream), rnd, 100, n, timestamp)
+        assert_same_frames(reference, stream, rnd)
+
+
+def test_truncate_mid_frame(stream_class):
+    camera = FakeCamera()
+    with stream_class(camera, size=1000) as stream:
+        for index in range(10):
+            camera._encoders[1].frame = PiVideoFrame(
+                index, PiVideoFrameType.frame, 50, 0, 0, index * 1000, True)
+            stream.write(bytes(bytearray([index]) * 50))
+        stream.seek(275)
+        stream.truncate()
+        assert [f.index for f in stream.frames] == [0, 1, 2, 3, 4]
+        assert [f.video_size for f in stream.frames] == [50, 100, 150, 200, 250]
+        output = io.BytesIO()
+        stream.copy_to(output, first_frame=None)
+        assert output.getvalue() == stream.getvalue()
+        # Recording continues from the new end of the stream
+        camera._encoders[1].frame = PiVideoFrame(
+            10, PiVideoFrameType.frame, 50, 0, 0, 10000, True)
+        stream.write(b'\x0a' * 50)
+        assert [f.video_size for f in stream.frames][-2:] == [250, 325]
+
+@pytest.mark.parametrize('seed', range(200))
+def test_preallocated_circular_io(seed):
+    # PreallocatedCircularIO should behave exactly as CircularIO
+    rnd = random.Random(seed)
+    size = rnd.randint(1, 50)
+    expected = CircularIO(size)
+    stream = PreallocatedCircularIO(size)
+    for op in range(30):
+        choice = rnd.random()
+        if choice < 0.5:
+            data = bytes(bytearray(
+                rnd.randrange(256) for i in range(rnd.randint(0, 70))))
+            if len(data) > size and expected.tell() < expected.size:
+                # CircularIO can't handle a write which overwrites the whole
+                # ring from part-way through it
+                break
+            assert stream.write(data) == expected.write(data)
+        elif choice < 0.65:
+            whence = rnd.choice([io.SEEK_SET, io.SEEK_CUR, io.SEEK_END])
+            offset = rnd.randint(0, 60) - (30 if whence else 0)
+            try:
+                result = expected.seek(offset, whence)
+            except ValueError:
+                with pytest.raises(ValueError):
+                    stream.seek(offset, whence)
+            else:
+                assert stream.seek(offset, whence) == result
+        elif choice < 0.75:
+            n = rnd.randint(-1, 40)
+            assert stream.read(n) == expected.read(n)
+            # CircularIO.read can leave the position past the end
+            expected.seek(stream.tell())
+        elif choice < 0.8:
+            size_arg = rnd.choice([None, rnd.randint(0, 70)])
+            expected.truncate(size_arg)
+            stream.truncate(size_arg)
+        elif choice < 0.9:
+            b = bytearray(rnd.randint(0, 40))
+            n = stream.readinto(b)
+            assert bytes(b[:n]) == expected.read(len(b))
+            expected.seek(stream.tell())
+        else:
+            pos = stream.tell()
+            data = b''
+            while True:
+                chunk = stream.read1()
+                if not chunk:
+                    break
+                data += chunk
+            expected.seek(pos)
+            assert data == expected.read()
+        assert stream.getvalue() == expected.getvalue()
+        assert stream.tell() == expected.tell()